@@ -0,0 +1,161 @@
+"""
+The pymysql connection of pyanalysis.mysql, imported on the first connection so that importing
+pyanalysis.mysql does not import pymysql.
+"""
+import datetime
+import warnings
+
+import pymysql
+
+from pymysql.cursors import SSCursor
+from pymysql.cursors import SSDictCursor
+from pymysql.cursors import DictCursor
+from pymysql.constants import SERVER_STATUS
+
+from pyanalysis.mysql import CircuitBreakerOpenError, logger, _connect, _COM_RESET_CONNECTION
+
+__all__ = ["pymysql", "SSCursor", "SSDictCursor", "DictCursor", "SERVER_STATUS", "_Connection"]
+
+# the warnings of pymysql are raised as errors, set once pymysql is imported
+warnings.filterwarnings("error", category=pymysql.err.Warning)
+
+
+class _Connection(pymysql.connections.Connection):
+    """
+    Return a connection object with or without connection_pool feature.
+    This is all the same with pymysql.connections.Connection instance except that with connection_pool feature:
+        the __exit__() method additionally put the connection back to it's pool
+    """
+    _pool = None
+    _dirty = False  # an error happened, the server status may be out of date
+    _reusable_exception = (
+        pymysql.err.ProgrammingError,
+        pymysql.err.IntegrityError,
+        pymysql.err.NotSupportedError,
+    )
+
+    def __init__(self, *args, **kwargs):
+        pymysql.connections.Connection.__init__(self, *args, **kwargs)
+        self.args = args
+        self.kwargs = kwargs
+        self._last_use_datetime = datetime.datetime.now()
+
+    def __exit__(self, exc, value, traceback):
+        """
+        Overwrite the __exit__() method of pymysql.connections.Connection
+        Base action: on successful exit, commit. On exception, rollback
+        With pool additional action: put connection back to pool
+        """
+        pymysql.connections.Connection.__exit__(self, exc, value, traceback)
+        if self._pool:
+            if not exc or exc in self._reusable_exception:
+                """reusable connection. """
+                self._pool.put_connection(self)
+            else:
+                """no reusable connection, close it and create a new one then put it to the pool. """
+                try:
+                    self._pool.put_connection(self._recreate(*self.args, **self.kwargs))
+                except CircuitBreakerOpenError:
+                    # the probe of the pool will create it when the db server recovers.
+                    self._pool._lose_connection()
+                self._pool = None
+                try:
+                    self.close()
+                    logger.warning("close not reusable connection from pool(%s) caused by %s", self._pool.name, value)
+                except Exception:
+                    pass
+
+    def _recreate(self, *args, **kwargs):
+        pool = self._pool
+        if pool.breaker is not None and not pool.breaker.allow_request():
+            raise CircuitBreakerOpenError("circuit breaker of pool({}) is open".format(pool.name))
+        try:
+            conn = _connect(*args, **kwargs)
+        except Exception as e:
+            pool._on_failure(e)
+            raise
+        pool._on_success()
+        logger.debug("create new connection due to pool(%s) lacking", pool.name)
+        return conn
+
+    def query(self, sql, unbuffered=False):
+        # pymysql reads the server status from OK packets only, a result set may open a transaction unnoticed.
+        if not self.get_autocommit():
+            self._dirty = True
+        try:
+            return pymysql.connections.Connection.query(self, sql, unbuffered)
+        except Exception:
+            self._dirty = True
+            raise
+
+    def commit(self):
+        pymysql.connections.Connection.commit(self)
+        self._dirty = False
+
+    def rollback(self):
+        pymysql.connections.Connection.rollback(self)
+        self._dirty = False
+
+    def in_transaction(self):
+        """
+        Whether the connection may hold an open transaction, judged by the server status of the last
+        OK/EOF packet, so it costs no round trip
+        """
+        if self._dirty:
+            return True
+        if self._result is not None and self._result.unbuffered_active:
+            return True
+        return bool(self.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS)
+
+    def reset_session(self):
+        """
+        Send COM_RESET_CONNECTION to clear the whole session state(transaction, session variables, temporary
+        tables, locks, etc.), then restore the settings of the connection like connect() does.
+        The connection is closed when the settings can not be restored, it reconnects when taken from the pool
+        """
+        self._execute_command(_COM_RESET_CONNECTION, b"")
+        self._read_ok_packet()
+        self._dirty = False
+        try:
+            set_character_set = getattr(self, "set_character_set", None)
+            if set_character_set is not None:
+                set_character_set(self.charset, self.collation)
+            else:
+                # PyMySQL 1.0 has neither set_character_set() nor the collation.
+                self.set_charset(self.charset)
+            with self.cursor() as cursor:
+                if self.sql_mode is not None:
+                    cursor.execute("SET sql_mode=%s", (self.sql_mode,))
+                if self.init_command is not None:
+                    cursor.execute(self.init_command)
+            if self.autocommit_mode is not None:
+                self.autocommit(self.autocommit_mode)
+        except BaseException:
+            self._force_close()
+            raise
+
+    # if the connection idle too long, ping with reconnect the connection
+    def ping(self, reconnect=True):
+        if not self.open:
+            # closed by an outage error, see Pool._close_idle().
+            self.connect()
+            self._dirty = False
+            self._result = None
+            self._last_use_datetime = datetime.datetime.now()
+            return
+        expire_datetime = self._last_use_datetime + datetime.timedelta(days=1)
+        now = datetime.datetime.now()
+        if now > expire_datetime:
+            self._last_use_datetime = now
+            super().ping(reconnect=True)
+
+    def close(self):
+        """
+        Overwrite the close() method of pymysql.connections.Connection
+        With pool, put connection back to pool;
+        Without pool, send the quit message and close the socket
+        """
+        if self._pool:
+            self._pool.put_connection(self)
+        else:
+            pymysql.connections.Connection.close(self)
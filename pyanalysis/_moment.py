@@ -0,0 +1,196 @@
+"""
+The arrow based Moment and MomentFactory of pyanalysis.moment, imported on first use so that importing
+pyanalysis.moment does not import arrow.
+"""
+import re
+import arrow
+import datetime
+import functools
+
+from pyanalysis.moment import _EPOCH_UTC, _get_tz, _parse_tz
+
+__all__ = ["Moment", "MomentFactory", "moment"]
+
+
+class Moment(arrow.Arrow):
+    # pickled and shown as pyanalysis.moment.Moment, the public name
+    __module__ = "pyanalysis.moment"
+
+    # 整数的 epoch 微秒，第一次使用时计算，Moment 不可变所以可以一直缓存
+    _epoch_micros = None
+
+    @classmethod
+    def _from_datetime(cls, dt, micros=None):
+        """wrap an aware datetime, the same state Arrow.__init__ leaves without splitting and rebuilding it. """
+        m = cls.__new__(cls)
+        m._datetime = dt
+        if micros is not None:
+            m._epoch_micros = micros
+        return m
+
+    @classmethod
+    def from_micros(cls, micros, tzinfo=None):
+        """create from int epoch microseconds, tzinfo defaults to UTC. """
+        tz = _get_tz(tzinfo)
+        dt = _EPOCH_UTC + datetime.timedelta(microseconds=micros)
+        return cls._from_datetime(dt if tz is datetime.timezone.utc else dt.astimezone(tz), micros)
+
+    @classmethod
+    def from_millis(cls, millis, tzinfo=None):
+        """create from int epoch milliseconds, tzinfo defaults to UTC. """
+        return cls.from_micros(millis * 1000, tzinfo)
+
+    def to(self, tz):
+        # 时区名字的解析有缓存；同一个瞬间，整数 epoch 沿用
+        if tz is None or hasattr(tz, "localize"):
+            return super().to(tz)
+        return self._from_datetime(self._datetime.astimezone(_get_tz(tz)), self._epoch_micros)
+
+    @property
+    def second_timestamp(self):
+        return self.microsecond_timestamp // 1000000
+
+    # 毫秒
+    @property
+    def millisecond_timestamp(self):
+        return self.microsecond_timestamp // 1000
+
+    # 微妙
+    @property
+    def microsecond_timestamp(self):
+        micros = self._epoch_micros
+        if micros is None:
+            delta = self._datetime - _EPOCH_UTC
+            micros = self._epoch_micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+        return micros
+
+
+class MomentFactory(arrow.ArrowFactory):
+    __module__ = "pyanalysis.moment"
+
+    def get(self, *args, **kwargs):
+        # 常见输入（时间戳、ISO 字符串、数字格式）直接构造 datetime，其余交给 arrow
+        tzinfo = kwargs.get("tzinfo")
+        if (len(args) in (1, 2) and (not kwargs or len(kwargs) == 1 and tzinfo is not None)
+                and not hasattr(tzinfo, "localize")):
+            dt = _fast_datetime(args, tzinfo)
+            if dt is not None:
+                return self.type._from_datetime(dt)
+        return super().get(*args, **kwargs)
+
+    def from_micros(self, micros, tzinfo=None):
+        return self.type.from_micros(micros, tzinfo)
+
+    def from_millis(self, millis, tzinfo=None):
+        return self.type.from_millis(millis, tzinfo)
+
+
+moment = MomentFactory(Moment)
+
+_ISO_PATTERN = re.compile(
+    r"(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})"
+    r"(?:[T ](?P<hour>\d{2}):(?P<minute>\d{2})(?::(?P<second>\d{2})(?:[.,](?P<fraction>\d{1,6}))?)?"
+    r"(?P<tz>Z|[+-]\d{2}(?::?\d{2})?)?)?"
+)
+
+# the tokens of arrow formats, only the numeric ones are compiled, the others are parsed by arrow.
+_FORMAT_TOKEN = re.compile(
+    r"(\[(?:(?!\]).)*\]|YYY?Y?|MM?M?M?|Do|DD?D?D?|d?dd?d?|HH?|hh?|mm?|ss?|SS?S?S?S?S?|ZZ?Z?|a|A|x|X|W)"
+)
+_TOKEN_PATTERNS = {
+    "YYYY": r"(?P<year>\d{4})",
+    "MM": r"(?P<month>\d{2})",
+    "M": r"(?P<month>\d{1,2})",
+    "DD": r"(?P<day>\d{2})",
+    "D": r"(?P<day>\d{1,2})",
+    "HH": r"(?P<hour>\d{2})",
+    "H": r"(?P<hour>\d{1,2})",
+    "mm": r"(?P<minute>\d{2})",
+    "m": r"(?P<minute>\d{1,2})",
+    "ss": r"(?P<second>\d{2})",
+    "s": r"(?P<second>\d{1,2})",
+    "ZZ": r"(?P<tz>Z|[+-]\d{2}(?::\d{2})?)",
+    "Z": r"(?P<tz>Z|[+-]\d{2}(?:\d{2})?)",
+}
+
+
+@functools.lru_cache(256)
+def _compile_format(fmt):
+    """compile an arrow format of numeric tokens to a regex, None if it has other tokens. """
+    parts = []
+    for i, part in enumerate(_FORMAT_TOKEN.split(fmt)):
+        if i % 2 == 0:
+            if re.search(r"[A-Za-z]", part):
+                return None
+            parts.append(re.escape(part))
+        elif part in _TOKEN_PATTERNS:
+            parts.append(_TOKEN_PATTERNS[part])
+        elif set(part) == {"S"}:
+            # more than 6 digits are rounded by arrow.
+            parts.append(r"(?P<fraction>\d{1,6})")
+        else:
+            return None
+    try:
+        return re.compile("".join(parts))
+    except re.error:
+        # the same token twice.
+        return None
+
+
+def _match_datetime(match, tzinfo):
+    parts = match.groupdict()
+    if tzinfo is None:
+        tzinfo = _parse_tz(parts["tz"]) if parts.get("tz") else datetime.timezone.utc
+    fraction = parts.get("fraction")
+    return datetime.datetime(
+        int(parts.get("year") or 1),
+        int(parts.get("month") or 1),
+        int(parts.get("day") or 1),
+        int(parts.get("hour") or 0),
+        int(parts.get("minute") or 0),
+        int(parts.get("second") or 0),
+        int(fraction.ljust(6, "0")) if fraction else 0,
+        _get_tz(tzinfo),
+    )
+
+
+def _epoch_datetime(value, tzinfo):
+    """the same as arrow for epoch seconds, milliseconds and microseconds, but exact for int. """
+    tz = _get_tz(tzinfo)
+    if type(value) is float:
+        return datetime.datetime.fromtimestamp(arrow.util.normalize_timestamp(value), tz)
+    micro = 0
+    if value > arrow.constants.MAX_TIMESTAMP:
+        if value < arrow.constants.MAX_TIMESTAMP_MS:
+            value, micro = divmod(value, 1000)
+            micro *= 1000
+        elif value < arrow.constants.MAX_TIMESTAMP_US:
+            value, micro = divmod(value, 1000000)
+        else:
+            return None
+    if not micro:
+        return datetime.datetime.fromtimestamp(value, tz)
+    dt = _EPOCH_UTC + datetime.timedelta(0, value, micro)
+    return dt if tz is datetime.timezone.utc else dt.astimezone(tz)
+
+
+def _fast_datetime(args, tzinfo):
+    """the aware datetime of the common inputs of MomentFactory.get, None for the other inputs. """
+    value = args[0]
+    kind = type(value)
+    try:
+        if len(args) == 1 and (kind is int or kind is float):
+            return _epoch_datetime(value, tzinfo)
+        if kind is not str:
+            return None
+        if len(args) == 1:
+            pattern = _ISO_PATTERN
+        elif type(args[1]) is str:
+            pattern = _compile_format(args[1])
+        else:
+            return None
+        match = pattern.fullmatch(value) if pattern is not None else None
+        return _match_datetime(match, tzinfo) if match is not None else None
+    except (ValueError, OverflowError, OSError):
+        # out of range values, let arrow raise its own errors.
+        return None
@@ -0,0 +1,317 @@
+import re
+import ssl
+import time
+import base64
+import asyncio
+import smtplib
+import collections
+
+from pyanalysis.mail import _build_message, _has_file_attach, _iter_message, _DotStuffer, _WRITE_SIZE
+
+__all__ = ["AsyncMail"]
+
+_CRLF = b"\r\n"
+_EOLS = re.compile(rb"\r\n|\n|\r")
+_LEADING_DOTS = re.compile(rb"^\.", re.MULTILINE)
+
+
+def _data_bytes(data):
+    """the message with CRLF line ends and the leading dots doubled, ending with the terminating dot line. """
+    data = _LEADING_DOTS.sub(b"..", _EOLS.sub(_CRLF, data))
+    if not data.endswith(_CRLF):
+        data += _CRLF
+    return data + b"." + _CRLF
+
+
+# asyncio 上的 SMTP 会话，只实现发信需要的命令，错误与 smtplib 抛出相同的异常
+class _AsyncSMTP(object):
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sent = 0
+        self.last_used = time.monotonic()
+        self._reader = None
+        self._writer = None
+
+    async def connect(self, ssl_context=None):
+        connecting = asyncio.open_connection(
+            self.host, self.port, ssl=ssl_context, server_hostname=self.host if ssl_context else None)
+        try:
+            self._reader, self._writer = await asyncio.wait_for(connecting, self.timeout)
+        except asyncio.TimeoutError:
+            raise smtplib.SMTPConnectError(-1, "connect to {}:{} timed out".format(self.host, self.port))
+        code, message = await self._reply()
+        if code != 220:
+            self.close()
+            raise smtplib.SMTPConnectError(code, message)
+
+    async def _reply(self):
+        lines = []
+        while True:
+            try:
+                line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+            except asyncio.TimeoutError:
+                self.close()
+                raise smtplib.SMTPServerDisconnected("the server did not reply in {}s".format(self.timeout))
+            if not line:
+                self.close()
+                raise smtplib.SMTPServerDisconnected("connection unexpectedly closed")
+            lines.append(line[4:].strip())
+            if line[3:4] != b"-":
+                break
+        try:
+            code = int(line[:3])
+        except ValueError:
+            code = -1
+        if code == 421:
+            self.close()
+        return code, b"\n".join(lines)
+
+    async def command(self, line):
+        if self._writer is None:
+            raise smtplib.SMTPServerDisconnected("please connect first")
+        self._writer.write(line.encode("utf-8") + _CRLF)
+        return await self._reply()
+
+    async def ehlo(self):
+        code, message = await self.command("EHLO localhost")
+        if code != 250:
+            code, message = await self.command("HELO localhost")
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, message)
+        return message
+
+    async def starttls(self, ssl_context):
+        code, message = await self.command("STARTTLS")
+        if code != 220:
+            raise smtplib.SMTPResponseException(code, message)
+        if hasattr(self._writer, "start_tls"):
+            await self._writer.start_tls(ssl_context, server_hostname=self.host)
+        else:
+            # no StreamWriter.start_tls before python 3.11, upgrade the transport under the streams.
+            loop = asyncio.get_event_loop()
+            transport = await loop.start_tls(
+                self._writer.transport, self._writer.transport.get_protocol(), ssl_context, server_hostname=self.host)
+            self._writer._transport = transport
+            self._reader._transport = transport
+
+    async def login(self, username, password):
+        credential = base64.b64encode("\0{}\0{}".format(username, password).encode("utf-8")).decode("ascii")
+        code, message = await self.command("AUTH PLAIN " + credential)
+        if code == 504:
+            code, message = await self.command("AUTH LOGIN")
+            if code == 334:
+                code, message = await self.command(base64.b64encode(username.encode("utf-8")).decode("ascii"))
+            if code == 334:
+                code, message = await self.command(base64.b64encode(password.encode("utf-8")).decode("ascii"))
+        if code not in (235, 503):
+            raise smtplib.SMTPAuthenticationError(code, message)
+
+    async def _write_stream(self, msg):
+        stuffer, buffered = _DotStuffer(), 0
+        for chunk in _iter_message(msg):
+            chunk = stuffer.stuff(chunk)
+            self._writer.write(chunk)
+            buffered += len(chunk)
+            if buffered >= _WRITE_SIZE:
+                await self._writer.drain()
+                buffered = 0
+        self._writer.write(stuffer.end())
+
+    async def sendmail(self, from_addr, to_addrs, data):
+        """
+        send the message bytes, or a message with FileAttach parts chunk by chunk, return the refused receivers
+        like smtplib.SMTP.sendmail.
+        """
+        code, message = await self.command("MAIL FROM:<{}>".format(from_addr))
+        if code != 250:
+            await self._reset(code)
+            raise smtplib.SMTPSenderRefused(code, message, from_addr)
+        refused = {}
+        for address in to_addrs:
+            code, message = await self.command("RCPT TO:<{}>".format(address))
+            if code not in (250, 251):
+                refused[address] = (code, message)
+        if len(refused) == len(to_addrs):
+            await self._reset(code)
+            raise smtplib.SMTPRecipientsRefused(refused)
+        code, message = await self.command("DATA")
+        if code != 354:
+            await self._reset(code)
+            raise smtplib.SMTPDataError(code, message)
+        if isinstance(data, bytes):
+            self._writer.write(_data_bytes(data))
+        else:
+            await self._write_stream(data)
+        code, message = await self._reply()
+        if code != 250:
+            await self._reset(code)
+            raise smtplib.SMTPDataError(code, message)
+        self.sent += 1
+        return refused
+
+    async def _reset(self, code):
+        if code != 421 and self._writer is not None:
+            try:
+                await self.command("RSET")
+            except smtplib.SMTPServerDisconnected:
+                pass
+
+    async def noop(self):
+        return (await self.command("NOOP"))[0]
+
+    async def quit(self):
+        try:
+            await self.command("QUIT")
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+# asyncio 版本的 Mail，构造参数与附件用法与 Mail 相同，会话在多次发送之间复用，同时发送的邮件数不超过 pool_size
+class AsyncMail(object):
+    def __init__(
+            self,
+            username,
+            password,
+            mail_port=465,
+            time_out=20.0,
+            host="smtp.qq.com",
+            protocol="SSL",
+            pool_size=4,
+            max_messages_per_session=100,
+            max_idle=60.0,
+            noop_after=5.0,
+            max_inline_rows=None,
+            max_inline_bytes=None,
+    ):
+        """
+        protocol: SSL, TLS(STARTTLS) or PLAIN(no encryption, only for a relay in a trusted network)
+        pool_size: the sessions kept and the messages sent at once, the other send() wait for a free session
+        max_messages_per_session: the messages a session sends before it is replaced
+        max_idle: the seconds a session may stay idle, the servers close the idle sessions themselves
+        noop_after: the seconds of idleness after which a session is checked by NOOP before it is used
+        max_inline_rows, max_inline_bytes: the default limits of the TableTemplate parts, like Mail
+        """
+        if protocol.upper() not in ("SSL", "TLS", "PLAIN"):
+            raise RuntimeError("Can not use the protocol {}. The protocol must in ssl, tls or plain".format(protocol))
+        if pool_size <= 0:
+            raise RuntimeError("the pool_size must be positive. ")
+        self._username = username
+        self._password = password
+        self._mail_port = mail_port
+        self._time_out = time_out
+        self._host = host
+        self._protocol = protocol.upper()
+        self._attachments = []
+        self.pool_size = pool_size
+        self.max_messages = max_messages_per_session
+        self.max_idle = max_idle
+        self.noop_after = noop_after
+        self._inline_policy = {"max_inline_rows": max_inline_rows, "max_inline_bytes": max_inline_bytes}
+        self._idle = collections.deque()
+        # created in the event loop of the first send()
+        self._slots = None
+
+    def attach(self, context):
+        self._attachments.append(context)
+
+    async def _connect(self):
+        smtp = _AsyncSMTP(self._host, self._mail_port, self._time_out)
+        context = ssl.create_default_context() if self._protocol != "PLAIN" else None
+        await smtp.connect(context if self._protocol == "SSL" else None)
+        try:
+            # the greeting and the encryption are needed with or without a login.
+            await smtp.ehlo()
+            if self._protocol == "TLS":
+                await smtp.starttls(context)
+                await smtp.ehlo()
+            if self._username:
+                await smtp.login(self._username, self._password)
+        except BaseException:
+            smtp.close()
+            raise
+        return smtp
+
+    async def _alive(self, smtp):
+        idle = time.monotonic() - smtp.last_used
+        if idle > self.max_idle:
+            return False
+        if idle <= self.noop_after:
+            return True
+        try:
+            return await smtp.noop() == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    async def _checkout(self):
+        while self._idle:
+            smtp = self._idle.pop()
+            if await self._alive(smtp):
+                return smtp
+            smtp.close()
+        return await self._connect()
+
+    async def _checkin(self, smtp, broken=False):
+        smtp.last_used = time.monotonic()
+        if broken:
+            smtp.close()
+        elif smtp.sent >= self.max_messages:
+            await smtp.quit()
+        else:
+            self._idle.append(smtp)
+
+    async def sendmail(self, from_addr, to_addrs, data):
+        """
+        send the message bytes by a pooled session, reconnect and retry once when the server closed the
+        session(421 or a disconnect), return the refused receivers like smtplib.SMTP.sendmail
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+        async with self._slots:
+            for retry in (False, True):
+                smtp = await self._checkout()
+                try:
+                    refused = await smtp.sendmail(from_addr, to_addrs, data)
+                except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException) as e:
+                    closed = getattr(e, "smtp_code", 421) == 421
+                    await self._checkin(smtp, broken=closed)
+                    if closed and not retry:
+                        continue
+                    raise
+                except smtplib.SMTPRecipientsRefused:
+                    await self._checkin(smtp)
+                    raise
+                except BaseException:
+                    await self._checkin(smtp, broken=True)
+                    raise
+                await self._checkin(smtp)
+                return refused
+
+    async def send(self, title, receivers, copiers=None, parts=()):
+        """
+        send the attachments of the mail and the parts(MIME objects or mail templates), return the refused
+        receivers
+        """
+        msg, all_receiver = _build_message(
+            self._username, self._attachments, title, receivers, copiers, parts, self._inline_policy)
+        data = msg if _has_file_attach(msg) else msg.as_bytes()
+        return await self.sendmail(self._username, all_receiver, data)
+
+    async def close(self):
+        """quit the idle sessions. """
+        sessions, self._idle = list(self._idle), collections.deque()
+        for smtp in sessions:
+            await smtp.quit()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc, value, traceback):
+        await self.close()
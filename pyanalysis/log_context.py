@@ -0,0 +1,46 @@
+import contextvars
+
+__all__ = ["log_context", "bind_log_context", "reset_log_context", "get_log_context"]
+
+# the fields of the current request, task or query, written into every record by JsonFormatter
+_fields = contextvars.ContextVar("pyanalysis_log_context", default=None)
+
+
+def get_log_context():
+    """the fields of the current context, never modify it. """
+    return _fields.get() or {}
+
+
+def bind_log_context(**fields):
+    """
+    add the fields to the current context until it ends, e.g. the request id at the start of a request.
+    return the token for reset_log_context()
+    """
+    current = _fields.get()
+    return _fields.set(dict(current, **fields) if current else fields)
+
+
+def reset_log_context(token):
+    """restore the fields before the bind_log_context() returning the token. """
+    _fields.reset(token)
+
+
+class log_context(object):
+    """
+    add the fields to the records logged in the block:
+        with log_context(request_id="abc"):
+            logger.warning("...")
+    """
+
+    __slots__ = ("_fields", "_token")
+
+    def __init__(self, **fields):
+        self._fields = fields
+        self._token = None
+
+    def __enter__(self):
+        self._token = bind_log_context(**self._fields)
+        return self
+
+    def __exit__(self, exc, value, traceback):
+        reset_log_context(self._token)
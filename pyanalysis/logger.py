@@ -1,28 +1,186 @@
-import ssl
+import os
+import copy
+import time
+import queue
+import random
+import sys
+import shutil
+import threading
+import collections
 
-from logging import StreamHandler, Formatter, DEBUG, WARNING, CRITICAL
-from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler, SMTPHandler
+from logging import StreamHandler, Formatter, Filter, getLogger, getLevelName, makeLogRecord
+from logging import DEBUG, WARNING, ERROR, CRITICAL
+from logging.handlers import (
+    BaseRotatingHandler, RotatingFileHandler, TimedRotatingFileHandler, SMTPHandler, QueueHandler, QueueListener,
+)
+
+try:
+    import fcntl
+except ImportError:
+    # no flock on windows, the rollover of several processes is not serialized there.
+    fcntl = None
+
+from pyanalysis.log_context import log_context, bind_log_context, reset_log_context, get_log_context
 
 __all__ = [
     "DebugHandler",
     "ReleaseRotatingFileHandler",
     "ReleaseTimedRotatingFileHandler",
+    "QueuedReleaseRotatingFileHandler",
+    "QueuedReleaseTimedRotatingFileHandler",
+    "CompressedRotatingFileHandler",
+    "LogListener",
+    "setup_worker_logging",
     "AlarmSMTPHandler",
+    "DigestAlarmSMTPHandler",
+    "SamplingFilter",
+    "CachedTimeFormatter",
+    "JsonFormatter",
+    "log_context",
+    "bind_log_context",
+    "reset_log_context",
 ]
 
 DEFAULT_LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
 DEFAULT_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
 
+# the attributes of every LogRecord, the others come from the extra argument
+_RECORD_ATTRS = frozenset(makeLogRecord({}).__dict__) | {"message", "asctime", "log_context"}
+_RECORD_SIZE = len(makeLogRecord({}).__dict__)
+_JSON_FIELDS = ("time", "level", "logger", "message", "exception", "stack")
+# formatting a float by %03d costs more than the rest of the time field.
+_MSECS = tuple("%03d" % i for i in range(1000))
+
+
+def _json_value_encoder(backend):
+    """the function serializing a value to json with the backend: auto(orjson if installed), orjson or json. """
+    if backend not in ("auto", "orjson", "json"):
+        raise RuntimeError("the backend must be one of auto, orjson and json. ")
+    if backend != "json":
+        try:
+            import orjson
+        except ImportError:
+            if backend == "orjson":
+                raise ImportError("the orjson backend needs orjson, please install it by: pip install orjson")
+        else:
+            # the datetimes are converted by str() like the json backend.
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+            def dumps(value):
+                return orjson.dumps(value, default=str, option=option).decode("utf-8")
+
+            return dumps
+
+    import json
+    return json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=str).encode
+
+
+# the same output as Formatter, but the time is formatted once per second, the records of the same second only
+# append the milliseconds(when the format has them).
+class CachedTimeFormatter(Formatter):
+    def __init__(self, fmt=DEFAULT_LOG_FORMAT, datefmt=DEFAULT_DATE_FORMAT, msec_format=None):
+        """
+        msec_format: how the milliseconds are appended to datefmt, e.g. "%s.%03d", None appends nothing like
+            Formatter. Without datefmt the time is formatted like Formatter, with the milliseconds.
+        """
+        super().__init__(fmt, datefmt)
+        self._time_format = datefmt or self.default_time_format
+        self._msec_format = msec_format if datefmt else self.default_msec_format
+        # (epoch second, formatted), replaced at once so the threads always see a consistent pair
+        self._time_cache = (None, "")
+
+    def formatTime(self, record, datefmt=None):
+        if datefmt is not None and datefmt != self.datefmt:
+            return super().formatTime(record, datefmt)
+        second = int(record.created)
+        cached = self._time_cache
+        if cached[0] != second:
+            cached = self._time_cache = (second, time.strftime(self._time_format, self.converter(second)))
+        if self._msec_format is None:
+            return cached[1]
+        return self._msec_format % (cached[1], record.msecs)
+
+
+# one json object per line, the fields are always in the order of time, level, logger, message, the context
+# fields(log_context and the extra argument) sorted by name, exception and stack.
+class JsonFormatter(CachedTimeFormatter):
+    def __init__(self, datefmt=DEFAULT_DATE_FORMAT, backend="auto"):
+        from json.encoder import encode_basestring
+
+        super().__init__(None, datefmt)
+        # the strings are quoted by the C function of json, the other values are serialized by the backend.
+        self._quote = encode_basestring
+        self._encode = _json_value_encoder(backend)
+        self._quoted_time_cache = (None, "")
+        # (levelname, logger name) -> the fields between the milliseconds and the message
+        self._names_cache = {}
+        # (context, serialized), the records of a request share the context dict
+        self._context_cache = (None, "")
+
+    def _quoted_time(self, record):
+        """the object start and the quoted time without the closing quote, the milliseconds follow. """
+        second = int(record.created)
+        cached = self._quoted_time_cache
+        if cached[0] != second:
+            formatted = time.strftime(self._time_format, self.converter(second))
+            cached = self._quoted_time_cache = (second, '{"time":' + self._quote(formatted)[:-1] + ".")
+        return cached[1]
+
+    def _quoted_names(self, record):
+        key = (record.levelname, record.name)
+        names = self._names_cache.get(key)
+        if names is None:
+            quote = self._quote
+            names = self._names_cache[key] = '","level":{},"logger":{},"message":'.format(
+                quote(record.levelname), quote(record.name))
+        return names
+
+    def _context(self, record):
+        """the context fields of the record, the queued handlers capture log_context when it is logged. """
+        attrs = record.__dict__
+        context = attrs.get("log_context")
+        if context is None:
+            context = get_log_context()
+        if len(attrs) > _RECORD_SIZE:
+            extra = [key for key in attrs if key not in _RECORD_ATTRS]
+            if extra:
+                context = dict(context, **{key: attrs[key] for key in extra})
+        return context
+
+    def _serialize_context(self, context):
+        cached = self._context_cache
+        if cached[0] is context:
+            return cached[1]
+        quote, encode = self._quote, self._encode
+        serialized = "".join(
+            ",{}:{}".format(quote(key), quote(value) if type(value) is str else encode(value))
+            for key, value in sorted(context.items()) if key not in _JSON_FIELDS
+        )
+        self._context_cache = (context, serialized)
+        return serialized
+
+    def format(self, record):
+        quote = self._quote
+        text = (self._quoted_time(record) + _MSECS[int(record.msecs)] + self._quoted_names(record)
+                + quote(record.getMessage()))
+        context = self._context(record)
+        if context:
+            text += self._serialize_context(context)
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            text += ',"exception":' + quote(record.exc_text)
+        if record.stack_info:
+            text += ',"stack":' + quote(self.formatStack(record.stack_info))
+        return text + "}"
+
 
 # use it when you dev or debug your program.
 class DebugHandler(StreamHandler):
     def __init__(self, stream=None):
         super().__init__(stream)
-        formatter = Formatter(
-            DEFAULT_LOG_FORMAT,
-            DEFAULT_DATE_FORMAT,
-        )
-        self.setFormatter(formatter)
+        self.setFormatter(CachedTimeFormatter())
         self.setLevel(DEBUG)
 
 
@@ -35,11 +193,7 @@ class ReleaseRotatingFileHandler(RotatingFileHandler):
             backupCount=10,
             encoding="UTF-8",
         )
-        formatter = Formatter(
-            DEFAULT_LOG_FORMAT,
-            DEFAULT_DATE_FORMAT,
-        )
-        self.setFormatter(formatter)
+        self.setFormatter(CachedTimeFormatter())
         self.setLevel(WARNING)
 
 
@@ -52,14 +206,433 @@ class ReleaseTimedRotatingFileHandler(TimedRotatingFileHandler):
             backupCount=10,
             encoding="UTF-8",
         )
-        formatter = Formatter(
-            DEFAULT_LOG_FORMAT,
-            DEFAULT_DATE_FORMAT,
-        )
-        self.setFormatter(formatter)
+        self.setFormatter(CachedTimeFormatter())
         self.setLevel(WARNING)
 
 
+_EXCEPTION_FORMATTER = Formatter()
+
+
+def _prepare_record(record):
+    """a copy of the record to write in another thread or process, render what may not outlive the call. """
+    record = copy.copy(record)
+    record.msg = record.getMessage()
+    record.args = None
+    if record.exc_info:
+        if not record.exc_text:
+            record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+        record.exc_info = None
+    record.log_context = get_log_context()
+    return record
+
+
+class _QueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # wait for room, the sentinel must not be lost on a full queue.
+        self.queue.put(self._sentinel)
+
+
+# the records are put into a bounded queue and written by a background thread, the calling thread never
+# waits for the file or the rollover.
+class _QueuedReleaseHandler(QueueHandler):
+    OVERFLOW_POLICIES = ("drop_oldest", "block", "sample")
+
+    def __init__(self, target, maxsize=10000, overflow="drop_oldest", sample_every=10):
+        """
+        target: the handler writing the records in the background thread
+        maxsize: the capacity of the queue
+        overflow: what to do when the queue is full
+            drop_oldest: drop the oldest queued record to make room for the new one
+            block: wait for room, the only policy adding latency to the caller
+            sample: once the queue is 3/4 full, keep only one of every sample_every records below ERROR,
+                drop the new record if the queue is full
+        """
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise RuntimeError("the overflow must be one of {}. ".format(", ".join(self.OVERFLOW_POLICIES)))
+        if maxsize <= 0:
+            raise RuntimeError("the maxsize of the queue must be positive. ")
+        super().__init__(queue.Queue(maxsize))
+        self.target = target
+        self.overflow = overflow
+        self.sample_every = max(1, sample_every)
+        self.setLevel(target.level)
+
+        self._high_water = maxsize * 3 // 4
+        self._closed = False
+        self._sampled = 0
+        self._dropped = 0
+        self._counter_lock = threading.Lock()
+        self._listener = _QueueListener(self.queue, target, respect_handler_level=True)
+        self._listener.start()
+
+    @property
+    def dropped(self):
+        """how many records are dropped by the overflow policy. """
+        return self._dropped
+
+    def _drop(self):
+        with self._counter_lock:
+            self._dropped += 1
+
+    def setFormatter(self, fmt):
+        """the records are formatted by the target in the background thread. """
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        return _prepare_record(record)
+
+    def enqueue(self, record):
+        if self._closed:
+            # nothing reads the queue any more.
+            self._drop()
+        elif self.overflow == "block":
+            self.queue.put(record)
+        elif self.overflow == "drop_oldest":
+            self._put_dropping_oldest(record)
+        else:
+            self._put_sampled(record)
+
+    def _put_dropping_oldest(self, record):
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                pass
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self._drop()
+            except queue.Empty:
+                pass
+
+    def _put_sampled(self, record):
+        if record.levelno < ERROR and self.queue.qsize() >= self._high_water:
+            with self._counter_lock:
+                self._sampled += 1
+                keep = self._sampled % self.sample_every == 0
+            if not keep:
+                self._drop()
+                return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._drop()
+
+    def flush(self):
+        """wait until the queued records are written. """
+        thread = self._listener._thread
+        if thread is not None and thread.is_alive():
+            self.queue.join()
+        self.target.flush()
+
+    def close(self):
+        """write the queued records, stop the background thread and close the file. """
+        self.acquire()
+        try:
+            self._closed = True
+            if self._listener._thread is not None:
+                self._listener.stop()
+            self.target.close()
+        finally:
+            self.release()
+        super().close()
+
+
+# the queue-backed ReleaseRotatingFileHandler, logging never waits for the disk.
+class QueuedReleaseRotatingFileHandler(_QueuedReleaseHandler):
+    def __init__(self, filename, maxsize=10000, overflow="drop_oldest", sample_every=10):
+        super().__init__(ReleaseRotatingFileHandler(filename), maxsize, overflow, sample_every)
+
+
+# the queue-backed ReleaseTimedRotatingFileHandler, logging never waits for the disk.
+class QueuedReleaseTimedRotatingFileHandler(_QueuedReleaseHandler):
+    def __init__(self, filename, maxsize=10000, overflow="drop_oldest", sample_every=10):
+        super().__init__(ReleaseTimedRotatingFileHandler(filename), maxsize, overflow, sample_every)
+
+
+# the worker processes send their records to the listener of the parent process through a multiprocessing.Queue,
+# only the listener writes the files, so the rollovers never race and the workers never wait for a file lock.
+class LogListener(object):
+    def __init__(self, *handlers, maxsize=0, context=None):
+        """
+        handlers: the handlers writing the records of all the workers, e.g. ReleaseRotatingFileHandler("app.log"),
+            they are closed by stop()
+        maxsize: the capacity of the queue, 0 is unbounded, the workers wait for room when it is full
+        context: the multiprocessing context starting the workers, e.g. multiprocessing.get_context("spawn")
+        """
+        if not handlers:
+            raise RuntimeError("the listener needs at least one handler. ")
+        if context is None:
+            import multiprocessing as context
+        self.queue = context.Queue(maxsize)
+        self.handlers = handlers
+        self._listener = _QueueListener(self.queue, *handlers, respect_handler_level=True)
+
+    def start(self):
+        """start the thread writing the records, before the workers start. """
+        self._listener.start()
+        return self
+
+    def stop(self):
+        """write the records already sent, stop the thread and close the handlers, after the workers exit. """
+        if self._listener._thread is not None:
+            self._listener.stop()
+        for handler in self.handlers:
+            handler.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc, value, traceback):
+        self.stop()
+
+
+class _WorkerQueueHandler(QueueHandler):
+    def prepare(self, record):
+        return _prepare_record(record)
+
+    def enqueue(self, record):
+        # wait for room when the queue of the listener is bounded, the records must not be lost.
+        self.queue.put(record)
+
+
+def setup_worker_logging(log_queue, level=WARNING):
+    """
+    send the records of the worker process to the LogListener owning log_queue, call it first in the worker:
+        multiprocessing.Pool(32, initializer=setup_worker_logging, initargs=(listener.queue,))
+    the handlers the root logger inherited from the parent are removed, the listener writes for them.
+    the extra fields of the records must be picklable.
+    """
+    root = getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = _WorkerQueueHandler(log_queue)
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
+
+
+def _open_compressor(compression, path):
+    """a binary file object writing the compressed path. """
+    if compression == "gzip":
+        import gzip
+        return gzip.open(path, "wb")
+    import zstandard
+    return zstandard.ZstdCompressor().stream_writer(open(path, "wb"), closefd=True)
+
+
+class _FileLock(object):
+    """an exclusive flock on a lock file, shared by the processes writing the same log. """
+
+    def __init__(self, path):
+        self._path = path
+        # the logging thread and the compressing thread of a process take turns too.
+        self._lock = threading.Lock()
+        self._fd = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if fcntl is not None:
+            self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc, value, traceback):
+        try:
+            if self._fd is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                os.close(self._fd)
+                self._fd = None
+        finally:
+            self._lock.release()
+
+
+# rotate on size and time, the rolled segments are compressed by a background thread and the oldest ones are
+# removed to keep the count and the disk budget. Several processes may write the same file: the rollover is
+# serialized by a flock and the other processes reopen the new file before their next record.
+class CompressedRotatingFileHandler(BaseRotatingHandler):
+    _WHEN = {"M": 60, "H": 3600, "D": 86400, "MIDNIGHT": 86400}
+    _SUFFIXES = {"gzip": ".gz", "zstd": ".zst", None: ""}
+
+    def __init__(
+            self,
+            filename,
+            max_bytes=10 * 1024 * 1024,
+            when="midnight",
+            backup_count=30,
+            disk_budget=None,
+            compression="gzip",
+            grace=1.0,
+    ):
+        """
+        max_bytes: roll over when the file reaches it, 0 never rolls over on size
+        when: also roll over at the start of every minute(M), hour(H) or day(D, midnight), None never rolls over
+            on time
+        backup_count: the rolled segments kept
+        disk_budget: the bytes of the file(counted as max_bytes at least) and the segments kept, None is no limit
+        compression: gzip, zstd(needs zstandard) or None
+        grace: the seconds a segment must stay unmodified before it is compressed, the other processes may
+            still be finishing a write to it
+        """
+        when = when.upper() if when else None
+        if when is not None and when not in self._WHEN:
+            raise RuntimeError("the when must be one of M, H, D, midnight or None. ")
+        if compression not in self._SUFFIXES:
+            raise RuntimeError("the compression must be one of gzip, zstd or None. ")
+        if compression == "zstd":
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                raise ImportError("the zstd compression needs zstandard, please install it by: pip install zstandard")
+
+        filename = os.path.abspath(filename)
+        super().__init__(filename, "a", encoding="UTF-8", delay=False)
+        self.max_bytes = max_bytes
+        self.when = when
+        self.backup_count = backup_count
+        self.disk_budget = disk_budget
+        self.compression = compression
+        self.grace = grace
+        self.setFormatter(CachedTimeFormatter())
+        self.setLevel(WARNING)
+
+        self._lock_file = _FileLock(filename + ".lock")
+        self._identity = self._stream_identity()
+        self._rollover_at = self._next_rollover(time.time())
+        self._segments = queue.Queue()
+        self._worker = threading.Thread(target=self._compress_segments, name="log-compressor")
+        self._worker.daemon = True
+        self._worker.start()
+        # the segments left uncompressed by a crashed process.
+        self._segments.put(None)
+
+    def _stream_identity(self):
+        stat = os.fstat(self.stream.fileno())
+        return stat.st_dev, stat.st_ino
+
+    def _next_rollover(self, now):
+        if self.when is None:
+            return None
+        t = time.localtime(now)
+        if self.when in ("D", "MIDNIGHT"):
+            # mktime normalizes the day after the last of the month, and follows the daylight saving time.
+            return time.mktime((t.tm_year, t.tm_mon, t.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+        step = self._WHEN[self.when]
+        elapsed = t.tm_sec if step == 60 else t.tm_min * 60 + t.tm_sec
+        return int(now) - elapsed + step
+
+    def _reopen_if_moved(self):
+        """reopen the file when another process rolled it over, return whether it did. """
+        try:
+            stat = os.stat(self.baseFilename)
+            moved = (stat.st_dev, stat.st_ino) != self._identity
+        except FileNotFoundError:
+            moved = True
+        if moved:
+            self.stream.close()
+            self.stream = self._open()
+            self._identity = self._stream_identity()
+            self._rollover_at = self._next_rollover(time.time())
+        return moved
+
+    def shouldRollover(self, record):
+        self._reopen_if_moved()
+        if self._rollover_at is not None and record.created >= self._rollover_at:
+            return True
+        return bool(self.max_bytes) and self.stream.tell() >= self.max_bytes
+
+    def _segment_name(self):
+        name = "{}.{}".format(self.baseFilename, time.strftime("%Y%m%d-%H%M%S"))
+        candidate, n = name, 1
+        while any(os.path.exists(candidate + suffix) for suffix in self._SUFFIXES.values()):
+            candidate = "{}.{}".format(name, n)
+            n += 1
+        return candidate
+
+    def doRollover(self):
+        with self._lock_file:
+            # another process may have rolled it over while this one waited for the lock.
+            if not self._reopen_if_moved() and self.stream.tell() > 0:
+                segment = self._segment_name()
+                os.rename(self.baseFilename, segment)
+                self._segments.put(segment)
+                self.stream.close()
+                self.stream = self._open()
+                self._identity = self._stream_identity()
+        self._rollover_at = self._next_rollover(time.time())
+
+    def _segment_paths(self):
+        """the rolled segments of the file, the oldest first. """
+        directory, base = os.path.split(self.baseFilename)
+        prefix = base + "."
+        paths = []
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name[len(prefix):len(prefix) + 1].isdigit() and ".tmp" not in name:
+                paths.append(os.path.join(directory, name))
+        return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+    def _compress(self, segment):
+        if self.compression is None or segment.endswith((".gz", ".zst")):
+            return
+        # wait until the other processes have finished their writes to it.
+        while time.time() - os.path.getmtime(segment) < self.grace:
+            time.sleep(self.grace)
+        target = segment + self._SUFFIXES[self.compression]
+        temporary = "{}.tmp{}".format(target, os.getpid())
+        with open(segment, "rb") as src, _open_compressor(self.compression, temporary) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        shutil.copystat(segment, temporary)
+        os.replace(temporary, target)
+        os.remove(segment)
+
+    def _enforce_budget(self):
+        """remove the oldest segments beyond backup_count or the disk budget. """
+        with self._lock_file:
+            segments = self._segment_paths()
+            sizes = [os.path.getsize(path) for path in segments]
+            # keep room for the current file to grow to max_bytes.
+            total = sum(sizes) + max(os.path.getsize(self.baseFilename), self.max_bytes)
+            for i, path in enumerate(segments):
+                over_count = len(segments) - i > self.backup_count
+                over_budget = self.disk_budget is not None and total > self.disk_budget
+                if not over_count and not over_budget:
+                    break
+                os.remove(path)
+                total -= sizes[i]
+
+    def _compress_segments(self):
+        while True:
+            segment = self._segments.get()
+            try:
+                if segment is False:
+                    return
+                if segment is None:
+                    for path in self._segment_paths():
+                        self._compress(path)
+                else:
+                    self._compress(segment)
+                self._enforce_budget()
+            except (FileNotFoundError, PermissionError):
+                # compressed or removed by another process.
+                pass
+            except Exception:
+                self.handleError(makeLogRecord({"msg": "compress {}".format(segment), "levelno": ERROR}))
+            finally:
+                self._segments.task_done()
+
+    def wait_compressed(self):
+        """wait until the rolled segments are compressed and the oldest ones removed. """
+        if self._worker.is_alive():
+            self._segments.join()
+
+    def close(self):
+        if self._worker.is_alive():
+            self._segments.put(False)
+            self._worker.join()
+        super().close()
+
+
 class AlarmSMTPHandler(SMTPHandler):
     def __init__(
             self,
@@ -76,6 +649,8 @@ class AlarmSMTPHandler(SMTPHandler):
             'DH+HIGH:ECDH+3DES:DH+3DES:RSA+AESGCM:RSA+AES:RSA+HIGH:RSA+3DES:!aNULL:'
             '!eNULL:!MD5')
 
+        import ssl
+
         context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
         context.options |= ssl.OP_NO_SSLv2
         context.options |= ssl.OP_NO_SSLv3
@@ -93,9 +668,346 @@ class AlarmSMTPHandler(SMTPHandler):
             toaddrs=toaddrs,
             timeout=20.0,
         )
-        formatter = Formatter(
-            DEFAULT_LOG_FORMAT,
-            DEFAULT_DATE_FORMAT,
-        )
-        self.setFormatter(formatter)
+        self.setFormatter(CachedTimeFormatter())
         self.setLevel(CRITICAL)
+
+
+class _TokenBucket(object):
+    def __init__(self, rate, burst):
+        """
+        rate: tokens added per second
+        burst: the capacity of the bucket, it starts full
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+# the handlers and the loggers use the record returned by a filter since python 3.12
+_FILTER_REPLACES_RECORD = sys.version_info >= (3, 12)
+
+
+class _Template(object):
+    __slots__ = ("bucket", "suppressed")
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.suppressed = 0
+
+
+# keep the high volume records, e.g. the DEBUG records of pyanalysis.mysql, cheap enough for production: sample
+# them, rate limit every message template and every logger, and change the level at runtime. Add it to a handler.
+class SamplingFilter(Filter):
+    def __init__(
+            self,
+            level=DEBUG,
+            sample_rate=1.0,
+            rate=None,
+            logger_rate=None,
+            burst=None,
+            always_level=ERROR,
+            loggers=(),
+            max_templates=1000,
+    ):
+        """
+        level: the records below it are dropped, change it by set_level(), toggle() or install_signal()
+        sample_rate: the probability to keep a record
+        rate: the records per second of every message template(the logger and the msg before formatting), the
+            next record written after a suppression tells how many were suppressed(python 3.12+, by a copy of the
+            record, the other handlers get the record unchanged), None is no limit
+        logger_rate: the records per second of every logger, None is no limit
+        burst: the records a template or a logger may write at once, max(rate, 1) by default
+        always_level: the records at it or above skip the sampling and the limits
+        loggers: the names of the loggers following set_level(), the records below it are not even created,
+            e.g. ("pyanalysis.mysql",)
+        max_templates: the templates tracked at most, the least recent ones are forgotten
+        """
+        super().__init__()
+        if not 0 <= sample_rate <= 1:
+            raise RuntimeError("the sample_rate must be between 0 and 1. ")
+        self.sample_rate = sample_rate
+        self.rate = rate
+        self.logger_rate = logger_rate
+        self.burst = burst
+        self.always_level = always_level
+        self.loggers = tuple(loggers)
+        self.max_templates = max_templates
+        # the records dropped by the sampling and by the rate limits
+        self.sampled = 0
+        self.suppressed = 0
+
+        self._lock = threading.Lock()
+        self._templates = collections.OrderedDict()
+        self._logger_buckets = {}
+        self._level_before_toggle = None
+        self.level = DEBUG
+        self.set_level(level)
+
+    def set_level(self, level):
+        """drop the records below the level, a number or a name like "DEBUG". """
+        if isinstance(level, str):
+            level = getLevelName(level.upper())
+        if not isinstance(level, int):
+            raise RuntimeError("unknown level {}. ".format(level))
+        self.level = level
+        for name in self.loggers:
+            getLogger(name).setLevel(level)
+
+    def toggle(self, level=DEBUG):
+        """switch to the level, or back to the level before it. """
+        if self._level_before_toggle is None:
+            self._level_before_toggle = self.level
+            self.set_level(level)
+        else:
+            self.set_level(self._level_before_toggle)
+            self._level_before_toggle = None
+
+    def install_signal(self, signum=None, level=DEBUG):
+        """
+        toggle() the level when the process receives the signal, SIGUSR1 by default, e.g. kill -USR1 <pid>.
+        call it in the main thread.
+        """
+        import signal
+
+        if signum is None:
+            signum = getattr(signal, "SIGUSR1", None)
+            if signum is None:
+                raise RuntimeError("no SIGUSR1 on this platform, please pass the signal. ")
+        signal.signal(signum, lambda *_: self.toggle(level))
+
+    def _bucket(self, rate):
+        burst = self.burst if self.burst is not None else max(rate, 1)
+        return _TokenBucket(rate, burst)
+
+    def _template(self, record):
+        msg = record.msg
+        key = (record.name, msg if isinstance(msg, str) else type(msg).__name__)
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = _Template(self._bucket(self.rate) if self.rate is not None else None)
+            if len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+        else:
+            self._templates.move_to_end(key)
+        return template
+
+    def _allow(self, record, template):
+        if template.bucket is not None and not template.bucket.take():
+            return False
+        if self.logger_rate is None:
+            return True
+        bucket = self._logger_buckets.get(record.name)
+        if bucket is None:
+            bucket = self._logger_buckets[record.name] = self._bucket(self.logger_rate)
+        return bucket.take()
+
+    def filter(self, record):
+        levelno = record.levelno
+        if levelno >= self.always_level:
+            return True
+        if levelno < self.level:
+            return False
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            with self._lock:
+                self.sampled += 1
+            return False
+        if self.rate is None and self.logger_rate is None:
+            return True
+
+        with self._lock:
+            template = self._template(record)
+            if not self._allow(record, template):
+                template.suppressed += 1
+                self.suppressed += 1
+                return False
+            suppressed, template.suppressed = template.suppressed, 0
+        if suppressed and _FILTER_REPLACES_RECORD:
+            # never change the record itself, the other handlers of the logger get it too.
+            record = copy.copy(record)
+            record.msg = "{} ({} similar records suppressed)".format(record.getMessage(), suppressed)
+            record.args = None
+            record.suppressed = suppressed
+            return record
+        return True
+
+
+class _Digest(object):
+    """the records of one fingerprint, the first one is kept formatted. """
+
+    def __init__(self, record, text):
+        self.name = record.name
+        self.summary = record.getMessage().split("\n", 1)[0][:200]
+        self.text = text
+        self.levelno = record.levelno
+        self.count = 0
+        self.first = self.last = record.created
+
+    def add(self, record):
+        self.count += 1
+        self.levelno = max(self.levelno, record.levelno)
+        self.last = max(self.last, record.created)
+
+
+# the records are grouped by fingerprint and sent as one digest mail per window by a background thread,
+# a burst of the same error sends one mail and never blocks the logging thread.
+class DigestAlarmSMTPHandler(AlarmSMTPHandler):
+    def __init__(
+            self,
+            host="",
+            port=578,
+            username="",
+            password="",
+            fromaddr="",
+            toaddrs="",
+            subject="pyanalysis notify",
+            window=60,
+            mails_per_hour=20,
+            burst=3,
+            max_groups=50,
+    ):
+        """
+        window: seconds between two digests
+        mails_per_hour, burst: the token bucket of the mails, the records wait for the next window when
+            it is empty
+        max_groups: the fingerprints kept per digest, the records of the others are only counted
+        """
+        super().__init__(host, port, username, password, fromaddr, toaddrs, subject)
+        self.window = window
+        self.max_groups = max_groups
+        self._bucket = _TokenBucket(mails_per_hour / 3600.0, burst)
+        self._groups = collections.OrderedDict()
+        self._overflow = 0
+        self._groups_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="digest-smtp")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @staticmethod
+    def fingerprint(record):
+        """the logger, the message template and the exception type of a record. """
+        template = record.msg if isinstance(record.msg, str) else type(record.msg).__name__
+        exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else ""
+        return record.name, template, exc_type
+
+    def emit(self, record):
+        try:
+            key = self.fingerprint(record)
+            with self._groups_lock:
+                digest = self._groups.get(key)
+                if digest is not None:
+                    digest.add(record)
+                    return
+            # only the first record of a fingerprint is formatted, out of the lock.
+            text = self.format(record)
+            with self._groups_lock:
+                digest = self._groups.get(key)
+                if digest is None:
+                    if len(self._groups) >= self.max_groups:
+                        self._overflow += 1
+                        return
+                    digest = self._groups[key] = _Digest(record, text)
+                digest.add(record)
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while not self._stop.wait(self.window):
+            self.send_pending()
+
+    def send_pending(self, force=False):
+        """send the digest of the pending records, unless the token bucket is empty and force is False. """
+        with self._groups_lock:
+            if not self._groups and not self._overflow:
+                return
+            if not force and not self._bucket.take():
+                return
+            digests, overflow = list(self._groups.values()), self._overflow
+            self._groups, self._overflow = collections.OrderedDict(), 0
+        try:
+            self.send_digest(digests, overflow)
+        except Exception:
+            self.handleError(makeLogRecord({"name": __name__, "msg": self.subject, "levelno": CRITICAL}))
+
+    def _time(self, created):
+        return time.strftime(DEFAULT_DATE_FORMAT, time.localtime(created))
+
+    def render_digest(self, digests, overflow):
+        """the subject, the plain text and the html of the digest mail. """
+        from pyanalysis.mail_templates import AlertTemplate
+
+        total = sum(digest.count for digest in digests) + overflow
+        levelno = max(digest.levelno for digest in digests) if digests else CRITICAL
+        first = min(digest.first for digest in digests) if digests else time.time()
+        last = max(digest.last for digest in digests) if digests else first
+        subject = "{} ({} records)".format(self.subject, total)
+        period = "{} ~ {}".format(self._time(first), self._time(last))
+
+        details = collections.OrderedDict()
+        texts = []
+        for i, digest in enumerate(digests, 1):
+            details["{}. [{}] {}".format(i, digest.name, digest.summary)] = "{} times, {} ~ {}".format(
+                digest.count, self._time(digest.first), self._time(digest.last))
+            texts.append("{} times, {} ~ {}\n{}".format(
+                digest.count, self._time(digest.first), self._time(digest.last), digest.text))
+        if overflow:
+            details["{}. others".format(len(digests) + 1)] = "{} times".format(overflow)
+            texts.append("{} times of other records".format(overflow))
+
+        template = AlertTemplate(
+            title=subject,
+            message="{} records of {} kinds".format(total, len(digests) + (1 if overflow else 0)),
+            severity="critical" if levelno >= CRITICAL else "warning" if levelno >= WARNING else "info",
+            timestamp=period,
+            details=details,
+        )
+        return subject, "\n\n".join(texts), template.render()
+
+    def send_digest(self, digests, overflow=0):
+        import smtplib
+        import email.utils
+
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+
+        subject, text, html = self.render_digest(digests, overflow)
+        msg = MIMEMultipart("alternative")
+        msg["From"] = self.fromaddr
+        msg["To"] = ",".join(self.toaddrs)
+        msg["Subject"] = subject
+        msg["Date"] = email.utils.localtime()
+        msg.attach(MIMEText(text, "plain", "utf-8"))
+        msg.attach(MIMEText(html, "html", "utf-8"))
+
+        smtp = smtplib.SMTP(self.mailhost, self.mailport or smtplib.SMTP_PORT, timeout=self.timeout)
+        try:
+            if self.username:
+                if self.secure is not None:
+                    smtp.ehlo()
+                    smtp.starttls(context=self.secure[2] if len(self.secure) > 2 else None)
+                    smtp.ehlo()
+                smtp.login(self.username, self.password)
+            smtp.send_message(msg)
+        finally:
+            smtp.quit()
+
+    def flush(self):
+        self.send_pending(force=True)
+
+    def close(self):
+        """stop the background thread and send the pending records. """
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.send_pending(force=True)
+        super().close()
@@ -1,27 +1,180 @@
+import io
+import csv
 import ssl
+import time
+import uuid
+import zlib
+import base64
+import zipfile
 import smtplib
+import mimetypes
+import threading
+import collections
 
+from concurrent.futures import ThreadPoolExecutor
+
+from email.message import Message
+from email.generator import BytesGenerator
+from email.mime.base import MIMEBase
 from email.mime.text import MIMEText
-from email.mime.image import MIMEImage
-from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 
-__all__ = ["Mail", "HtmlContent", "ExcelAttach", "ImageAttach"]
+__all__ = [
+    "Mail", "SMTPPool", "BulkMessage", "BulkResult", "HtmlContent", "ExcelAttach", "ImageAttach", "FileAttach",
+    "CompressedAttach",
+]
+
+_CRLF = b"\r\n"
+# the bytes buffered before a write to the socket
+_WRITE_SIZE = 64 * 1024
+
+
+# 从磁盘流式发送的附件，发送时分块读取并 base64 编码，文件不会整个读入内存，适合几十 MB 的大附件
+class FileAttach(MIMEBase):
+    # 57 bytes make a base64 line of 76 characters
+    CHUNK_SIZE = 57 * 1024
+
+    def __init__(self, filepath, filename, mimetype=None):
+        """
+        mimetype: e.g. application/vnd.ms-excel, guessed from the filename by default
+        """
+        mimetype = mimetype or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        super().__init__(*mimetype.split("/", 1))
+        self.filepath = filepath
+        # the generators skip a part without payload, get_payload() reads the file instead of it.
+        self._payload = ""
+        self["Content-Transfer-Encoding"] = "base64"
+        self.add_header("Content-Disposition", "attachment", filename=("gb2312", "", filename))
 
+    def iter_encoded(self):
+        """the base64 lines of the file with CRLF ends, one chunk at a time. """
+        with open(self.filepath, "rb") as fp:
+            while True:
+                chunk = fp.read(self.CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield base64.encodebytes(chunk).replace(b"\n", _CRLF)
 
-# 图片附件，这里不是指镶嵌在html中的图片
-class ImageAttach(MIMEImage):
+    def get_payload(self, i=None, decode=False):
+        """the whole file, only for the code serializing the message at once, e.g. as_string(). """
+        with open(self.filepath, "rb") as fp:
+            data = fp.read()
+        return data if decode else base64.encodebytes(data).decode("ascii")
+
+
+# 图片附件，这里不是指镶嵌在html中的图片，与 FileAttach 一样发送时才从磁盘分块读取
+class ImageAttach(FileAttach):
     def __init__(self, filepath, filename):
-        with open(filepath, "rb") as fp:
-            super().__init__(fp.read(), _subtype="octet-stream")
-            self.add_header("Content-Disposition", "attachment", filename=("gb2312", "", filename))
+        super().__init__(filepath, filename, "image/octet-stream")
 
 
-class ExcelAttach(MIMEApplication):
+class ExcelAttach(FileAttach):
     def __init__(self, filepath, filename):
-        with open(filepath, "rb") as fp:
-            super().__init__(fp.read())
-            self.add_header("Content-Disposition", "attachment", filename=("gb2312", "", filename))
+        super().__init__(filepath, filename, "application/octet-stream")
+
+
+class _ChunkSink(object):
+    """an unseekable file collecting what zipfile writes. """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+# 边读边压缩的附件（gzip 或 zip），发送时分块读取、压缩并编码，文件或数据不会整个读入内存
+class CompressedAttach(FileAttach):
+    _TYPES = {"gzip": (".gz", "application/gzip"), "zip": (".zip", "application/zip")}
+
+    def __init__(self, filepath, filename, compression="gzip", chunks=None):
+        """
+        filename: the name of the file in the archive, the attachment is named filename.gz or filename.zip
+        compression: gzip or zip
+        chunks: the function returning the content in chunks instead of the file, see from_rows()
+        """
+        if compression not in self._TYPES:
+            raise RuntimeError("the compression must be gzip or zip. ")
+        suffix, mimetype = self._TYPES[compression]
+        super().__init__(filepath, filename + suffix, mimetype)
+        self.compression = compression
+        self.inner_name = filename
+        self._chunks = chunks
+
+    @classmethod
+    def from_rows(cls, headers, rows, filename, compression="gzip"):
+        """
+        a compressed CSV written from the rows while sending, the rows must be iterable again when the message is
+        retried. the CSV is UTF-8 with a BOM, so Excel detects the encoding.
+        """
+        def chunks():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            buffer.write("\ufeff")
+            writer.writerow(headers)
+            for row in rows:
+                writer.writerow(row)
+                if buffer.tell() >= cls.CHUNK_SIZE:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue().encode("utf-8")
+
+        return cls(None, filename, compression, chunks)
+
+    def _raw_chunks(self):
+        if self._chunks is not None:
+            yield from self._chunks()
+            return
+        with open(self.filepath, "rb") as fp:
+            while True:
+                chunk = fp.read(self.CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    def iter_compressed(self):
+        """the compressed content, one chunk at a time. """
+        if self.compression == "gzip":
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            for chunk in self._raw_chunks():
+                compressed = compressor.compress(chunk)
+                if compressed:
+                    yield compressed
+            yield compressor.flush()
+            return
+        sink = _ChunkSink()
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+            with archive.open(self.inner_name, "w") as entry:
+                for chunk in self._raw_chunks():
+                    entry.write(chunk)
+                    yield sink.take()
+        yield sink.take()
+
+    def iter_encoded(self):
+        pending = bytearray()
+        for chunk in self.iter_compressed():
+            pending += chunk
+            if len(pending) >= self.CHUNK_SIZE:
+                # whole base64 lines only, the rest waits for the next chunk.
+                size = len(pending) // 57 * 57
+                yield base64.encodebytes(bytes(pending[:size])).replace(b"\n", _CRLF)
+                del pending[:size]
+        if pending:
+            yield base64.encodebytes(bytes(pending)).replace(b"\n", _CRLF)
+
+    def get_payload(self, i=None, decode=False):
+        """the whole compressed content, only for the code serializing the message at once, e.g. as_string(). """
+        data = b"".join(self.iter_compressed())
+        return data if decode else base64.encodebytes(data).decode("ascii")
 
 
 # html正文
@@ -30,8 +183,313 @@ class HtmlContent(MIMEText):
         super().__init__(content, "html", "utf-8")
 
 
+# send_bulk() 的一封邮件，parts 可以是 MIME 对象，也可以是邮件模板（在线程池中渲染）
+BulkMessage = collections.namedtuple("BulkMessage", ["title", "receivers", "copiers", "parts"])
+BulkMessage.__new__.__defaults__ = (None, ())
+
+
+# send_bulk() 中一封邮件的发送结果
+class BulkResult(collections.namedtuple("BulkResult", ["index", "receivers", "attempts", "refused", "error"])):
+    """
+    index: the position of the message in the messages of send_bulk()
+    attempts: how many times it was sent, the transient failures are retried
+    refused: {receiver: (code, reply)} of the receivers refused by the server, the others got the message
+    error: the exception of the last attempt, None when it is sent
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _is_transient(error):
+    """whether sending again later may succeed: a 4xx reply, a disconnect or a network error. """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def _has_file_attach(msg):
+    return any(isinstance(part, FileAttach) for part in msg.walk())
+
+
+def _headers(msg, policy):
+    return b"".join(policy.fold_binary(name, value) for name, value in msg.raw_items()) + _CRLF
+
+
+def _iter_message(msg, policy=None):
+    """
+    the message as bytes with CRLF line ends, one chunk at a time, the FileAttach parts are read and encoded
+    chunk by chunk, so the whole message is never in memory.
+    """
+    policy = policy or msg.policy.clone(linesep="\r\n")
+    if isinstance(msg, FileAttach):
+        yield _headers(msg, policy)
+        yield from msg.iter_encoded()
+    elif msg.is_multipart():
+        if msg.get_boundary() is None:
+            msg.set_boundary("=" * 15 + uuid.uuid4().hex + "==")
+        boundary = msg.get_boundary().encode("ascii")
+        yield _headers(msg, policy)
+        if msg.preamble is not None:
+            yield msg.preamble.encode("utf-8") + _CRLF
+        for i, part in enumerate(msg.get_payload()):
+            yield (_CRLF if i else b"") + b"--" + boundary + _CRLF
+            yield from _iter_message(part, policy)
+        yield _CRLF + b"--" + boundary + b"--" + _CRLF
+        if msg.epilogue is not None:
+            yield msg.epilogue.encode("utf-8")
+    else:
+        buffer = io.BytesIO()
+        BytesGenerator(buffer, mangle_from_=False, policy=policy).flatten(msg)
+        yield buffer.getvalue()
+
+
+# 按 SMTP DATA 的要求把行首的点变成两个点，分块写入时也能正确处理跨块的行首
+class _DotStuffer(object):
+    def __init__(self):
+        self._line_start = True
+        self._cr = False
+
+    def stuff(self, chunk):
+        if not chunk:
+            return chunk
+        if self._line_start and chunk[:1] == b".":
+            chunk = b"." + chunk
+        elif self._cr and chunk[:2] == b"\n.":
+            chunk = b"\n.." + chunk[2:]
+        chunk = chunk.replace(b"\r\n.", b"\r\n..")
+        self._line_start = chunk.endswith(_CRLF)
+        self._cr = chunk.endswith(b"\r")
+        return chunk
+
+    def end(self):
+        """the line ending the data. """
+        return (b"" if self._line_start else _CRLF) + b"." + _CRLF
+
+
+def _reset(smtp, code):
+    """after a failed command, close the session on 421, or reset it for the next message. """
+    if code == 421:
+        smtp.close()
+        return
+    try:
+        smtp.rset()
+    except smtplib.SMTPServerDisconnected:
+        pass
+
+
+def _stream_sendmail(smtp, from_addr, to_addrs, msg):
+    """
+    smtplib.SMTP.sendmail, but the message is written to the socket chunk by chunk. msg is a message, or an
+    iterable of the serialized message in chunks with CRLF line ends, iterated again when the message is retried
+    """
+    smtp.ehlo_or_helo_if_needed()
+    code, resp = smtp.mail(from_addr)
+    if code != 250:
+        _reset(smtp, code)
+        raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+    refused = {}
+    for address in to_addrs:
+        code, resp = smtp.rcpt(address)
+        if code not in (250, 251):
+            refused[address] = (code, resp)
+        if code == 421:
+            smtp.close()
+            raise smtplib.SMTPRecipientsRefused(refused)
+    if len(refused) == len(to_addrs):
+        _reset(smtp, code)
+        raise smtplib.SMTPRecipientsRefused(refused)
+    code, resp = smtp.docmd("data")
+    if code != 354:
+        _reset(smtp, code)
+        raise smtplib.SMTPDataError(code, resp)
+
+    stuffer, buffer = _DotStuffer(), bytearray()
+    for chunk in _iter_message(msg) if isinstance(msg, Message) else msg:
+        buffer += stuffer.stuff(chunk)
+        if len(buffer) >= _WRITE_SIZE:
+            smtp.send(bytes(buffer))
+            buffer.clear()
+    buffer += stuffer.end()
+    smtp.send(bytes(buffer))
+    code, resp = smtp.getreply()
+    if code != 250:
+        _reset(smtp, code)
+        raise smtplib.SMTPDataError(code, resp)
+    return refused
+
+
+def _sendmail(smtp, from_addr, to_addrs, msg):
+    """send msg, the serialized message, a message with FileAttach parts or the chunks of a message to stream. """
+    if isinstance(msg, (str, bytes)):
+        return smtp.sendmail(from_addr, to_addrs, msg)
+    return _stream_sendmail(smtp, from_addr, to_addrs, msg)
+
+
+def _serialize(msg):
+    """the message to send: streamed later when it has FileAttach parts, serialized now otherwise. """
+    return msg if _has_file_attach(msg) else msg.as_string()
+
+
+def _build_message(sender, attachments, title, receivers, copiers=None, parts=(), inline_policy=None):
+    """
+    the message with the attachments and the parts, and all the receivers.
+    inline_policy: the default max_inline_rows and max_inline_bytes of the TableTemplate parts
+    """
+    msg = MIMEMultipart('alternative')
+    msg["From"] = sender
+    msg["To"] = ",".join(receivers)
+    msg["Subject"] = title
+    # never extend the list of the caller.
+    all_receiver = list(receivers)
+    if copiers:
+        msg["Cc"] = ",".join(copiers)
+        all_receiver.extend(copiers)
+    for part in list(attachments) + list(parts):
+        # the mail templates are rendered here, in the thread sending the message.
+        if hasattr(part, "to_parts"):
+            for template_part in part.to_parts(**(inline_policy or {})):
+                msg.attach(template_part)
+        else:
+            msg.attach(part.to_html() if hasattr(part, "to_html") else part)
+    return msg, all_receiver
+
+
+class _Session(object):
+    __slots__ = ("smtp", "sent", "last_used")
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+def _quit(smtp):
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, OSError):
+        smtp.close()
+
+
+# 保持若干个已登录的 SMTP 会话，在多次发送之间复用，省去每封邮件的 TCP、SSL 握手与登录
+class SMTPPool(object):
+    def __init__(self, connect, size=4, max_messages=100, max_idle=60.0, noop_after=5.0):
+        """
+        connect: the function returning a new logged in smtplib.SMTP, e.g. Mail._get_smtp_server
+        size: the sessions kept at most, the senders wait for a free one
+        max_messages: the messages a session sends before it is closed, keep it below the limit of the server
+        max_idle: the seconds a session may stay idle, the servers close the idle sessions themselves
+        noop_after: the seconds of idleness after which a session is checked by NOOP before it is used
+        """
+        if size <= 0:
+            raise RuntimeError("the size of the smtp pool must be positive. ")
+        self._connect = connect
+        self.size = size
+        self.max_messages = max_messages
+        self.max_idle = max_idle
+        self.noop_after = noop_after
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _alive(self, session):
+        idle = time.monotonic() - session.last_used
+        if idle > self.max_idle:
+            return False
+        if idle <= self.noop_after:
+            return True
+        try:
+            return session.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                session = self._idle.pop() if self._idle else None
+            if session is None:
+                return _Session(self._connect())
+            if self._alive(session):
+                return session
+            session.smtp.close()
+
+    def _checkin(self, session, broken=False):
+        session.last_used = time.monotonic()
+        if broken:
+            session.smtp.close()
+        elif session.sent >= self.max_messages:
+            _quit(session.smtp)
+        else:
+            with self._lock:
+                self._idle.append(session)
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        """
+        send the message by a pooled session, reconnect and retry once when the server closed the session(421 or
+        a disconnect), return the refused recipients like smtplib.SMTP.sendmail.
+        msg is the serialized message, or a message with FileAttach parts to stream
+        """
+        with self._slots:
+            for retry in (False, True):
+                session = self._checkout()
+                try:
+                    refused = _sendmail(session.smtp, from_addr, to_addrs, msg)
+                except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException) as e:
+                    # smtplib has reset the session after the other replies, it is still usable.
+                    closed = getattr(e, "smtp_code", 421) == 421
+                    self._checkin(session, broken=closed)
+                    if closed and not retry:
+                        continue
+                    raise
+                except smtplib.SMTPRecipientsRefused:
+                    self._checkin(session)
+                    raise
+                except BaseException:
+                    self._checkin(session, broken=True)
+                    raise
+                session.sent += 1
+                self._checkin(session)
+                return refused
+
+    def close(self):
+        """quit the idle sessions, the pool can still be used after it. """
+        with self._lock:
+            sessions, self._idle = list(self._idle), collections.deque()
+        for session in sessions:
+            _quit(session.smtp)
+
+
 class Mail(object):
-    def __init__(self, username, password, mail_port=465, time_out=20.0, host="smtp.qq.com", protocol="SSL"):
+    def __init__(
+            self,
+            username,
+            password,
+            mail_port=465,
+            time_out=20.0,
+            host="smtp.qq.com",
+            protocol="SSL",
+            pool_size=0,
+            max_messages_per_session=100,
+            spool=None,
+            max_inline_rows=None,
+            max_inline_bytes=None,
+    ):
+        """
+        protocol: SSL, TLS(STARTTLS) or PLAIN(no encryption, only for a relay in a trusted network)
+        pool_size: keep up to pool_size logged in sessions and reuse them across send(), close() quits them.
+            0 opens a new session for every send()
+        max_messages_per_session: the messages a pooled session sends before it is replaced
+        spool: a MailSpool or the directory of one, where enqueue() writes the messages
+        max_inline_rows, max_inline_bytes: the default limits of the TableTemplate attached or sent as parts, the
+            rows beyond them are only in a compressed CSV attachment, see TableTemplate
+        """
         # 初始化资源
         self._username = username
         self._password = password
@@ -41,6 +499,12 @@ class Mail(object):
         self._host = host
         self._secure = None
         self._attachments = []
+        self._pool = SMTPPool(self._get_smtp_server, pool_size, max_messages_per_session) if pool_size else None
+        if isinstance(spool, str):
+            from pyanalysis.mail_spool import MailSpool
+            spool = MailSpool(spool)
+        self._spool = spool
+        self._inline_policy = {"max_inline_rows": max_inline_rows, "max_inline_bytes": max_inline_bytes}
 
     def _get_smtp_server(self):
         if self._protocol.upper() == "SSL":
@@ -59,32 +523,108 @@ class Mail(object):
             context.verify_mode = ssl.CERT_REQUIRED
             self._secure = (None, None, context)
             smtp = smtplib.SMTP(self._host, self._mail_port, timeout=self._time_out)
+        elif self._protocol.upper() == "PLAIN":
+            smtp = smtplib.SMTP(self._host, self._mail_port, timeout=self._time_out)
         else:
-            raise RuntimeError("Can not use the protocol {}. The protocol must in ssl or tls".format(self._protocol))
+            raise RuntimeError(
+                "Can not use the protocol {}. The protocol must in ssl, tls or plain".format(self._protocol))
 
+        # encrypt the session with or without a login, smtplib greets the server itself.
+        if self._secure is not None:
+            smtp.ehlo()
+            smtp.starttls(*self._secure)
+            smtp.ehlo()
         if self._username:
-            if self._secure is not None:
-                smtp.ehlo()
-                smtp.starttls(*self._secure)
-                smtp.ehlo()
             smtp.login(self._username, self._password)
         return smtp
 
     def attach(self, context):
         self._attachments.append(context)
 
-    def send(self, title, receivers, copiers=None):
-        msg = MIMEMultipart('alternative')
-        msg["From"] = self._username
-        msg["To"] = ",".join(receivers)
-        msg["Subject"] = title
-        all_receiver = receivers
-        if copiers:
-            msg["Cc"] = ",".join(copiers)
-            all_receiver += copiers
-        for attach in self._attachments:
-            msg.attach(attach)
+    def _build_message(self, title, receivers, copiers=None, parts=()):
+        return _build_message(
+            self._username, self._attachments, title, receivers, copiers, parts, self._inline_policy)
 
+    def send(self, title, receivers, copiers=None):
+        msg, all_receiver = self._build_message(title, receivers, copiers)
+        data = _serialize(msg)
+        if self._pool is not None:
+            self._pool.sendmail(self._username, all_receiver, data)
+            return
         smtp = self._get_smtp_server()
-        smtp.sendmail(self._username, all_receiver, msg.as_string())
+        _sendmail(smtp, self._username, all_receiver, data)
         smtp.quit()
+
+    def _send_one(self, pool, index, message, retries, backoff):
+        message = BulkMessage(*message)
+        attempts, error = 0, None
+        try:
+            msg, all_receiver = self._build_message(*message)
+            data = _serialize(msg)
+        except Exception as e:
+            return BulkResult(index, message.receivers, attempts, {}, e)
+
+        while attempts <= retries:
+            if attempts:
+                time.sleep(backoff * 2 ** (attempts - 1))
+            attempts += 1
+            try:
+                refused = pool.sendmail(self._username, all_receiver, data)
+                return BulkResult(index, message.receivers, attempts, refused, None)
+            except Exception as e:
+                error = e
+                if not _is_transient(e):
+                    break
+        refused = error.recipients if isinstance(error, smtplib.SMTPRecipientsRefused) else {}
+        return BulkResult(index, message.receivers, attempts, refused, error)
+
+    def send_bulk(self, messages, concurrency=4, retries=3, backoff=1.0):
+        """
+        send many messages, e.g. one report per receiver, by concurrency threads and SMTP sessions.
+        the threads render the templates, serialize and send the messages, the attachments of the mail are sent
+        with every message.
+
+        messages: BulkMessage or (title, receivers, copiers, parts) tuples, copiers and parts are optional, the
+            parts are MIME objects like HtmlContent or mail templates like TableTemplate
+        retries: how many times a message is sent again after a transient failure(4xx, a disconnect)
+        backoff: the seconds before the first retry, doubled by every retry
+        return the BulkResult of every message in the order of messages, never raise for a message
+        """
+        if concurrency <= 0:
+            raise RuntimeError("the concurrency must be positive. ")
+        pool = self._pool
+        if pool is None:
+            pool = SMTPPool(self._get_smtp_server, concurrency)
+        try:
+            with ThreadPoolExecutor(concurrency, thread_name_prefix="send-bulk") as executor:
+                futures = [
+                    executor.submit(self._send_one, pool, index, message, retries, backoff)
+                    for index, message in enumerate(messages)
+                ]
+                return [future.result() for future in futures]
+        finally:
+            if pool is not self._pool:
+                pool.close()
+
+    def enqueue(self, title, receivers, copiers=None, parts=(), key=None):
+        """
+        write the message to the spool and return at once, a MailSpoolWorker sends it later with retries.
+        key: the idempotency key, a message whose key is already in the spool(queued, sent or dead) is not written
+            again, a new key by default
+        return the key
+        """
+        if self._spool is None:
+            raise RuntimeError("the mail has no spool, please create it with Mail(..., spool=directory). ")
+        msg, all_receiver = self._build_message(title, receivers, copiers, parts)
+        return self._spool.put(msg, self._username, all_receiver, key)
+
+    def close(self):
+        """quit the pooled sessions. """
+        if self._pool is not None:
+            self._pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc, value, traceback):
+        self.close()
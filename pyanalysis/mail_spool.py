@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from pyanalysis.mail import SMTPPool, _is_transient, _iter_message
+
+__all__ = ["MailSpool", "MailSpoolWorker"]
+
+logger = logging.getLogger(__name__)
+
+_READ_SIZE = 64 * 1024
+
+
+# 磁盘上的一封待发邮件，发送时分块读取，重试时重新读取
+class _SpooledData(object):
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        with open(self.path, "rb") as fp:
+            while True:
+                chunk = fp.read(_READ_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+
+def _write_atomic(path, chunks):
+    """write the file completely or not at all, even when the process crashes. """
+    temporary = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+    try:
+        with open(temporary, "wb") as fp:
+            for chunk in chunks:
+                fp.write(chunk)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+# 持久化的发件队列：每封邮件是 queue 目录下的 <id>.eml（邮件内容）与 <id>.json（收件人、重试次数等），
+# 发送成功后在 sent 目录留下记录用于幂等，多次失败后移到 dead 目录。多个进程可以共用一个目录，
+# 发送前通过原子的 rename 认领邮件。
+class MailSpool(object):
+    def __init__(self, directory, max_attempts=8, backoff=30.0, max_backoff=3600.0, keep_sent=7 * 86400):
+        """
+        max_attempts: the attempts of a message before it is moved to the dead directory
+        backoff: the seconds before the first retry, doubled by every retry up to max_backoff
+        keep_sent: the seconds the records of the sent messages are kept for the idempotency keys
+        """
+        self.directory = directory
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.keep_sent = keep_sent
+        for name in ("queue", "sent", "dead"):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    def _path(self, state, entry_id, suffix):
+        return os.path.join(self.directory, state, entry_id + suffix)
+
+    @staticmethod
+    def _entry_id(key):
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _exists(self, entry_id):
+        return any(os.path.exists(self._path(state, entry_id, suffix)) for state, suffix in (
+            ("queue", ".json"), ("queue", ".sending"), ("sent", ".json"), ("dead", ".json")))
+
+    def put(self, msg, sender, receivers, key=None):
+        """write the message, return its key, a key already in the spool is not written again. """
+        key = key or uuid.uuid4().hex
+        entry_id = self._entry_id(key)
+        if self._exists(entry_id):
+            return key
+        meta = {
+            "key": key,
+            "sender": sender,
+            "receivers": list(receivers),
+            "subject": msg["Subject"],
+            "created": time.time(),
+            "attempts": 0,
+            "next_attempt": 0,
+            "error": None,
+        }
+        # the message first, the metadata makes it visible to the workers.
+        _write_atomic(self._path("queue", entry_id, ".eml"), _iter_message(msg))
+        _write_atomic(self._path("queue", entry_id, ".json"), [json.dumps(meta).encode("utf-8")])
+        return key
+
+    def _read(self, path):
+        with open(path, "rb") as fp:
+            return json.loads(fp.read().decode("utf-8"))
+
+    def _claim(self, limit):
+        """claim up to limit messages due now, oldest first, a message is claimed by one process only. """
+        now, due = time.time(), []
+        queue_dir = os.path.join(self.directory, "queue")
+        for name in os.listdir(queue_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                meta = self._read(os.path.join(queue_dir, name))
+            except (OSError, ValueError):
+                continue
+            if meta["next_attempt"] <= now:
+                due.append((meta["next_attempt"], meta["created"], name[:-5]))
+        claimed = []
+        for _, _, entry_id in sorted(due)[:limit]:
+            path = self._path("queue", entry_id, ".json")
+            try:
+                # recover() takes the mtime for the claim time, the rename keeps it, so touch the file first.
+                os.utime(path)
+                os.rename(path, self._path("queue", entry_id, ".sending"))
+            except FileNotFoundError:
+                # claimed by another process.
+                continue
+            claimed.append((entry_id, self._read(self._path("queue", entry_id, ".sending"))))
+        return claimed
+
+    def _sent(self, entry_id, meta):
+        meta.update(attempts=meta["attempts"] + 1, sent=time.time(), error=None)
+        _write_atomic(self._path("sent", entry_id, ".json"), [json.dumps(meta).encode("utf-8")])
+        os.remove(self._path("queue", entry_id, ".eml"))
+        os.remove(self._path("queue", entry_id, ".sending"))
+
+    def _failed(self, entry_id, meta, error):
+        attempts = meta["attempts"] + 1
+        meta.update(attempts=attempts, error="{}: {}".format(type(error).__name__, error))
+        sending = self._path("queue", entry_id, ".sending")
+        if _is_transient(error) and attempts < self.max_attempts:
+            meta["next_attempt"] = time.time() + min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+            _write_atomic(sending, [json.dumps(meta).encode("utf-8")])
+            os.rename(sending, self._path("queue", entry_id, ".json"))
+            return
+        logger.error("mail %s to %s is dead after %d attempts: %s", meta["key"], meta["receivers"], attempts,
+                     meta["error"])
+        os.replace(self._path("queue", entry_id, ".eml"), self._path("dead", entry_id, ".eml"))
+        _write_atomic(self._path("dead", entry_id, ".json"), [json.dumps(meta).encode("utf-8")])
+        os.remove(sending)
+
+    def _deliver(self, pool, entry_id, meta):
+        try:
+            pool.sendmail(meta["sender"], meta["receivers"], _SpooledData(self._path("queue", entry_id, ".eml")))
+        except Exception as e:
+            self._failed(entry_id, meta, e)
+            return False
+        self._sent(entry_id, meta)
+        return True
+
+    def drain(self, mail, concurrency=4, batch=100):
+        """
+        send the messages due now by the sessions of the mail, concurrency at once, up to batch messages.
+        return how many are sent
+        """
+        claimed = self._claim(batch)
+        if not claimed:
+            return 0
+        pool = mail._pool
+        if pool is None:
+            pool = SMTPPool(mail._get_smtp_server, concurrency)
+        try:
+            with ThreadPoolExecutor(concurrency, thread_name_prefix="mail-spool") as executor:
+                return sum(executor.map(lambda entry: self._deliver(pool, *entry), claimed))
+        finally:
+            if pool is not mail._pool:
+                pool.close()
+
+    def recover(self, older_than=600.0):
+        """
+        put back the messages claimed before older_than seconds ago, their process died while sending.
+        such a message may be sent twice, the spool delivers at least once.
+        """
+        queue_dir, now = os.path.join(self.directory, "queue"), time.time()
+        for name in os.listdir(queue_dir):
+            if not name.endswith(".sending"):
+                continue
+            path = os.path.join(queue_dir, name)
+            try:
+                if now - os.path.getmtime(path) > older_than:
+                    os.rename(path, path[:-len(".sending")] + ".json")
+            except FileNotFoundError:
+                # sent or recovered by another process.
+                continue
+
+    def prune(self):
+        """remove the records of the messages sent before keep_sent seconds ago. """
+        sent_dir, now = os.path.join(self.directory, "sent"), time.time()
+        for name in os.listdir(sent_dir):
+            path = os.path.join(sent_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.keep_sent:
+                    os.remove(path)
+            except FileNotFoundError:
+                # pruned by another process.
+                continue
+
+    def counts(self):
+        """{"queued": n, "sending": n, "sent": n, "dead": n} """
+        queue_names = os.listdir(os.path.join(self.directory, "queue"))
+        return {
+            "queued": sum(name.endswith(".json") for name in queue_names),
+            "sending": sum(name.endswith(".sending") for name in queue_names),
+            "sent": sum(name.endswith(".json") for name in os.listdir(os.path.join(self.directory, "sent"))),
+            "dead": sum(name.endswith(".json") for name in os.listdir(os.path.join(self.directory, "dead"))),
+        }
+
+
+# 后台线程，每隔 interval 秒发送发件队列中到期的邮件
+class MailSpoolWorker(object):
+    def __init__(self, mail, spool=None, concurrency=4, interval=5.0):
+        """
+        spool: the spool to drain, the spool of the mail by default
+        """
+        self.mail = mail
+        self.spool = spool or mail._spool
+        if self.spool is None:
+            raise RuntimeError("the worker needs a spool. ")
+        self.concurrency = concurrency
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        """send the messages due now, return how many are sent. """
+        sent = 0
+        while True:
+            count = self.spool.drain(self.mail, self.concurrency)
+            sent += count
+            if not count or self._stopped.is_set():
+                return sent
+
+    def _run(self):
+        try:
+            self.spool.recover()
+        except Exception:
+            logger.exception("recover the mail spool %s failed", self.spool.directory)
+        while not self._stopped.is_set():
+            try:
+                self.run_once()
+                self.spool.prune()
+            except Exception:
+                logger.exception("drain the mail spool %s failed", self.spool.directory)
+            self._stopped.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mail-spool-worker")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """stop after the messages being sent. """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc, value, traceback):
+        self.stop()
@@ -1,22 +1,26 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, List, Optional
 
-from jinja2 import Environment, FileSystemLoader
-
-from pyanalysis.mail import HtmlContent
 from pyanalysis.mail_templates._styles import COLORS, STYLES, ICONS, FONT_FAMILY
 
+if TYPE_CHECKING:
+    from jinja2 import Environment
+
+    from pyanalysis.mail import HtmlContent
+
 __all__ = ["BaseTemplate"]
 
-# Singleton Jinja2 environment (lazy loaded)
-_jinja_env: Optional[Environment] = None
+# Singleton Jinja2 environment (lazy loaded, jinja2 is imported on the first render)
+_jinja_env: Optional["Environment"] = None
 
 
-def _get_jinja_env() -> Environment:
+def _get_jinja_env() -> "Environment":
     """Get or create the singleton Jinja2 environment."""
     global _jinja_env
     if _jinja_env is None:
+        from jinja2 import Environment, FileSystemLoader
+
         template_dir = Path(__file__).parent / "_html"
         _jinja_env = Environment(
             loader=FileSystemLoader(str(template_dir)),
@@ -86,7 +90,7 @@ class BaseTemplate(ABC):
 
         return template.render(**context)
 
-    def to_html(self) -> HtmlContent:
+    def to_html(self) -> "HtmlContent":
         """Render the template and wrap in HtmlContent.
 
         Returns:
@@ -97,4 +101,20 @@ class BaseTemplate(ABC):
             mail.attach(template.to_html())
             mail.send("Subject", ["receiver@example.com"])
         """
+        from pyanalysis.mail import HtmlContent
+
         return HtmlContent(self.render())
+
+    def to_parts(self, **policy) -> List:
+        """Render the template to the MIME parts Mail attaches for it.
+
+        Mail calls it for the templates passed as attachments or parts.
+
+        Args:
+            **policy: Mail-wide defaults for the subclasses that support them,
+                e.g. max_inline_rows of TableTemplate; ignored here.
+
+        Returns:
+            The list of MIME parts, [HtmlContent] by default.
+        """
+        return [self.to_html()]
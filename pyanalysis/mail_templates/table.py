@@ -1,3 +1,4 @@
+import copy
 from typing import Optional, List, Set, Dict, Any
 
 from pyanalysis.mail_templates.base import BaseTemplate
@@ -20,6 +21,16 @@ class TableTemplate(BaseTemplate):
         footer_text: Optional footer text.
         custom_styles: Optional additional inline CSS.
         locale: Language locale (default: "zh-CN").
+        max_inline_rows: Optional limit of the rows shown in the email. Above it
+            to_parts() shows only the first rows and attaches all the rows as a
+            compressed CSV; render() and to_html() always show all the rows.
+        max_inline_bytes: Optional limit of the UTF-8 size of the cells shown
+            in the email, works like max_inline_rows.
+        attachment_name: Name of the CSV attachment (default: title + ".csv").
+        compression: "gzip" (default) or "zip" for the CSV attachment.
+
+    Raises:
+        RuntimeError: If compression is neither "gzip" nor "zip".
 
     Example:
         template = TableTemplate(
@@ -36,6 +47,8 @@ class TableTemplate(BaseTemplate):
     """
 
     _template_name = "table.html"
+    # set on the copy to_parts() renders, which attaches the rows left out
+    _truncate = False
 
     def __init__(
         self,
@@ -48,7 +61,13 @@ class TableTemplate(BaseTemplate):
         footer_text: Optional[str] = None,
         custom_styles: Optional[str] = None,
         locale: str = "zh-CN",
+        max_inline_rows: Optional[int] = None,
+        max_inline_bytes: Optional[int] = None,
+        attachment_name: Optional[str] = None,
+        compression: str = "gzip",
     ):
+        if compression not in ("gzip", "zip"):
+            raise RuntimeError("the compression must be gzip or zip. ")
         super().__init__(footer_text, custom_styles, locale)
         self._title = title
         self._headers = headers
@@ -56,17 +75,82 @@ class TableTemplate(BaseTemplate):
         self._summary = summary
         self._highlight_rows = highlight_rows or set()
         self._show_row_numbers = show_row_numbers
+        self._max_inline_rows = max_inline_rows
+        self._max_inline_bytes = max_inline_bytes
+        self._attachment_name = attachment_name
+        self._compression = compression
+
+    @property
+    def attachment_name(self) -> str:
+        """Name of the CSV attachment, without the compression suffix."""
+        name = self._attachment_name or self._title.replace("/", "_").replace("\\", "_") + ".csv"
+        return name
+
+    def _inline_count(self) -> int:
+        """How many rows are shown in the email."""
+        count = len(self._rows)
+        if self._max_inline_rows is not None:
+            count = min(count, self._max_inline_rows)
+        if self._max_inline_bytes is not None:
+            size = 0
+            for i in range(count):
+                size += sum(len(str(cell).encode("utf-8")) for cell in self._rows[i])
+                if size > self._max_inline_bytes:
+                    return i
+        return count
+
+    def _inline_note(self, shown: int) -> str:
+        name = self.attachment_name + (".gz" if self._compression == "gzip" else ".zip")
+        if self._locale.startswith("zh"):
+            return "仅显示前 {} 行，共 {} 行，完整数据见附件 {}".format(shown, len(self._rows), name)
+        return "Showing the first {} of {} rows, the full data is in the attachment {}".format(
+            shown, len(self._rows), name)
 
     def _get_template_context(self) -> dict:
+        shown = self._inline_count() if self._truncate else len(self._rows)
         return {
             "title": self._title,
             "headers": self._headers,
-            "rows": self._rows,
+            "rows": self._rows[:shown] if shown < len(self._rows) else self._rows,
             "summary": self._summary,
             "highlight_rows": self._highlight_rows,
             "show_row_numbers": self._show_row_numbers,
+            "inline_note": self._inline_note(shown) if shown < len(self._rows) else None,
         }
 
+    def to_parts(
+        self,
+        max_inline_rows: Optional[int] = None,
+        max_inline_bytes: Optional[int] = None,
+        **policy,
+    ) -> List:
+        """Render the table, and attach all the rows when some are not shown.
+
+        Args:
+            max_inline_rows: Default for a template created without
+                max_inline_rows, usually from Mail.
+            max_inline_bytes: Default for a template created without
+                max_inline_bytes, usually from Mail.
+
+        Returns:
+            [HtmlContent], plus a CompressedAttach of the rows as CSV when the
+            limits leave some rows out of the email.
+        """
+        from pyanalysis.mail import CompressedAttach
+
+        template = copy.copy(self)
+        template._truncate = True
+        if template._max_inline_rows is None:
+            template._max_inline_rows = max_inline_rows
+        if template._max_inline_bytes is None:
+            template._max_inline_bytes = max_inline_bytes
+
+        parts = [template.to_html()]
+        if template._inline_count() < len(self._rows):
+            parts.append(CompressedAttach.from_rows(
+                self._headers, self._rows, self.attachment_name, self._compression))
+        return parts
+
     @classmethod
     def from_dicts(
         cls,
@@ -79,6 +163,10 @@ class TableTemplate(BaseTemplate):
         footer_text: Optional[str] = None,
         custom_styles: Optional[str] = None,
         locale: str = "zh-CN",
+        max_inline_rows: Optional[int] = None,
+        max_inline_bytes: Optional[int] = None,
+        attachment_name: Optional[str] = None,
+        compression: str = "gzip",
     ) -> "TableTemplate":
         """Create a TableTemplate from a list of dictionaries.
 
@@ -93,6 +181,10 @@ class TableTemplate(BaseTemplate):
             footer_text: Optional footer text.
             custom_styles: Optional additional inline CSS.
             locale: Language locale.
+            max_inline_rows: Optional limit of the rows shown in the email.
+            max_inline_bytes: Optional limit of the size of the cells shown.
+            attachment_name: Name of the CSV attachment of all the rows.
+            compression: "gzip" or "zip" for the CSV attachment.
 
         Returns:
             A configured TableTemplate instance.
@@ -118,6 +210,10 @@ class TableTemplate(BaseTemplate):
                 footer_text=footer_text,
                 custom_styles=custom_styles,
                 locale=locale,
+                max_inline_rows=max_inline_rows,
+                max_inline_bytes=max_inline_bytes,
+                attachment_name=attachment_name,
+                compression=compression,
             )
 
         if columns is None:
@@ -136,4 +232,8 @@ class TableTemplate(BaseTemplate):
             footer_text=footer_text,
             custom_styles=custom_styles,
             locale=locale,
+            max_inline_rows=max_inline_rows,
+            max_inline_bytes=max_inline_bytes,
+            attachment_name=attachment_name,
+            compression=compression,
         )
@@ -1,35 +1,663 @@
-import arrow
+import sys
+import bisect
+import datetime
+import functools
 
-__all__ = ["moment"]
+from array import array
 
+__all__ = [  # noqa: F822, moment is imported on first use by __getattr__
+    "moment",
+    "convert_timestamps",
+    "timestamps_to_datetimes",
+    "datetimes_to_timestamps",
+    "format_timestamps",
+    "parse_timestamps",
+    "bucket_timestamps",
+    "time_windows",
+    "ZoneOffsets",
+    "get_zone_offsets",
+    "Instant",
+]
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_UTC = _EPOCH.replace(tzinfo=datetime.timezone.utc)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_SECOND = datetime.timedelta(seconds=1)
+
+# Moment、MomentFactory 与 moment 依赖 arrow，第一次使用时才导入 pyanalysis._moment
+_ARROW_NAMES = ("Moment", "MomentFactory", "moment")
+
+
+def __getattr__(name):
+    if name not in _ARROW_NAMES:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    from pyanalysis import _moment
+    value = globals()[name] = getattr(_moment, name)
+    return value
+
+
+def _is_arrow(value):
+    """whether the value is an Arrow, without importing arrow: none exists before arrow is imported. """
+    arrow = sys.modules.get("arrow")
+    return arrow is not None and isinstance(value, arrow.Arrow)
+
+
+# 时区：名字解析与 ZoneOffsets 都有上限的缓存，批量转换只需二分查找加整数加法
+
+# datetime 能表示的 epoch 秒范围
+_MIN_SECONDS = (datetime.datetime.min - _EPOCH) // _SECOND
+_MAX_SECONDS = (datetime.datetime.max - _EPOCH) // _SECOND
+
+# 按 2^25 秒（约 388 天）为一段计算时区的切换点
+_CHUNK_BITS = 25
+
+
+@functools.lru_cache(128)
+def _parse_tz(name):
+    from arrow.parser import TzinfoParser
+    return TzinfoParser.parse(name)
+
+
+def _get_tz(tz):
+    """None means UTC, the names are parsed the same way as arrow. """
+    if tz is None:
+        return datetime.timezone.utc
+    if isinstance(tz, datetime.tzinfo):
+        return tz
+    if tz == "local":
+        # the local zone may change at runtime, never cached.
+        from arrow.parser import TzinfoParser
+        return TzinfoParser.parse(tz)
+    return _parse_tz(tz)
+
+
+def _fixed_offset(tz):
+    """the utc offset in seconds of a zone without transitions, None for the other zones. """
+    if isinstance(tz, datetime.timezone):
+        return tz.utcoffset(None) // _SECOND
+    # the zones of dateutil exist only after it is imported.
+    dateutil_tz = sys.modules.get("dateutil.tz")
+    if dateutil_tz is not None and isinstance(tz, (dateutil_tz.tzutc, dateutil_tz.tzoffset)):
+        return tz.utcoffset(None) // _SECOND
+    return None
+
+
+class ZoneOffsets(object):
+    """
+    The utc offsets of a zone, the transitions are kept in sorted arrays and computed lazily by chunks of
+    about a year, so converting a batch of epoch seconds needs only a binary search and an integer addition.
+    The transitions are found by sampling the offset daily, two transitions within one day are missed.
+    Use get_zone_offsets() to share the instances.
+    """
+
+    def __init__(self, tz=None):
+        self.tzinfo = _get_tz(tz)
+        self.fixed_offset = _fixed_offset(self.tzinfo)
+        # offsets[i] is the offset after starts[i - 1], offsets[0] is the offset at the start of the range.
+        # local_starts[i] is the first wall time using offsets[i + 1], the ambiguous and missing times take fold=0.
+        self._table = (array("q"), array("q", [self.fixed_offset or 0]), array("q"))
+        self._chunks = None
+
+    def __repr__(self):
+        return "<ZoneOffsets {}>".format(self.tzinfo)
+
+    def _offset(self, seconds):
+        return datetime.datetime.fromtimestamp(seconds, self.tzinfo).utcoffset() // _SECOND
+
+    def _scan(self, lo, hi):
+        """the transitions in [lo, hi) as (seconds, offset after), and the offset at lo. """
+        lo, hi = max(lo, _MIN_SECONDS + 86400), min(hi, _MAX_SECONDS - 86400)
+        first = current = self._offset(lo)
+        transitions = []
+        for day in range(lo, hi, 86400):
+            end = min(day + 86400, hi)
+            offset = self._offset(end)
+            if offset == current:
+                continue
+            start = day
+            while end - start > 1:
+                middle = (start + end) // 2
+                if self._offset(middle) == current:
+                    start = middle
+                else:
+                    end = middle
+            transitions.append((end, offset))
+            current = offset
+        return first, transitions
+
+    def cover(self, lo, hi):
+        """make sure the transitions between the epoch seconds lo and hi are computed. """
+        if self.fixed_offset is not None:
+            return
+        first, last = lo >> _CHUNK_BITS, (hi >> _CHUNK_BITS) + 1
+        chunks = self._chunks
+        if chunks is not None and chunks[0] <= first and last <= chunks[1]:
+            return
+        if chunks is not None:
+            first, last = min(first, chunks[0]), max(last, chunks[1])
+        offset, transitions = self._scan(first << _CHUNK_BITS, last << _CHUNK_BITS)
+        starts, offsets, local_starts = array("q"), array("q", [offset]), array("q")
+        for seconds, offset in transitions:
+            local_starts.append(seconds + max(offsets[-1], offset))
+            starts.append(seconds)
+            offsets.append(offset)
+        # replaced at once, the readers always see a consistent table.
+        self._table = (starts, offsets, local_starts)
+        self._chunks = (first, last)
+
+    def transitions(self, lo, hi):
+        """the (epoch seconds, offset after) of the transitions in [lo, hi). """
+        self.cover(lo, hi)
+        starts, offsets, _ = self._table
+        return [(start, offsets[i + 1]) for i, start in enumerate(starts) if lo <= start < hi]
+
+    def utc_offset(self, seconds):
+        """the utc offset in seconds at the epoch seconds. """
+        if self.fixed_offset is not None:
+            return self.fixed_offset
+        self.cover(seconds, seconds)
+        starts, offsets, _ = self._table
+        return offsets[bisect.bisect_right(starts, seconds)]
+
+    def local_offset(self, seconds):
+        """the utc offset in seconds at the wall time given as epoch seconds. """
+        if self.fixed_offset is not None:
+            return self.fixed_offset
+        self.cover(seconds - 86400, seconds + 86400)
+        _, offsets, local_starts = self._table
+        return offsets[bisect.bisect_right(local_starts, seconds)]
+
+    def _offsets(self, seconds_list, local):
+        if self.fixed_offset is not None:
+            return [self.fixed_offset] * len(seconds_list)
+        if not seconds_list:
+            return []
+        self.cover(min(seconds_list) - 86400, max(seconds_list) + 86400)
+        _, offsets, local_starts = self._table
+        starts = local_starts if local else self._table[0]
+        result = []
+        append = result.append
+        lo = hi = offset = 0
+        for seconds in seconds_list:
+            # the consecutive values between two transitions reuse the offset.
+            if not lo <= seconds < hi:
+                i = bisect.bisect_right(starts, seconds)
+                offset = offsets[i]
+                lo = starts[i - 1] if i else _MIN_SECONDS
+                hi = starts[i] if i < len(starts) else _MAX_SECONDS
+            append(offset)
+        return result
+
+    def utc_offsets(self, seconds_list):
+        """the utc offsets at a list of epoch seconds. """
+        return self._offsets(seconds_list, False)
+
+    def local_offsets(self, seconds_list):
+        """the utc offsets at a list of wall times given as epoch seconds. """
+        return self._offsets(seconds_list, True)
+
+    def to_local(self, seconds_list):
+        """convert epoch seconds to wall times given as epoch seconds. """
+        return [seconds + offset for seconds, offset in zip(seconds_list, self.utc_offsets(seconds_list))]
+
+    def to_utc(self, seconds_list):
+        """convert wall times given as epoch seconds to epoch seconds. """
+        return [seconds - offset for seconds, offset in zip(seconds_list, self.local_offsets(seconds_list))]
+
+
+@functools.lru_cache(64)
+def _zone_offsets(tz):
+    return ZoneOffsets(tz)
+
+
+def get_zone_offsets(tz=None):
+    """the shared ZoneOffsets of tz(a name or tzinfo, default UTC), the last 64 zones are kept. """
+    return _zone_offsets(_get_tz(tz))
+
+
+# 批量转换：整列的时间戳一次处理，不为每个值创建 Moment
+
+# 每个单位包含的微秒数
+_UNITS = {"s": 1000000, "ms": 1000, "us": 1}
+
+DEFAULT_FORMAT = "%Y-%m-%d %H:%M:%S"
+_DATE_FORMAT = "%Y-%m-%d"
+
+
+def _unit_scale(unit):
+    if unit not in _UNITS:
+        raise RuntimeError("the unit must be one of {}, got {}. ".format(", ".join(_UNITS), unit))
+    return _UNITS[unit]
+
+
+def _numpy_of(values):
+    """the numpy module if values is a numpy array, numpy is never imported here. """
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        return numpy
+    return None
+
+
+def _same_container(values, result):
+    """return the int result in the container type of values: array, numpy array or list. """
+    if isinstance(values, array):
+        return array("q", result)
+    numpy = _numpy_of(values)
+    if numpy is not None:
+        return numpy.array(result, dtype="int64")
+    return result
+
+
+def _to_micros(values, unit):
+    """the epoch microseconds of values as a list of int, the floats are rounded to microseconds. """
+    scale = _unit_scale(unit)
+    if float in set(map(type, values)):
+        return [round(value * scale) for value in values]
+    if scale == 1:
+        return values if isinstance(values, list) else list(values)
+    return [value * scale for value in values]
+
+
+def _to_seconds(values, unit):
+    """the epoch seconds of values rounded down, as a list of int or values itself. """
+    scale = _unit_scale(unit)
+    if float in set(map(type, values)):
+        return [round(value * scale) // 1000000 for value in values]
+    if scale == 1000000:
+        return values
+    factor = 1000000 // scale
+    return [value // factor for value in values]
+
+
+def convert_timestamps(values, from_unit="ms", to_unit="s"):
+    """
+    convert epoch timestamps between "s", "ms" and "us", the result is int and rounded down.
+    values: a list, array or numpy array, the result is the same type
+    """
+    scale_from, scale_to = _unit_scale(from_unit), _unit_scale(to_unit)
+    numpy = _numpy_of(values)
+    if numpy is not None:
+        if values.dtype.kind == "f":
+            return numpy.round(values * scale_from).astype("int64") // scale_to
+        values = values.astype("int64", copy=False)
+        if scale_from >= scale_to:
+            return values * (scale_from // scale_to)
+        return values // (scale_to // scale_from)
+
+    if float in set(map(type, values)):
+        result = [round(value * scale_from) // scale_to for value in values]
+    elif scale_from >= scale_to:
+        factor = scale_from // scale_to
+        result = [value * factor for value in values]
+    else:
+        factor = scale_to // scale_from
+        result = [value // factor for value in values]
+    return _same_container(values, result)
+
+
+def timestamps_to_datetimes(values, unit="s", tz=None):
+    """
+    convert epoch timestamps to aware datetimes in tz(default UTC).
+    A numpy array gives a numpy datetime64[us] array of the wall time in tz.
+    """
+    tz = _get_tz(tz)
+    numpy = _numpy_of(values)
+    if numpy is not None:
+        micros = convert_timestamps(values, unit, "us")
+        zone = get_zone_offsets(tz)
+        if zone.fixed_offset is not None:
+            offsets = zone.fixed_offset
+        else:
+            offsets = numpy.array(zone.utc_offsets((micros // 1000000).tolist()), dtype="int64")
+        return (micros + offsets * 1000000).astype("datetime64[us]")
+
+    timedelta = datetime.timedelta
+    if tz is datetime.timezone.utc:
+        return [_EPOCH_UTC + timedelta(microseconds=value) for value in _to_micros(values, unit)]
+    return [(_EPOCH_UTC + timedelta(microseconds=value)).astimezone(tz) for value in _to_micros(values, unit)]
+
+
+def datetimes_to_timestamps(values, unit="s", tz=None):
+    """
+    convert datetimes to epoch timestamps, the naive datetimes are taken as the wall time in tz(default UTC).
+    A numpy datetime64 array is taken as the wall time in UTC, the result is the same type as values.
+    """
+    scale = _unit_scale(unit)
+    numpy = _numpy_of(values)
+    if numpy is not None and values.dtype.kind == "M":
+        return values.astype("datetime64[us]").astype("int64") // scale
+
+    tz = _get_tz(tz)
+    offset = _fixed_offset(tz)
+    naive_shift = 0 if offset is None else offset * 1000000
+    result = []
+    append = result.append
+    for dt in values.tolist() if numpy is not None else values:
+        if dt.tzinfo is None and offset is not None:
+            delta, shift = dt - _EPOCH, naive_shift
+        else:
+            delta, shift = (dt if dt.tzinfo is not None else dt.replace(tzinfo=tz)) - _EPOCH_UTC, 0
+        append((delta.days * 86400000000 + delta.seconds * 1000000 + delta.microseconds - shift) // scale)
+    return _same_container(values, result)
+
+
+@functools.lru_cache(1)
+def _times_of_day():
+    """"HH:MM:SS" of every second of a day, built once. """
+    return ["%02d:%02d:%02d" % (second // 3600, second // 60 % 60, second % 60) for second in range(86400)]
+
+
+def _format_fast(seconds_list, zone, with_time):
+    """format the epoch seconds as "%Y-%m-%d %H:%M:%S" or "%Y-%m-%d", the date part is built once per day. """
+    times = _times_of_day() if with_time else None
+    dates = {}
+    fromordinal = datetime.date.fromordinal
+    result = []
+    append = result.append
+    for local in zone.to_local(seconds_list):
+        days, rest = divmod(local, 86400)
+        date = dates.get(days)
+        if date is None:
+            date = dates[days] = fromordinal(days + _EPOCH_ORDINAL).strftime("%Y-%m-%d " if with_time else _DATE_FORMAT)
+        append(date + times[rest] if with_time else date)
+    return result
+
+
+def format_timestamps(values, fmt=DEFAULT_FORMAT, unit="s", tz=None):
+    """
+    format epoch timestamps with a strftime format in tz(default UTC), return a list of str.
+    The default format and "%Y-%m-%d" skip creating datetimes.
+    """
+    tz = _get_tz(tz)
+    if _numpy_of(values) is not None:
+        values = values.tolist()
+
+    if fmt in (DEFAULT_FORMAT, _DATE_FORMAT):
+        return _format_fast(_to_seconds(values, unit), get_zone_offsets(tz), fmt == DEFAULT_FORMAT)
+
+    return [dt.strftime(fmt) for dt in timestamps_to_datetimes(values, unit, tz)]
+
+
+def _parse_day(value):
+    """the epoch seconds at the start of the date of "%Y-%m-%d ...". """
+    if value[4] != "-" or value[7] != "-":
+        raise ValueError("time data {!r} does not match format {!r}".format(value, DEFAULT_FORMAT))
+    date = datetime.date(int(value[:4]), int(value[5:7]), int(value[8:10]))
+    return (date.toordinal() - _EPOCH_ORDINAL) * 86400
+
+
+def _parse_time(value):
+    """the seconds of the time of "... %H:%M:%S" since the start of the day. """
+    hour, minute, second = int(value[11:13]), int(value[14:16]), int(value[17:19])
+    if value[10] not in " T" or value[13] != ":" or value[16] != ":" or hour > 23 or minute > 59 or second > 59:
+        raise ValueError("time data {!r} does not match format {!r}".format(value, DEFAULT_FORMAT))
+    return hour * 3600 + minute * 60 + second
+
+
+def _parse_fast(values, zone):
+    """parse "%Y-%m-%d %H:%M:%S"(or with a "T") to epoch seconds, the dates and times are parsed once each. """
+    days_of = {}
+    times_of = {}
+    result = []
+    append = result.append
+    for value in values:
+        day = days_of.get(value[:10])
+        time = times_of.get(value[10:])
+        if day is None or time is None:
+            if len(value) != 19:
+                raise ValueError("time data {!r} does not match format {!r}".format(value, DEFAULT_FORMAT))
+            day = days_of[value[:10]] = _parse_day(value)
+            time = times_of[value[10:]] = _parse_time(value)
+        append(day + time)
+    return zone.to_utc(result)
+
+
+def parse_timestamps(values, fmt=DEFAULT_FORMAT, unit="s", tz=None):
+    """
+    parse strings with a strftime format to epoch timestamps, the wall time is taken in tz(default UTC)
+    unless the format has %z. A numpy array gives a numpy array, others give a list.
+    """
+    tz = _get_tz(tz)
+    numpy = _numpy_of(values)
+    strings = values.tolist() if numpy is not None else values
+
+    if fmt == DEFAULT_FORMAT:
+        scale = _unit_scale(unit)
+        factor = 1000000 // scale
+        result = _parse_fast(strings, get_zone_offsets(tz))
+        if factor != 1:
+            result = [seconds * factor for seconds in result]
+    else:
+        strptime = datetime.datetime.strptime
+        result = datetimes_to_timestamps([strptime(value, fmt) for value in strings], unit, tz)
+
+    if numpy is not None:
+        return numpy.array(result, dtype="int64")
+    return result
+
+
+# 时间分桶：按时区内的分钟、小时、天、周、月把时间戳映射到所在时间段的起点
+
+_BUCKET_SECONDS = {"minute": 60, "hour": 3600, "day": 86400, "week": 604800, "month": None}
+
+
+def _bucket_size(unit, step):
+    if unit not in _BUCKET_SECONDS:
+        raise RuntimeError("the unit must be one of {}, got {}. ".format(", ".join(_BUCKET_SECONDS), unit))
+    if not isinstance(step, int) or step < 1:
+        raise RuntimeError("the step must be a positive int, got {}. ".format(step))
+    return _BUCKET_SECONDS[unit] and _BUCKET_SECONDS[unit] * step
+
+
+def _bucket_day(days, unit, step):
+    """the first day(days since epoch) of the day, week or month bucket of the day. """
+    if unit == "day":
+        return days - days % step
+    if unit == "week":
+        # the weeks start on Monday, 1969-12-29 is the Monday before the epoch.
+        return (days + 3) // (7 * step) * 7 * step - 3
+    date = datetime.date.fromordinal(days + _EPOCH_ORDINAL)
+    month = (date.year * 12 + date.month - 1) // step * step
+    return datetime.date(month // 12, month % 12 + 1, 1).toordinal() - _EPOCH_ORDINAL
+
+
+def _bucket_seconds(seconds_list, unit, step, zone):
+    size = _bucket_size(unit, step)
+    offsets = zone.utc_offsets(seconds_list)
+
+    if unit in ("minute", "hour"):
+        # keep the offset of the value, so the repeated hour of daylight saving is a bucket of its own.
+        return [seconds - (seconds + offset) % size for seconds, offset in zip(seconds_list, offsets)]
+
+    # the day, week and month buckets start at the local midnight, the first one if it is repeated.
+    starts = {}
+    result = []
+    append = result.append
+    for seconds, offset in zip(seconds_list, offsets):
+        days = (seconds + offset) // 86400
+        start = starts.get(days)
+        if start is None:
+            local = _bucket_day(days, unit, step) * 86400
+            start = starts[days] = local - zone.local_offset(local)
+        append(start)
+    return result
+
+
+def bucket_timestamps(values, unit="day", tz=None, step=1, ts_unit="s"):
+    """
+    map epoch timestamps to the start of their bucket in tz(default UTC), in one pass of integer math.
+    unit: "minute", "hour", "day", "week"(starts on Monday) or "month"
+    step: the number of units in a bucket, the buckets are aligned to the epoch(to year 0 for months)
+    ts_unit: the unit of values and of the result, "s", "ms" or "us"
+    The result is the same type as values, the day, week and month buckets follow daylight saving.
+    """
+    numpy = _numpy_of(values)
+    seconds_list = _to_seconds(values.tolist() if numpy is not None else values, ts_unit)
+    result = _bucket_seconds(seconds_list, unit, step, get_zone_offsets(tz))
+    factor = 1000000 // _unit_scale(ts_unit)
+    if factor != 1:
+        result = [start * factor for start in result]
+    return _same_container(values, result)
+
+
+def _next_bucket(start, unit, step, zone):
+    """the start of the bucket after the one starting at start. """
+    if unit in ("minute", "hour"):
+        return _bucket_seconds([start + _bucket_size(unit, step)], unit, step, zone)[0]
+
+    days = (start + zone.utc_offset(start)) // 86400
+    if unit == "day":
+        days += step
+    elif unit == "week":
+        days += 7 * step
+    else:
+        date = datetime.date.fromordinal(days + _EPOCH_ORDINAL)
+        month = date.year * 12 + date.month - 1 + step
+        days = datetime.date(month // 12, month % 12 + 1, 1).toordinal() - _EPOCH_ORDINAL
+    return days * 86400 - zone.local_offset(days * 86400)
+
+
+def _instant_seconds(value, tz):
+    """the epoch seconds of a Moment, datetime(naive in tz), epoch timestamp or string(wall time in tz). """
+    if _is_arrow(value):
+        value = value.datetime
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=tz)
+        return (value - _EPOCH_UTC) // _SECOND
+    from pyanalysis._moment import moment
+    return moment.get(value, tzinfo=tz).second_timestamp
+
+
+def time_windows(start, end, unit="day", tz=None, step=1, fmt=None):
+    """
+    yield the (start, end) of every bucket of bucket_timestamps overlapping [start, end), for the
+    "WHERE t >= start AND t < end" clauses.
+    start, end: a Moment, datetime(naive in tz), epoch timestamp or string(wall time in tz)
+    fmt: None yields Moment pairs in tz, a strftime format yields strings in tz
+    """
+    from pyanalysis._moment import Moment
+
+    tz = _get_tz(tz)
+    zone = get_zone_offsets(tz)
+    _bucket_size(unit, step)
+    end = _instant_seconds(end, tz)
+    current = _bucket_seconds([_instant_seconds(start, tz)], unit, step, zone)[0]
+    while current < end:
+        following = _next_bucket(current, unit, step, zone)
+        window = (Moment.from_micros(current * 1000000, tz), Moment.from_micros(following * 1000000, tz))
+        yield window if fmt is None else (window[0].strftime(fmt), window[1].strftime(fmt))
+        current = following
+
+
+# 轻量时间值：整数微秒加时区，需要格式化或日历计算时才转成 Moment
+
+class Instant(object):
+    """
+    A compact, immutable timestamp of int epoch microseconds and a tzinfo, a fraction of the memory of a Moment.
+    It compares and hashes by the instant like aware datetimes, the other attributes(format, floor, shift, year
+    and so on) are looked up on the Moment it converts to.
+    """
+
+    __slots__ = ("_micros", "_tz")
+
+    def __init__(self, micros, tz=None):
+        self._micros = micros
+        self._tz = _get_tz(tz)
+
+    @classmethod
+    def from_seconds(cls, seconds, tz=None):
+        return cls(seconds * 1000000, tz)
+
+    @classmethod
+    def from_millis(cls, millis, tz=None):
+        return cls(millis * 1000, tz)
+
+    @classmethod
+    def from_micros(cls, micros, tz=None):
+        return cls(micros, tz)
+
+    @classmethod
+    def of(cls, value):
+        """create from a Moment or an aware datetime, in its zone. """
+        if _is_arrow(value):
+            from pyanalysis._moment import Moment
+            if isinstance(value, Moment):
+                return cls(value.microsecond_timestamp, value.tzinfo)
+            value = value.datetime
+        if value.tzinfo is None:
+            raise RuntimeError("the datetime must be aware. ")
+        delta = value - _EPOCH_UTC
+        return cls((delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds, value.tzinfo)
+
+    @property
+    def tzinfo(self):
+        return self._tz
 
-class Moment(arrow.Arrow):
     @property
     def second_timestamp(self):
-        if isinstance(self.timestamp, int):
-            return int(self.timestamp)
-        return int(self.timestamp())
+        return self._micros // 1000000
 
-    # 毫秒
     @property
     def millisecond_timestamp(self):
-        if isinstance(self.timestamp, int):
-            return int(self.timestamp * 1000 + int(self.microsecond / 1000))
-        return int(self.timestamp() * 1000 + int(self.microsecond / 1000))
+        return self._micros // 1000
 
-    # 微妙
     @property
     def microsecond_timestamp(self):
-        if isinstance(self.timestamp, int):
-            return int(self.timestamp * 1000000 + self.microsecond)
-        return int(self.timestamp() * 1000000 + self.microsecond)
+        return self._micros
+
+    def to(self, tz):
+        """the same instant in another zone. """
+        return Instant(self._micros, tz)
+
+    def to_moment(self):
+        from pyanalysis._moment import Moment
+        return Moment.from_micros(self._micros, self._tz)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.to_moment(), name)
+
+    def __eq__(self, other):
+        if isinstance(other, Instant):
+            return self._micros == other._micros
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, Instant):
+            return self._micros != other._micros
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Instant):
+            return self._micros < other._micros
+        return NotImplemented
+
+    def __le__(self, other):
+        if isinstance(other, Instant):
+            return self._micros <= other._micros
+        return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, Instant):
+            return self._micros > other._micros
+        return NotImplemented
+
+    def __ge__(self, other):
+        if isinstance(other, Instant):
+            return self._micros >= other._micros
+        return NotImplemented
 
+    def __hash__(self):
+        return hash(self._micros)
 
-class MomentFactory(arrow.ArrowFactory):
-    def get(self, *args, **kwargs):
-        if args and isinstance(args[0], int) and len("{}".format(args[0])) == 13:
-            args = (args[0] * 1000 / 1000000.0,) + args[1:]
-        return super().get(*args, **kwargs)
+    def __reduce__(self):
+        return Instant, (self._micros, self._tz)
 
+    def __str__(self):
+        return self.to_moment().isoformat()
 
-moment = MomentFactory(Moment)
+    def __repr__(self):
+        return "<Instant [{}]>".format(self)
@@ -1,22 +1,49 @@
 import os
-import pymysql
+import re
+import time
+import zlib
 import warnings
 import queue
 import logging
 import threading
 import datetime
 import decimal
+import inspect
+import functools
+import collections
 
-from pymysql.cursors import SSDictCursor
-from pymysql.cursors import DictCursor
+from pyanalysis.resultset import ResultSet
+from pyanalysis.log_context import bind_log_context, reset_log_context
 
-__all__ = ["Pool", "Conn", "Trans"]
+__all__ = ["Pool", "Conn", "Trans", "CircuitBreaker", "PlanGuard"]
 __pool = {}
 
 # set the logger to show the debug or online log
-warnings.filterwarnings("error", category=pymysql.err.Warning)
 logger = logging.getLogger(__name__)
 
+# pymysql and the _Connection class are imported from pyanalysis._connection on first use, and then the
+# warnings of pymysql are raised as errors.
+_DRIVER_NAMES = ("pymysql", "SSCursor", "SSDictCursor", "DictCursor", "SERVER_STATUS", "_Connection")
+
+
+def __getattr__(name):
+    if name not in _DRIVER_NAMES:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = globals()[name] = getattr(_driver(), name)
+    return value
+
+
+def _driver():
+    """the module holding pymysql and the _Connection class, imported on first use. """
+    from pyanalysis import _connection
+    return _connection
+
+
+def _connect(*args, **kwargs):
+    """create a _Connection, the class is looked up on every call so it can be replaced. """
+    connection_class = globals().get("_Connection") or __getattr__("_Connection")
+    return connection_class(*args, **kwargs)
+
 
 # logger.addHandler(logging.NullHandler)
 
@@ -42,69 +69,292 @@ def no_warning(func):
     return wrapper
 
 
-class _Connection(pymysql.connections.Connection):
+# COM_RESET_CONNECTION, named COM_END in pymysql.constants.COMMAND, need MySQL 5.7.3+
+_COM_RESET_CONNECTION = 0x1F
+
+# client side errors(2xxx) and the server refusing or shutting down, all of them mean the server is unusable.
+_OUTAGE_ERROR_CODES = (1040, 1053)
+
+
+def _is_outage_error(e):
+    err = _driver().pymysql.err
+    if isinstance(e, err.InterfaceError):
+        return True
+    if isinstance(e, err.OperationalError) and e.args and isinstance(e.args[0], int):
+        return e.args[0] >= 2000 or e.args[0] in _OUTAGE_ERROR_CODES
+    return False
+
+
+class _LazyFingerprint(object):
+    """the sql_fingerprint() of a statement, computed when it is converted by str(), e.g. by JsonFormatter. """
+
+    __slots__ = ("sql",)
+
+    def __init__(self, sql):
+        self.sql = sql
+
+    def __str__(self):
+        return sql_fingerprint(self.sql)
+
+    def __repr__(self):
+        return repr(str(self))
+
+
+def _bind_query_context(pool, sql):
     """
-    Return a connection object with or without connection_pool feature.
-    This is all the same with pymysql.connections.Connection instance except that with connection_pool feature:
-        the __exit__() method additionally put the connection back to it's pool
+    the records logged during the query carry the pool and the sql fingerprint, see JsonFormatter. the fingerprint
+    is normalized only when a record is formatted
     """
-    _pool = None
-    _reusable_exception = (
-        pymysql.err.ProgrammingError,
-        pymysql.err.IntegrityError,
-        pymysql.err.NotSupportedError,
-    )
-
-    def __init__(self, *args, **kwargs):
-        pymysql.connections.Connection.__init__(self, *args, **kwargs)
-        self.args = args
-        self.kwargs = kwargs
-        self._last_use_datetime = datetime.datetime.now()
-
-    def __exit__(self, exc, value, traceback):
-        """
-        Overwrite the __exit__() method of pymysql.connections.Connection
-        Base action: on successful exit, commit. On exception, rollback
-        With pool additional action: put connection back to pool
-        """
-        pymysql.connections.Connection.__exit__(self, exc, value, traceback)
-        if self._pool:
-            if not exc or exc in self._reusable_exception:
-                """reusable connection. """
-                self._pool.put_connection(self)
-            else:
-                """no reusable connection, close it and create a new one then put it to the pool. """
-                self._pool.put_connection(self._recreate(*self.args, **self.kwargs))
-                self._pool = None
-                try:
-                    self.close()
-                    logger.warning("close not reusable connection from pool(%s) caused by %s", self._pool.name, value)
-                except Exception:
-                    pass
-
-    def _recreate(self, *args, **kwargs):
-        conn = _Connection(*args, **kwargs)
-        logger.debug("create new connection due to pool(%s) lacking", self._pool.name)
-        return conn
-
-    # if the connection idle too long, ping with reconnect the connection
-    def ping(self, reconnect=True):
-        expire_datetime = self._last_use_datetime + datetime.timedelta(days=1)
-        now = datetime.datetime.now()
-        if now > expire_datetime:
-            self._last_use_datetime = now
-            super().ping(reconnect=True)
+    return bind_log_context(pool=pool.name, sql_fingerprint=_LazyFingerprint(sql) if sql else None)
 
-    def close(self):
-        """
-        Overwrite the close() method of pymysql.connections.Connection
-        With pool, put connection back to pool;
-        Without pool, send the quit message and close the socket
-        """
-        if self._pool:
-            self._pool.put_connection(self)
-        else:
-            pymysql.connections.Connection.close(self)
+
+def _report_failure(conn, e):
+    """an outage error counts as a failure and closes the socket, the pool reconnects it when it is taken again. """
+    if not _is_outage_error(e):
+        return
+    if conn._conn is not None:
+        conn._conn._force_close()
+    conn._pool._on_failure(e)
+
+
+def track_failure(func):
+    """
+    Report the result of a query to the circuit breaker of the pool:
+    outage errors count as failures, any other result counts as a success
+    """
+    if inspect.isgeneratorfunction(func):
+        def gen_wrapper(self, *args, **kw):
+            try:
+                yield from func(self, *args, **kw)
+            except Exception as e:
+                _report_failure(self, e)
+                raise
+            self._pool._on_success()
+
+        return gen_wrapper
+
+    def wrapper(self, *args, **kw):
+        token = _bind_query_context(self._pool, args[0] if args else kw.get("sql")) if self._pool.log_context else None
+        try:
+            result = func(self, *args, **kw)
+        except Exception as e:
+            _report_failure(self, e)
+            raise
+        finally:
+            if token is not None:
+                reset_log_context(token)
+        self._pool._on_success()
+        return result
+
+    return wrapper
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker of a pool, it sheds the load when the db server is down.
+        closed: requests pass through, the consecutive failures are counted;
+        open: requests fail fast, until recovery_timeout seconds passed;
+        half_open: at most half_open_max_calls probe requests pass through,
+            one success closes the breaker, one failure opens it again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, recovery_timeout=10, half_open_max_calls=3):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow_request(self):
+        """return True if the request can go through, it never blocks. """
+        if self._state == self.CLOSED:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.OPEN:
+                if now - self._opened_at < self.recovery_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._opened_at = now
+                self._half_open_calls = 0
+
+            if self._state == self.HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    if now - self._opened_at < self.recovery_timeout:
+                        return False
+                    # the probes never report back, start a new round.
+                    self._opened_at = now
+                    self._half_open_calls = 0
+                self._half_open_calls += 1
+            return True
+
+    def record_success(self):
+        if self._state == self.CLOSED and self._failures == 0:
+            return
+
+        with self._lock:
+            # the success of a request that passed before the breaker opened proves nothing.
+            if self._state == self.OPEN:
+                return
+            self._state = self.CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+
+    def record_failure(self):
+        """return True if this failure opens the breaker. """
+        with self._lock:
+            if self._state == self.OPEN:
+                return False
+            if self._state == self.CLOSED:
+                self._failures += 1
+                if self._failures < self.failure_threshold:
+                    return False
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._half_open_calls = 0
+            return True
+
+
+_FINGERPRINT_PATTERNS = (
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), "?"),  # string literals
+    (re.compile(r'"(?:[^"\\]|\\.|"")*"'), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),  # numbers
+    (re.compile(r"%s"), "?"),  # placeholders
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?+)"),  # in lists
+    (re.compile(r"\s+"), " "),
+)
+_EXPLAINABLE_PATTERN = re.compile(r"^\s*\(?\s*(select|update|delete|replace|insert)\b", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def sql_fingerprint(sql):
+    """normalize the sql to a fingerprint, the literals and the placeholders are replaced by '?'. """
+    for pattern, repl in _FINGERPRINT_PATTERNS:
+        sql = pattern.sub(repl, sql)
+    return sql.strip().lower()
+
+
+class PlanGuard(object):
+    """
+    Sample the distinct statements(keyed by the fingerprint) of Conn, run EXPLAIN for them on a side connection
+    of the same pool and cache the plans, then report full table scans, filesorts and temporary tables whose
+    estimated rows reach row_threshold through the hook(a warning log by default).
+        sample_rate: the fraction of distinct statements to explain, the choice is stable for a fingerprint
+        row_threshold: the estimated rows from which a scan, filesort or temporary table is reported
+        ttl: seconds before a cached plan is explained again, so the plan regressions are caught
+        max_plans: how many plans can be cached
+        hook: called as hook(fingerprint, sql, plan, issues) when the plan has issues
+    The due EXPLAIN runs inline, in the thread of the query that triggered it, so that one query pays a round trip
+    on the side connection; the others pay a dict lookup. A failed EXPLAIN or hook is logged, it never fails the
+    query.
+    """
+
+    def __init__(self, sample_rate=0.1, row_threshold=10000, ttl=3600, max_plans=1024, hook=None):
+        self.sample_rate = sample_rate
+        self.row_threshold = row_threshold
+        self.ttl = ttl
+        self.max_plans = max_plans
+        self.hook = hook if hook else self._log
+        self._plans = collections.OrderedDict()  # fingerprint -> (explained_at, plan, issues)
+        self._lock = threading.Lock()
+
+    def sampled(self, fingerprint):
+        return zlib.crc32(fingerprint.encode("utf-8")) % 10000 < self.sample_rate * 10000
+
+    def get_plan(self, sql):
+        """return the cached (plan, issues) of the sql, or None. """
+        item = self._plans.get(sql_fingerprint(sql))
+        if item is None or item[1] is None:
+            return None
+        return item[1], item[2]
+
+    def observe(self, pool, sql, args=()):
+        """called by Conn after a statement executed, it costs nothing but a lookup unless the plan is due. """
+        try:
+            self._observe(pool, sql, args)
+        except Exception:
+            # the query itself succeeded, a plan check must never fail it.
+            logger.exception("check the query plan of [%s] error", sql)
+
+    def _observe(self, pool, sql, args):
+        if not _EXPLAINABLE_PATTERN.match(sql):
+            return
+        fingerprint = sql_fingerprint(sql)
+        if not self.sampled(fingerprint) or not self._claim(fingerprint):
+            return
+
+        try:
+            conn = pool.get_connection(timeout=0, retry_num=0)
+        except GetConnectionFromPoolError:
+            # no idle connection, never wait for it, try next time.
+            with self._lock:
+                self._plans.pop(fingerprint, None)
+            return
+
+        plan = None
+        try:
+            with conn.cursor(cursor=_driver().DictCursor) as cursor:
+                cursor.execute("EXPLAIN " + Conn._format_sql(sql), args)
+                plan = list(cursor.fetchall())
+        except Exception:
+            logger.exception("explain [%s] error", fingerprint)
+        finally:
+            pool.put_connection(conn)
+
+        issues = self.analyze(plan) if plan else []
+        with self._lock:
+            self._plans[fingerprint] = (time.monotonic(), plan, issues)
+        if issues:
+            self.hook(fingerprint, sql, plan, issues)
+
+    def analyze(self, plan):
+        """return the issues of the EXPLAIN rows. """
+        issues = []
+        for row in plan:
+            rows = int(row.get("rows") or 0)
+            if rows < self.row_threshold:
+                continue
+            table = row.get("table")
+            extra = row.get("Extra") or ""
+            if row.get("type") == "ALL":
+                issues.append("full table scan on {} ({} rows)".format(table, rows))
+            elif row.get("type") == "index":
+                issues.append("full index scan on {} ({} rows)".format(table, rows))
+            if "Using filesort" in extra:
+                issues.append("filesort on {} ({} rows)".format(table, rows))
+            if "Using temporary" in extra:
+                issues.append("temporary table on {} ({} rows)".format(table, rows))
+        return issues
+
+    def _claim(self, fingerprint):
+        """return True if the fingerprint should be explained now by the caller. """
+        now = time.monotonic()
+        with self._lock:
+            item = self._plans.get(fingerprint)
+            if item is not None and now - item[0] < self.ttl:
+                self._plans.move_to_end(fingerprint)
+                return False
+            # a placeholder, so the other threads skip it while explaining.
+            self._plans[fingerprint] = (now, None, [])
+            self._plans.move_to_end(fingerprint)
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+            return True
+
+    @staticmethod
+    def _log(fingerprint, sql, plan, issues):
+        logger.warning("query plan of [%s] has issues: %s", fingerprint, "; ".join(issues))
 
 
 class Pool:
@@ -115,10 +365,37 @@ class Pool:
     """
     _MAX_SIZE_LIMIT = 100
     _MIN_SIZE_LIMIT = 3
+    _RESET_MODES = ("rollback", "connection", "sql")
     _THREAD_LOCAL = threading.local()
     _RETRY_COUNTER = 0  # a counter used for debug get_connection() method
 
-    def __init__(self, size=5, name=None, *args, **kwargs):
+    def __init__(
+            self,
+            size=5,
+            name=None,
+            *args,
+            breaker=None,
+            reset_mode="rollback",
+            reset_sqls=None,
+            plan_guard=None,
+            log_context=False,
+            **kwargs
+    ):
+        """
+        breaker: a CircuitBreaker instance, None means never break
+        plan_guard: a PlanGuard instance used by the Conn of this pool, None means no plan check
+        log_context: whether the records logged during a query of Conn carry the pool name and the sql fingerprint
+            in the log context, see JsonFormatter. it costs a context switch per query, off by default
+        reset_mode: how to clean the session state when a connection is put back to the pool
+            rollback: rollback only if a transaction is open, and restore the changed autocommit
+            connection: send COM_RESET_CONNECTION to clear the whole session state, need MySQL 5.7.3+
+            sql: the rollback mode, then execute the statements of reset_sqls
+        """
+        if reset_mode not in self._RESET_MODES:
+            raise RuntimeError("the reset mode must in {}. ".format(", ".join(self._RESET_MODES)))
+        if reset_mode == "sql" and not reset_sqls:
+            raise RuntimeError("you must set the reset_sqls with the sql reset mode! ")
+
         if size > self._MAX_SIZE_LIMIT:
             size = self._MAX_SIZE_LIMIT
             logger.warning(
@@ -138,8 +415,19 @@ class Pool:
             [kwargs.get('host', 'localhost'), str(kwargs.get('port', 3306)),
              kwargs.get('user', ''), kwargs.get('database', '')])
 
+        self.breaker = breaker
+        self.plan_guard = plan_guard
+        self.log_context = log_context
+        self._reset_mode = reset_mode
+        self._reset_sqls = list(reset_sqls or ())
+        self._args = args
+        self._kwargs = kwargs
+        self._probe_lock = threading.Lock()
+        self._probe_thread = None
+        self._missing = 0  # connections dropped while the breaker is open
+
         for _ in range(size):
-            conn = _Connection(*args, **kwargs)
+            conn = _connect(*args, **kwargs)
             conn._pool = self
             self._pool.put(conn)
 
@@ -148,9 +436,22 @@ class Pool:
         timeout: timeout of get a connection from pool, should be a int(0 means return or raise immediately)
         retry_num: how many times will retry to get a connection
         """
+        if self.breaker is not None and not self.breaker.allow_request():
+            raise CircuitBreakerOpenError("circuit breaker of pool({}) is open".format(self.name))
+        return self._get_connection(timeout, retry_num)
+
+    def _get_connection(self, timeout, retry_num):
         try:
             conn = self._pool.get(timeout=timeout) if timeout > 0 else self._pool.get_nowait()
-            conn.ping()
+            try:
+                conn.ping()
+            except Exception as e:
+                # the connection stays in the pool closed, and reconnects when it is taken again.
+                conn._force_close()
+                self._pool.put_nowait(conn)
+                if _is_outage_error(e):
+                    self._on_failure(e)
+                raise
             logger.debug("get connection from pool(%s)", self.name)
             return conn
         except queue.Empty:
@@ -162,7 +463,7 @@ class Pool:
                     self._RETRY_COUNTER,
                 )
                 retry_num -= 1
-                return self.get_connection(timeout, retry_num)
+                return self._get_connection(timeout, retry_num)
             else:
                 total_times = self._RETRY_COUNTER + 1
                 self._RETRY_COUNTER = 0
@@ -177,11 +478,14 @@ class Pool:
     def put_connection(self, conn):
         if not conn._pool:
             conn._pool = self
-        # 清理连接状态：回滚未提交的事务，释放锁
+        # 清理连接状态：回滚未提交的事务，释放锁，已关闭的连接重连后就是新的会话
         try:
-            conn.rollback()
-        except Exception:
-            pass
+            if conn.open:
+                self._reset(conn)
+        except Exception as e:
+            # never reuse a half reset session, the connection reconnects when it is taken again.
+            logger.warning("reset connection of pool(%s) error caused by %r, close it", self.name, e)
+            conn._force_close()
         try:
             self._pool.put_nowait(conn)
             logger.debug("put connection back to pool(%s)", self.name)
@@ -193,10 +497,109 @@ class Pool:
     def size(self):
         return self._pool.qsize()
 
+    def _reset(self, conn):
+        if self._reset_mode == "connection":
+            try:
+                conn.reset_session()
+                return
+            except _driver().pymysql.err.MySQLError as e:
+                if not conn.open:
+                    # failed after the session was reset.
+                    raise
+                logger.warning("reset connection of pool(%s) error caused by %s, rollback instead", self.name, e)
+
+        # skip the round trip when there is nothing to rollback, e.g. after commit or in autocommit mode.
+        if conn.in_transaction():
+            conn.rollback()
+        if conn.autocommit_mode is not None and conn.get_autocommit() != conn.autocommit_mode:
+            conn.autocommit(conn.autocommit_mode)
+        if self._reset_mode == "sql":
+            with conn.cursor() as cursor:
+                for sql in self._reset_sqls:
+                    cursor.execute(sql)
+
+    def _on_success(self):
+        if self.breaker is not None:
+            self.breaker.record_success()
+
+    def _on_failure(self, e):
+        if self.breaker is None:
+            return
+        if self.breaker.record_failure():
+            logger.warning("circuit breaker of pool(%s) is open caused by %s", self.name, e)
+            self._close_idle()
+            self._start_probe()
+
+    def _close_idle(self):
+        """
+        close the sockets of the idle connections, they are likely broken by the outage too, and reconnect when
+        they are taken from the pool after the breaker closes
+        """
+        for _ in range(self.size()):
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            conn._force_close()
+            self._pool.put_nowait(conn)
+
+    def _lose_connection(self):
+        with self._probe_lock:
+            self._missing += 1
+
+    def _start_probe(self):
+        with self._probe_lock:
+            if self._probe_thread is not None and self._probe_thread.is_alive():
+                return
+            self._probe_thread = threading.Thread(target=self._probe, name="pool({})-probe".format(self.name))
+            self._probe_thread.daemon = True
+            self._probe_thread.start()
+
+    def _probe(self):
+        """probe the db server in the background until the circuit breaker is closed. """
+        while self.breaker.state != CircuitBreaker.CLOSED:
+            time.sleep(self.breaker.recovery_timeout)
+            if not self.breaker.allow_request():
+                continue
+            try:
+                conn = _connect(*self._args, **self._kwargs)
+            except Exception as e:
+                logger.warning("probe connection of pool(%s) failed caused by %s", self.name, e)
+                self._on_failure(e)
+                continue
+            self._on_success()
+            logger.warning("circuit breaker of pool(%s) is closed", self.name)
+            # the probe connection takes the place of a dropped one, the pool never grows beyond its size.
+            with self._probe_lock:
+                missing = self._missing > 0
+                if missing:
+                    self._missing -= 1
+            if missing:
+                self.put_connection(conn)
+            else:
+                conn.close()
+
+        # make up the connections dropped while the breaker was open.
+        while self._missing > 0:
+            try:
+                conn = _connect(*self._args, **self._kwargs)
+            except Exception as e:
+                self._on_failure(e)
+                return
+            with self._probe_lock:
+                self._missing -= 1
+            self.put_connection(conn)
+
 
 class Conn(object):
-    def __init__(self, db_name):
-        self._conn = get_pool(db_name).get_connection()
+    def __init__(self, db_name, plan_guard=None):
+        """
+        plan_guard: a PlanGuard instance, the plan_guard of the pool by default
+        """
+        self._conn = None
+        self._pool = get_pool(db_name)
+        self._plan_guard = plan_guard if plan_guard is not None else getattr(self._pool, "plan_guard", None)
+        self._conn = self._pool.get_connection()
 
     @staticmethod
     def _encode_input(row):
@@ -215,10 +618,11 @@ class Conn(object):
         return sql.replace("?", "%s")
 
     @no_warning
+    @track_failure
     def query_one(self, sql=None, args=()):
         result = None
         # 使用 DictCursor 而不是 SSDictCursor，避免无缓冲游标的连接状态问题
-        with self._conn.cursor(cursor=DictCursor) as cursor:
+        with self._conn.cursor(cursor=_driver().DictCursor) as cursor:
             cursor.execute(self._format_sql(sql), args)
             if logger.level <= logging.DEBUG:
                 logger.info(cursor.mogrify(self._format_sql(sql), args))
@@ -226,13 +630,15 @@ class Conn(object):
             row = cursor.fetchone()
             if row:
                 result = self._encode_input(row)
+        self._check_plan(sql, args)
         return result
 
     @no_warning
+    @track_failure
     def query(self, sql=None, args=()):
         result = []
 
-        with self._conn.cursor(cursor=DictCursor) as cursor:
+        with self._conn.cursor(cursor=_driver().DictCursor) as cursor:
             cursor.execute(self._format_sql(sql), args)
             if logger.level <= logging.DEBUG:
                 logger.info(cursor.mogrify(self._format_sql(sql), args))
@@ -240,16 +646,19 @@ class Conn(object):
             rows = cursor.fetchall()
             if rows:
                 result = [self._encode_input(row) for row in rows]
+        self._check_plan(sql, args)
         return result
 
     @no_warning
+    @track_failure
     def query_range(self, sql=None, args=(), size=100):
 
         # use the SSDictCursor, cause it's no need to buffer here.
-        with self._conn.cursor(cursor=SSDictCursor) as cursor:
+        with self._conn.cursor(cursor=_driver().SSDictCursor) as cursor:
             cursor.execute(self._format_sql(sql), args)
             if logger.level <= logging.DEBUG:
                 logger.info(cursor.mogrify(self._format_sql(sql), args))
+            self._check_plan(sql, args)
 
             while True:
                 rows = cursor.fetchmany(size=size)
@@ -262,6 +671,22 @@ class Conn(object):
                     break
 
     @no_warning
+    @track_failure
+    def query_columns(self, sql=None, args=(), size=10000):
+        """
+        Query the rows into a column-major ResultSet, the rows are fetched by batches of size straight
+        into the columns, no dict is built for them
+        """
+        with self._conn.cursor(cursor=_driver().SSCursor) as cursor:
+            cursor.execute(self._format_sql(sql), args)
+            if logger.level <= logging.DEBUG:
+                logger.info(cursor.mogrify(self._format_sql(sql), args))
+            result = ResultSet.from_cursor(cursor, size)
+        self._check_plan(sql, args)
+        return result
+
+    @no_warning
+    @track_failure
     def execute(self, sql=None, args=()):
         result = -1
 
@@ -274,6 +699,7 @@ class Conn(object):
         return result
 
     @no_warning
+    @track_failure
     def insert(self, sql=None, args=()):
         result = -1
 
@@ -286,6 +712,10 @@ class Conn(object):
             self._conn.commit()
         return result
 
+    def _check_plan(self, sql, args):
+        if self._plan_guard is not None:
+            self._plan_guard.observe(self._pool, sql, args)
+
     def get_native_conn(self):
         return self._conn
 
@@ -310,6 +740,7 @@ class Trans(Conn):
 
     # tran 将 commit 和 rollback的机会交给调用方
     @no_warning
+    @track_failure
     def execute(self, sql=None, args=()):
         result = -1
 
@@ -324,6 +755,7 @@ class Trans(Conn):
             return result
 
     @no_warning
+    @track_failure
     def insert(self, sql=None, args=()):
         result = -1
 
@@ -343,3 +775,7 @@ class Trans(Conn):
 
 class GetConnectionFromPoolError(Exception):
     """Exception related can't get connection from pool within timeout seconds."""
+
+
+class CircuitBreakerOpenError(GetConnectionFromPoolError):
+    """Exception related the circuit breaker of the pool is open, the request fails fast."""
@@ -0,0 +1,238 @@
+import heapq
+import datetime
+import decimal
+import collections
+
+from array import array
+
+__all__ = ["ResultSet"]
+
+
+def _encode_column(values):
+    """the same conversion as Conn._encode_input, but done once per column. """
+    kinds = set(map(type, values))
+    if decimal.Decimal not in kinds and datetime.datetime not in kinds:
+        return values
+
+    result = []
+    append = result.append
+    for value in values:
+        if isinstance(value, decimal.Decimal):
+            value = float(value)
+        elif isinstance(value, datetime.datetime):
+            value = value.strftime("%Y-%m-%d %H:%M:%S")
+        append(value)
+    return result
+
+
+def _sort_key(values, nulls_low=False):
+    """the key of the row indexes by the column, None(SQL NULL) compares above every value, or below. """
+    if isinstance(values, array) or None not in values:
+        return values.__getitem__
+    if nulls_low:
+        return lambda i: (values[i] is not None, values[i])
+    return lambda i: (values[i] is None, values[i])
+
+
+def _compact_column(values):
+    """store the column in a typed array when all the values are int or all are number. """
+    if isinstance(values, array):
+        return values
+
+    kinds = set(map(type, values))
+    try:
+        if kinds == {int}:
+            return array("q", values)
+        if kinds == {float} or kinds == {int, float}:
+            return array("d", values)
+    except OverflowError:
+        pass
+    return values if isinstance(values, list) else list(values)
+
+
+class ResultSet(object):
+    """
+    A column-major result of a query, the columns are stored in array(int or float column) or list.
+    It supports filter, sort, top-k and group by without building a dict per row.
+    """
+
+    def __init__(self, columns, data):
+        """
+        columns: the column names
+        data: the column values, one sequence per column in the order of columns
+        """
+        if len(columns) != len(data):
+            raise RuntimeError("the data has {} columns, but {} names are given. ".format(len(data), len(columns)))
+        if len(set(len(values) for values in data)) > 1:
+            raise RuntimeError("all the columns must have the same length. ")
+
+        self._columns = list(columns)
+        self._index = {name: i for i, name in enumerate(self._columns)}
+        self._data = [_compact_column(values) for values in data]
+
+    @classmethod
+    def from_rows(cls, columns, rows):
+        """create from a sequence of row tuples. """
+        if not rows:
+            return cls(columns, [[] for _ in columns])
+        return cls(columns, [_encode_column(list(values)) for values in zip(*rows)])
+
+    @classmethod
+    def from_dicts(cls, dicts, columns=None):
+        """create from a list of dict, columns default to the keys of the first dict. """
+        if columns is None:
+            columns = list(dicts[0].keys()) if dicts else []
+        return cls(columns, [_encode_column([row.get(name) for row in dicts]) for name in columns])
+
+    @classmethod
+    def from_cursor(cls, cursor, size=10000):
+        """fetch the rows of an executed tuple cursor by batches of size, straight into the columns. """
+        columns = [desc[0] for desc in cursor.description or ()]
+        data = [[] for _ in columns]
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            for values, fetched in zip(data, zip(*rows)):
+                values.extend(fetched)
+            if len(rows) < size:
+                break
+        return cls(columns, [_encode_column(values) for values in data])
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def __len__(self):
+        return len(self._data[0]) if self._data else 0
+
+    def __iter__(self):
+        return self.rows()
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def __repr__(self):
+        return "<ResultSet columns={} rows={}>".format(self._columns, len(self))
+
+    def column(self, name):
+        if name not in self._index:
+            raise KeyError("no column named {}. ".format(name))
+        return self._data[self._index[name]]
+
+    def rows(self):
+        """iterate the rows as tuples. """
+        return zip(*self._data)
+
+    def to_dicts(self):
+        return [dict(zip(self._columns, row)) for row in self.rows()]
+
+    def select(self, *columns):
+        return ResultSet(columns, [self.column(name) for name in columns])
+
+    def take(self, indices):
+        """return a new ResultSet of the rows at the indices, in that order. """
+        indices = list(indices)
+        data = []
+        for values in self._data:
+            picked = [values[i] for i in indices]
+            data.append(array(values.typecode, picked) if isinstance(values, array) else picked)
+        return ResultSet(self._columns, data)
+
+    def filter(self, column, predicate):
+        """keep the rows whose value of the column satisfies the predicate. """
+        return self.take([i for i, value in enumerate(self.column(column)) if predicate(value)])
+
+    def sort(self, column, reverse=False):
+        """a stable sort by the column, the None values(SQL NULL) are the last rows in both orders. """
+        values = self.column(column)
+        return self.take(sorted(range(len(values)), key=_sort_key(values, nulls_low=reverse), reverse=reverse))
+
+    def top(self, column, k=10, smallest=False):
+        """
+        the k rows with the largest(or smallest) value of the column, sorted. the None values(SQL NULL) are
+        only taken when there are less than k other values, as the last rows
+        """
+        values = self.column(column)
+        select = heapq.nsmallest if smallest else heapq.nlargest
+        return self.take(select(k, range(len(values)), key=_sort_key(values, nulls_low=not smallest)))
+
+    def group_by(self, *columns):
+        return GroupBy(self, columns)
+
+    def to_table_rows(self, columns=None):
+        """the rows of TableTemplate, the None values are shown as empty strings. """
+        data = [self.column(name) for name in columns] if columns else self._data
+        return [["" if value is None else str(value) for value in row] for row in zip(*data)]
+
+    def to_table(self, title, columns=None, **kwargs):
+        """create a TableTemplate, kwargs are passed to the TableTemplate. """
+        from pyanalysis.mail_templates.table import TableTemplate
+
+        headers = list(columns) if columns else self.columns
+        return TableTemplate(title=title, headers=headers, rows=self.to_table_rows(columns), **kwargs)
+
+    def to_pandas(self):
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError("to_pandas() needs pandas, please install it by: pip install pandas")
+        return pandas.DataFrame({name: values for name, values in zip(self._columns, self._data)},
+                                columns=self._columns)
+
+
+class GroupBy(object):
+    """
+    The groups of a ResultSet, every aggregation returns a ResultSet of the key columns followed by the
+    aggregated columns, the groups are in the order of their first rows.
+    """
+
+    def __init__(self, result_set, columns):
+        if not columns:
+            raise RuntimeError("you must group by at least one column! ")
+        self._result_set = result_set
+        self._columns = list(columns)
+        if len(columns) == 1:
+            self._keys = result_set.column(columns[0])
+        else:
+            self._keys = list(zip(*[result_set.column(name) for name in columns]))
+        self._counts = None
+
+    def _groups(self):
+        if self._counts is None:
+            self._counts = collections.Counter(self._keys)
+        return self._counts
+
+    def _build(self, names, values):
+        groups = list(self._groups())
+        if len(self._columns) == 1:
+            data = [groups]
+        else:
+            data = [list(values) for values in zip(*groups)] if groups else [[] for _ in self._columns]
+        for aggregated in values:
+            data.append([aggregated.get(key) for key in groups])
+        return ResultSet(self._columns + list(names), data)
+
+    def _sums(self, column):
+        """sums and counts of the non-None values per group, in one pass. """
+        sums = {}
+        counts = {}
+        for key, value in zip(self._keys, self._result_set.column(column)):
+            if value is None:
+                continue
+            sums[key] = sums.get(key, 0) + value
+            counts[key] = counts.get(key, 0) + 1
+        return sums, counts
+
+    def count(self):
+        return self._build(["count"], [self._groups()])
+
+    def sum(self, *columns):
+        return self._build(columns, [self._sums(name)[0] for name in columns])
+
+    def mean(self, *columns):
+        values = []
+        for name in columns:
+            sums, counts = self._sums(name)
+            values.append({key: sums[key] / counts[key] for key in sums})
+        return self._build(columns, values)
@@ -0,0 +1,294 @@
+"""
+进程内的模拟 MySQL 服务器
+
+只实现 pymysql 用到的那部分协议（握手、COM_QUERY、COM_PING、COM_QUIT、COM_RESET_CONNECTION），
+不解析 SQL，只按语句类型应答：
+- SELECT/SHOW/EXPLAIN：返回预先生成的结果集（id, name, price, created_at），行数受 LIMIT 限制
+- INSERT：返回自增的 lastrowid
+- BEGIN/COMMIT/ROLLBACK/SET AUTOCOMMIT：维护会话的事务状态位，与真实服务器的 server_status 一致
+- 其他语句：返回 OK
+- stop() 同时断开所有会话，与宕机的服务器一样
+
+用于没有真实 MySQL 时的单元测试与性能基准测试，让请求真正经过 pymysql 的协议编解码。
+
+使用方式：
+    server = FakeMySQLServer(rows=1000)
+    server.start()
+    pool = Pool(size=5, host=server.host, port=server.port, user="root", password="")
+    ...
+    server.stop()
+"""
+
+import re
+import struct
+import socket
+import datetime
+import threading
+import socketserver
+
+__all__ = ["FakeMySQLServer"]
+
+_SERVER_STATUS_IN_TRANS = 1
+_SERVER_STATUS_AUTOCOMMIT = 2
+
+_CAPABILITIES = (
+    1  # LONG_PASSWORD
+    | 1 << 3  # CONNECT_WITH_DB
+    | 1 << 9  # PROTOCOL_41
+    | 1 << 13  # TRANSACTIONS
+    | 1 << 15  # SECURE_CONNECTION
+    | 1 << 16  # MULTI_STATEMENTS
+    | 1 << 17  # MULTI_RESULTS
+    | 1 << 19  # PLUGIN_AUTH
+)
+
+_COM_QUIT = 0x01
+_COM_INIT_DB = 0x02
+_COM_QUERY = 0x03
+_COM_PING = 0x0E
+_COM_RESET_CONNECTION = 0x1F
+
+# (name, type, charset)
+_COLUMNS = (
+    ("id", 8, 63),  # LONGLONG
+    ("name", 253, 45),  # VAR_STRING utf8mb4
+    ("price", 246, 63),  # NEWDECIMAL
+    ("created_at", 12, 63),  # DATETIME
+)
+
+_LIMIT_PATTERN = re.compile(rb"\blimit\s+(\d+)(?:\s*,\s*(\d+))?", re.IGNORECASE)
+
+
+def _lenenc_int(n):
+    if n < 251:
+        return struct.pack("<B", n)
+    if n < 1 << 16:
+        return b"\xfc" + struct.pack("<H", n)
+    if n < 1 << 24:
+        return b"\xfd" + struct.pack("<I", n)[:3]
+    return b"\xfe" + struct.pack("<Q", n)
+
+
+def _lenenc_str(s):
+    return _lenenc_int(len(s)) + s
+
+
+def _column_definition(name, column_type, charset):
+    return (
+        _lenenc_str(b"def")
+        + _lenenc_str(b"test_pyanalysis")
+        + _lenenc_str(b"bench_rows")
+        + _lenenc_str(b"bench_rows")
+        + _lenenc_str(name.encode())
+        + _lenenc_str(name.encode())
+        + b"\x0c"
+        + struct.pack("<HIBHB", charset, 255, column_type, 0, 2 if column_type == 246 else 0)
+        + b"\x00\x00"
+    )
+
+
+def _make_row(i):
+    created_at = datetime.datetime(2024, 1, 1) + datetime.timedelta(seconds=i)
+    values = (
+        str(i + 1).encode(),
+        "name-{}".format(i + 1).encode(),
+        "{}.{:02d}".format(i % 1000, i % 100).encode(),
+        created_at.strftime("%Y-%m-%d %H:%M:%S").encode(),
+    )
+    return b"".join(_lenenc_str(value) for value in values)
+
+
+class _Session(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.request.makefile("rb")
+        self.status = _SERVER_STATUS_AUTOCOMMIT
+        with self.server.lock:
+            self.server.sessions.add(self.request)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.sessions.discard(self.request)
+
+    def _send(self, payloads, seq):
+        """send the payloads as consecutive packets in one write. """
+        buf = bytearray()
+        for payload in payloads:
+            buf += struct.pack("<I", len(payload))[:3] + struct.pack("<B", seq & 0xFF) + payload
+            seq += 1
+        self.request.sendall(buf)
+
+    def _recv(self):
+        header = self.rfile.read(4)
+        if len(header) < 4:
+            return None
+        length = struct.unpack("<I", header[:3] + b"\x00")[0]
+        return self.rfile.read(length)
+
+    def _ok(self, affected_rows=0, insert_id=0):
+        return b"\x00" + _lenenc_int(affected_rows) + _lenenc_int(insert_id) + struct.pack("<HH", self.status, 0)
+
+    def _eof(self):
+        return b"\xfe" + struct.pack("<HH", 0, self.status)
+
+    def handle(self):
+        server = self.server
+        salt = b"12345678" + b"abcdefghijkl"
+        greeting = (
+            b"\x0a"
+            + b"5.7.99-fake\x00"
+            + struct.pack("<I", threading.get_ident() & 0xFFFFFFFF)
+            + salt[:8]
+            + b"\x00"
+            + struct.pack("<H", _CAPABILITIES & 0xFFFF)
+            + struct.pack("<BHHB", 45, self.status, _CAPABILITIES >> 16, 21)
+            + b"\x00" * 10
+            + salt[8:]
+            + b"\x00"
+            + b"mysql_native_password\x00"
+        )
+        self._send([greeting], 0)
+        if self._recv() is None:
+            return
+        # accept any user and password.
+        self._send([self._ok()], 2)
+
+        while True:
+            packet = self._recv()
+            if not packet or packet[0] == _COM_QUIT:
+                return
+            command, body = packet[0], packet[1:]
+            if command == _COM_QUERY:
+                self._query(body)
+            elif command == _COM_RESET_CONNECTION:
+                self.status = _SERVER_STATUS_AUTOCOMMIT
+                self._send([self._ok()], 1)
+            elif command in (_COM_PING, _COM_INIT_DB):
+                self._send([self._ok()], 1)
+            else:
+                self._send([b"\xff" + struct.pack("<H", 1047) + b"#08S01Unknown command"], 1)
+            if server.record:
+                with server.lock:
+                    server.commands[command] = server.commands.get(command, 0) + 1
+
+    def _query(self, sql):
+        server = self.server
+        keyword = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else b""
+        if server.record:
+            with server.lock:
+                server.queries.append(sql.decode("utf-8", "replace"))
+
+        self._track_status(keyword, sql)
+        if keyword in (b"SELECT", b"SHOW", b"EXPLAIN", b"("):
+            self._result_set(sql)
+        elif keyword in (b"INSERT", b"REPLACE"):
+            with server.lock:
+                server.last_insert_id += 1
+                insert_id = server.last_insert_id
+            self._send([self._ok(1, insert_id)], 1)
+        elif keyword in (b"UPDATE", b"DELETE"):
+            self._send([self._ok(1)], 1)
+        else:
+            self._send([self._ok()], 1)
+
+    def _track_status(self, keyword, sql):
+        """keep the transaction bits the way a real server does. """
+        if keyword in (b"BEGIN", b"START"):
+            self.status |= _SERVER_STATUS_IN_TRANS
+        elif keyword in (b"COMMIT", b"ROLLBACK"):
+            self.status &= ~_SERVER_STATUS_IN_TRANS
+        elif keyword == b"SET" and b"AUTOCOMMIT" in sql.upper():
+            if sql.rstrip().endswith(b"1") or sql.upper().rstrip().endswith(b"TRUE"):
+                self.status = (self.status | _SERVER_STATUS_AUTOCOMMIT) & ~_SERVER_STATUS_IN_TRANS
+            else:
+                self.status &= ~_SERVER_STATUS_AUTOCOMMIT
+        elif keyword in (b"SELECT", b"INSERT", b"UPDATE", b"DELETE", b"REPLACE"):
+            if not self.status & _SERVER_STATUS_AUTOCOMMIT:
+                self.status |= _SERVER_STATUS_IN_TRANS
+
+    def _result_set(self, sql):
+        rows = self.server.rows
+        match = _LIMIT_PATTERN.search(sql)
+        count = len(rows)
+        if match:
+            count = int(match.group(2) or match.group(1))
+        payloads = [_lenenc_int(len(_COLUMNS))]
+        payloads.extend(self.server.column_definitions)
+        payloads.append(self._eof())
+        payloads.extend(rows[i % len(rows)] for i in range(count))
+        payloads.append(self._eof())
+        self._send(payloads, 1)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeMySQLServer(object):
+    """
+    rows: how many rows a SELECT without LIMIT returns, the rows are generated once
+    record: whether to record the queries and commands, turn it off for benchmarks
+    """
+
+    def __init__(self, rows=1000, host="127.0.0.1", port=0, record=True):
+        self._server = _Server((host, port), _Session)
+        self._server.rows = [_make_row(i) for i in range(max(rows, 1))]
+        self._server.column_definitions = [_column_definition(*column) for column in _COLUMNS]
+        self._server.lock = threading.Lock()
+        self._server.queries = []
+        self._server.commands = {}
+        self._server.last_insert_id = 0
+        self._server.sessions = set()
+        self._server.record = record
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def queries(self):
+        """all the sql the server received. """
+        with self._server.lock:
+            return list(self._server.queries)
+
+    @property
+    def commands(self):
+        """the count of every command byte the server received, the queries are counted too. """
+        with self._server.lock:
+            return dict(self._server.commands)
+
+    def clear(self):
+        with self._server.lock:
+            del self._server.queries[:]
+            self._server.commands.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-mysql")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        with self._server.lock:
+            sessions = list(self._server.sessions)
+        for session in sessions:
+            try:
+                session.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc, value, traceback):
+        self.stop()
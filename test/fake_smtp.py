@@ -0,0 +1,207 @@
+"""
+进程内的模拟 SMTP 服务器
+
+只实现 smtplib 用到的那部分协议（EHLO/HELO、AUTH PLAIN/LOGIN、MAIL、RCPT、DATA、RSET、NOOP、QUIT），
+不支持 STARTTLS 与 SSL，客户端以 protocol="plain" 连接：
+- 与真实服务器一样，EHLO/HELO 之前的 AUTH 与 MAIL 回复 503
+- 接受任意用户名与密码
+- 收到的邮件按 (发件人, 收件人列表, 去掉点填充后的正文) 记录在 messages 中
+- 可以模拟服务器的限制与故障：每个会话最多接收的邮件数（超过后回复 421 并断开），
+  以及接下来若干次 MAIL 命令回复的临时错误（如 451）
+
+用于没有真实邮件服务器时的单元测试与性能基准测试。
+
+使用方式：
+    server = FakeSMTPServer(max_messages=100)
+    server.start()
+    mail = Mail("user", "password", mail_port=server.port, host=server.host, protocol="plain")
+    ...
+    server.stop()
+"""
+
+import base64
+import threading
+import socketserver
+
+__all__ = ["FakeSMTPServer"]
+
+
+class _Session(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.sent = 0
+        self.greeted = False
+        self._reply("220 fake ESMTP ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, _, argument = line.decode("utf-8", "replace").rstrip("\r\n").partition(" ")
+            command = command.upper()
+            with server.lock:
+                server.commands[command] = server.commands.get(command, 0) + 1
+            handler = getattr(self, "_do_" + command.lower(), None)
+            if handler is None:
+                self._reply("502 command not implemented")
+            elif handler(argument) is False:
+                return
+
+    def _do_ehlo(self, argument):
+        self.greeted = True
+        self.wfile.write(b"250-fake\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n250 SIZE 104857600\r\n")
+
+    def _do_helo(self, argument):
+        self.greeted = True
+        self._reply("250 fake")
+
+    def _do_auth(self, argument):
+        if not self.greeted:
+            self._reply("503 5.5.1 EHLO/HELO first")
+            return
+        mechanism, _, initial = argument.partition(" ")
+        if mechanism.upper() == "LOGIN":
+            self._reply("334 VXNlcm5hbWU6")
+            self.rfile.readline()
+            self._reply("334 UGFzc3dvcmQ6")
+            self.rfile.readline()
+        elif not initial:
+            self._reply("334 ")
+            base64.b64decode(self.rfile.readline().strip())
+        self._reply("235 authentication succeeded")
+
+    def _do_mail(self, argument):
+        server = self.server
+        if not self.greeted:
+            self._reply("503 5.5.1 EHLO/HELO first")
+            return
+        if self.sent >= server.max_messages:
+            self._reply("421 too many messages in this session")
+            return False
+        with server.lock:
+            failure = server.failures.pop(0) if server.failures else None
+        if failure is not None:
+            self._reply("{} temporary failure".format(failure))
+            return
+        self.mail_from = argument.partition(":")[2].strip("<> ")
+        self.rcpts = []
+        self._reply("250 ok")
+
+    def _do_rcpt(self, argument):
+        address = argument.partition(":")[2].strip("<> ")
+        code = self.server.rejects.get(address)
+        if code is not None:
+            self._reply("{} recipient rejected".format(code))
+            return
+        self.rcpts.append(address)
+        self._reply("250 ok")
+
+    def _do_data(self, argument):
+        server = self.server
+        self._reply("354 end data with <CR><LF>.<CR><LF>")
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line == b".\r\n":
+                break
+            # remove the dot stuffing.
+            lines.append(line[1:] if line.startswith(b".") else line)
+        self.sent += 1
+        with server.lock:
+            server.messages.append((self.mail_from, self.rcpts, b"".join(lines)))
+        self._reply("250 ok queued")
+
+    def _do_rset(self, argument):
+        self._reply("250 ok")
+
+    def _do_noop(self, argument):
+        self._reply("250 ok")
+
+    def _do_quit(self, argument):
+        self._reply("221 bye")
+        return False
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeSMTPServer(object):
+    """
+    max_messages: the messages a session may send, the next MAIL gets 421 and the session is closed
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, max_messages=1000):
+        self._server = _Server((host, port), _Session)
+        self._server.lock = threading.Lock()
+        self._server.max_messages = max_messages
+        self._server.connections = 0
+        self._server.commands = {}
+        self._server.messages = []
+        self._server.failures = []
+        self._server.rejects = {}
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def connections(self):
+        """how many sessions the clients opened. """
+        with self._server.lock:
+            return self._server.connections
+
+    @property
+    def commands(self):
+        """the count of every command the server received. """
+        with self._server.lock:
+            return dict(self._server.commands)
+
+    @property
+    def messages(self):
+        """(sender, recipients, data) of every message the server accepted. """
+        with self._server.lock:
+            return list(self._server.messages)
+
+    def fail(self, *codes):
+        """reply the codes to the next MAIL commands, one code each. """
+        with self._server.lock:
+            self._server.failures.extend(codes)
+
+    def reject(self, address, code=550):
+        """reply the code to the RCPT of the address. """
+        self._server.rejects[address] = code
+
+    def clear(self):
+        with self._server.lock:
+            self._server.connections = 0
+            self._server.commands.clear()
+            del self._server.messages[:]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), name="fake-smtp")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc, value, traceback):
+        self.stop()
@@ -0,0 +1,80 @@
+import sys
+import unittest
+import subprocess
+
+# the heavy dependencies every module must leave to the first use.
+HEAVY_MODULES = ("arrow", "dateutil", "pymysql", "jinja2", "email.mime", "ssl")
+
+
+def import_times(statement):
+    """run the statement in a fresh interpreter with -X importtime, return {module: cumulative microseconds}. """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def heavy_imports(times):
+    return sorted(name for name in times if any(name == heavy or name.startswith(heavy + ".") for heavy in HEAVY_MODULES))
+
+
+class TestLazyImports(unittest.TestCase):
+    def assertCheapImport(self, module):
+        times = import_times("import " + module)
+        self.assertIn(module, times)
+        self.assertEqual(heavy_imports(times), [], "importing {} imports heavy modules".format(module))
+
+    def test_moment(self):
+        self.assertCheapImport("pyanalysis.moment")
+
+    def test_mysql(self):
+        self.assertCheapImport("pyanalysis.mysql")
+
+    def test_mail_templates(self):
+        self.assertCheapImport("pyanalysis.mail_templates")
+
+    def test_logger(self):
+        self.assertCheapImport("pyanalysis.logger")
+
+    def test_resultset(self):
+        self.assertCheapImport("pyanalysis.resultset")
+
+    def test_first_use(self):
+        """the lazy names load their dependencies when they are used. """
+        self.assertIn("arrow", import_times("from pyanalysis.moment import moment; moment.get(0)"))
+        self.assertIn("pymysql", import_times("import pyanalysis.mysql as m; m.DictCursor"))
+        self.assertIn("jinja2", import_times(
+            "from pyanalysis.mail_templates import AlertTemplate; AlertTemplate(title='t', message='m').render()"))
+
+    def test_mysql_warnings_filter(self):
+        """importing pyanalysis.mysql leaves the warnings filters alone until pymysql is imported. """
+        statement = (
+            "import warnings; before = list(warnings.filters); import pyanalysis.mysql as m; "
+            "assert warnings.filters == before; m._Connection; "
+            "assert warnings.filters[0][2].__module__ == 'pymysql.err'"
+        )
+        import_times(statement)
+
+    def test_batch_without_arrow(self):
+        """the batch conversions in UTC or a fixed offset never import arrow. """
+        times = import_times(
+            "from datetime import timezone, timedelta; from pyanalysis.moment import format_timestamps, "
+            "bucket_timestamps; format_timestamps([0]); bucket_timestamps([0], tz=timezone(timedelta(hours=8)))"
+        )
+        self.assertNotIn("arrow", times)
+
+
+if __name__ == "__main__":
+    unittest.main()
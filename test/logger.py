@@ -1,9 +1,55 @@
+import io
+import os
+import sys
+import json
+import gzip
+import datetime
 import unittest
 import logging
+import multiprocessing
+import signal
+import tempfile
+import threading
+
+from unittest.mock import patch
 
 from pyanalysis.logger import DebugHandler
 from pyanalysis.logger import ReleaseRotatingFileHandler
 from pyanalysis.logger import ReleaseTimedRotatingFileHandler
+from pyanalysis.logger import QueuedReleaseRotatingFileHandler
+from pyanalysis.logger import QueuedReleaseTimedRotatingFileHandler
+from pyanalysis.logger import CompressedRotatingFileHandler
+from pyanalysis.logger import LogListener, setup_worker_logging
+from pyanalysis.logger import DigestAlarmSMTPHandler
+from pyanalysis.logger import SamplingFilter
+from pyanalysis.logger import CachedTimeFormatter, DEFAULT_LOG_FORMAT, DEFAULT_DATE_FORMAT
+from pyanalysis.logger import JsonFormatter, log_context, bind_log_context, reset_log_context
+from pyanalysis.logger import _QueuedReleaseHandler
+
+
+class BlockedHandler(logging.Handler):
+    """collect the messages, but only after the gate is open. """
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+        self.messages = []
+
+    def emit(self, record):
+        self.gate.wait(5)
+        self.messages.append(record.getMessage())
+
+
+def log_from_worker(log_queue, worker, count):
+    setup_worker_logging(log_queue)
+    logger = logging.getLogger("worker")
+    with log_context(worker=worker):
+        for i in range(count):
+            logger.warning("worker %d record %d", worker, i)
+        try:
+            1 / 0
+        except Exception:
+            logger.exception("worker %d failed", worker)
 
 
 class TestLogging(unittest.TestCase):
@@ -63,3 +109,507 @@ class TestLogging(unittest.TestCase):
     #     logger.setLevel(alarm_handler.level)
     #
     #     logger.critical("hahahahahha")
+
+
+class TestQueuedLogging(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _blocked_logger(self, name, **kwargs):
+        target = BlockedHandler()
+        handler = _QueuedReleaseHandler(target, **kwargs)
+        logger = logging.getLogger(name)
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        # the listener thread holds the first record while the gate is closed.
+        logger.warning("first")
+        while handler.queue.qsize():
+            pass
+        return logger, handler, target
+
+    def test_queued_rotating_file_logger(self):
+        for handler_class in (QueuedReleaseRotatingFileHandler, QueuedReleaseTimedRotatingFileHandler):
+            filename = os.path.join(self.dir.name, handler_class.__name__ + ".log")
+            handler = handler_class(filename)
+            logger = logging.getLogger("queued." + handler_class.__name__)
+            logger.propagate = False
+            logger.addHandler(handler)
+            logger.setLevel(logging.DEBUG)
+
+            logger.info("some log about info! ")
+            logger.warning("some log about warning! ")
+            try:
+                1 / 0
+            except Exception as e:
+                logger.exception(e)
+            logger.removeHandler(handler)
+            handler.close()
+
+            with open(filename, encoding="UTF-8") as f:
+                content = f.read()
+            self.assertNotIn("info", content)
+            self.assertIn("[WARNING] some log about warning! ", content)
+            self.assertIn("ZeroDivisionError", content)
+            self.assertEqual(handler.dropped, 0)
+
+    def test_drop_oldest(self):
+        logger, handler, target = self._blocked_logger("queued.drop_oldest", maxsize=3)
+        for i in range(10):
+            logger.warning("record %d", i)
+        self.assertEqual(handler.dropped, 7)
+
+        target.gate.set()
+        handler.close()
+        self.assertEqual(target.messages, ["first", "record 7", "record 8", "record 9"])
+
+    def test_sample(self):
+        logger, handler, target = self._blocked_logger("queued.sample", maxsize=9, overflow="sample", sample_every=3)
+        for i in range(12):
+            logger.warning("record %d", i)
+        logger.error("error")
+
+        target.gate.set()
+        handler.close()
+        # 6 records reach the high water mark, then one of every 3 is kept, the errors are always kept.
+        self.assertEqual(target.messages, ["first"] + ["record %d" % i for i in (0, 1, 2, 3, 4, 5, 8, 11)] + ["error"])
+        self.assertEqual(handler.dropped, 4)
+
+    def test_flush(self):
+        logger, handler, target = self._blocked_logger("queued.flush", overflow="block")
+        logger.warning("second")
+        target.gate.set()
+        handler.flush()
+        self.assertEqual(target.messages, ["first", "second"])
+        handler.close()
+
+    def test_invalid_overflow(self):
+        with self.assertRaises(RuntimeError):
+            _QueuedReleaseHandler(BlockedHandler(), overflow="ignore")
+
+
+class TestCompressedRotating(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, "compressed.log")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _logger(self, name, **kwargs):
+        kwargs.setdefault("grace", 0)
+        handler = CompressedRotatingFileHandler(self.filename, **kwargs)
+        logger = logging.getLogger("compressed." + name)
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger, handler
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.dir.name) if name.startswith("compressed.log."))
+
+    def test_size_rollover(self):
+        logger, handler = self._logger("size", max_bytes=200, when=None)
+        for i in range(10):
+            logger.warning("record %d %s", i, "x" * 50)
+        handler.wait_compressed()
+        segments = [name for name in self._segments() if name != "compressed.log.lock"]
+        self.assertTrue(segments)
+        self.assertTrue(all(name.endswith(".gz") for name in segments))
+
+        lines = []
+        for name in segments:
+            with gzip.open(os.path.join(self.dir.name, name), "rt", encoding="UTF-8") as f:
+                lines.extend(f.read().splitlines())
+        handler.close()
+        with open(self.filename, encoding="UTF-8") as f:
+            lines.extend(f.read().splitlines())
+        self.assertEqual(sorted(int(line.split()[4]) for line in lines), list(range(10)))
+
+    def test_time_rollover(self):
+        logger, handler = self._logger("time", max_bytes=0, when="M", compression=None)
+        logger.warning("before")
+        # the next record arrives after the minute boundary.
+        with patch("time.time", return_value=handler._rollover_at + 1):
+            record = logging.makeLogRecord({"msg": "after", "levelno": logging.WARNING, "levelname": "WARNING"})
+            record.created = handler._rollover_at + 1
+            handler.handle(record)
+        handler.close()
+        segments = [name for name in self._segments() if name != "compressed.log.lock"]
+        self.assertEqual(len(segments), 1)
+        with open(os.path.join(self.dir.name, segments[0]), encoding="UTF-8") as f:
+            self.assertIn("before", f.read())
+        with open(self.filename, encoding="UTF-8") as f:
+            self.assertIn("after", f.read())
+
+    def test_budget(self):
+        logger, handler = self._logger("budget", max_bytes=100, when=None, backup_count=3, compression=None)
+        for i in range(20):
+            logger.warning("record %d %s", i, "x" * 50)
+        handler.wait_compressed()
+        self.assertEqual(len([name for name in self._segments() if name != "compressed.log.lock"]), 3)
+
+        handler.disk_budget = 400
+        logger.warning("last %s", "x" * 100)
+        handler.wait_compressed()
+        segments = [os.path.join(self.dir.name, name) for name in self._segments() if name != "compressed.log.lock"]
+        total = sum(os.path.getsize(path) for path in segments) + os.path.getsize(self.filename)
+        self.assertEqual(len(segments), 1)
+        self.assertLessEqual(total, 400)
+        handler.close()
+
+    def test_processes(self):
+        """the handlers of two processes share the file, one rollover moves both to the new file. """
+        first, first_handler = self._logger("first", max_bytes=100, when=None, compression=None)
+        second, second_handler = self._logger("second", max_bytes=100, when=None, compression=None)
+        first.warning("first %s", "x" * 100)
+        first.warning("first rolled")
+        second.warning("second reopened")
+        first_handler.close()
+        second_handler.close()
+        self.assertEqual(len([name for name in self._segments() if name != "compressed.log.lock"]), 1)
+        with open(self.filename, encoding="UTF-8") as f:
+            content = f.read()
+        self.assertIn("first rolled", content)
+        self.assertIn("second reopened", content)
+
+    def test_leftover_segments(self):
+        """the segments a crashed process left uncompressed are compressed on start. """
+        with open(self.filename + ".20240101-000000", "w") as f:
+            f.write("left over")
+        logger, handler = self._logger("leftover")
+        handler.wait_compressed()
+        handler.close()
+        self.assertIn("compressed.log.20240101-000000.gz", self._segments())
+
+    def test_invalid(self):
+        with self.assertRaises(RuntimeError):
+            CompressedRotatingFileHandler(self.filename, when="W")
+        with self.assertRaises(RuntimeError):
+            CompressedRotatingFileHandler(self.filename, compression="bz2")
+
+
+class TestLogListener(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, "workers.log")
+        self.context = multiprocessing.get_context("spawn")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _run_workers(self, listener, workers, count):
+        processes = [
+            self.context.Process(target=log_from_worker, args=(listener.queue, worker, count))
+            for worker in range(workers)
+        ]
+        with listener:
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+                self.assertEqual(process.exitcode, 0)
+
+    def test_rollover(self):
+        """the records of all the workers survive the rollovers. """
+        handler = ReleaseRotatingFileHandler(self.filename)
+        handler.maxBytes, handler.backupCount = 4096, 100
+        self._run_workers(LogListener(handler, context=self.context), 4, 100)
+
+        lines = []
+        for name in os.listdir(self.dir.name):
+            with open(os.path.join(self.dir.name, name), encoding="UTF-8") as f:
+                lines.extend(f.read().splitlines())
+        records = sorted(line.split("] ", 1)[1] for line in lines if " record " in line)
+        self.assertEqual(records, sorted("worker %d record %d" % (w, i) for w in range(4) for i in range(100)))
+        self.assertEqual(sum("ZeroDivisionError" in line for line in lines), 4)
+        self.assertGreater(len(os.listdir(self.dir.name)), 1)
+
+    def test_context(self):
+        """the log context of the worker reaches the formatter of the listener. """
+        handler = ReleaseRotatingFileHandler(self.filename)
+        handler.setFormatter(JsonFormatter())
+        self._run_workers(LogListener(handler, context=self.context), 2, 1)
+
+        with open(self.filename, encoding="UTF-8") as f:
+            records = [json.loads(line) for line in f if line.startswith("{")]
+        self.assertEqual(sorted((r["message"], r["worker"]) for r in records), [
+            ("worker 0 failed", 0), ("worker 0 record 0", 0), ("worker 1 failed", 1), ("worker 1 record 0", 1),
+        ])
+
+    def test_no_handler(self):
+        with self.assertRaises(RuntimeError):
+            LogListener()
+
+
+class TestSamplingFilter(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.handler = DebugHandler(self.stream)
+        self.logger = logging.getLogger("sampling")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def lines(self):
+        return [line.split("] ", 1)[1] for line in self.stream.getvalue().splitlines()]
+
+    def test_sample(self):
+        sampling = SamplingFilter(sample_rate=0.5)
+        self.handler.addFilter(sampling)
+        with patch("random.random", side_effect=[0.1, 0.9, 0.4, 0.6]):
+            for i in range(4):
+                self.logger.debug("record %d", i)
+        self.logger.error("error")
+        self.assertEqual(self.lines(), ["record 0", "record 2", "error"])
+        self.assertEqual(sampling.sampled, 2)
+
+    def test_rate(self):
+        sampling = SamplingFilter(rate=0.001, burst=2)
+        self.handler.addFilter(sampling)
+        for i in range(5):
+            self.logger.debug("get connection from pool(%s)", i)
+            self.logger.info("other %d", i)
+        self.assertEqual(sampling.suppressed, 6)
+
+        # the bucket of the template is full again.
+        for template in sampling._templates.values():
+            template.bucket._tokens = 1
+        self.logger.debug("get connection from pool(%s)", "last")
+        # the handlers add the note of a filter to a copy of the record since python 3.12
+        note = " (3 similar records suppressed)" if sys.version_info >= (3, 12) else ""
+        self.assertEqual(self.lines(), [
+            "get connection from pool(0)", "other 0", "get connection from pool(1)", "other 1",
+            "get connection from pool(last)" + note,
+        ])
+
+    def test_other_handlers(self):
+        """the note of the sampling handler never reaches the other handlers of the logger. """
+        stream = io.StringIO()
+        other = DebugHandler(stream)
+        self.logger.addHandler(other)
+        self.addCleanup(self.logger.removeHandler, other)
+        sampling = SamplingFilter(rate=0.001, burst=1)
+        self.handler.addFilter(sampling)
+        records = []
+        self.logger.addFilter(lambda record: records.append(record) or True)
+        self.addCleanup(self.logger.filters.clear)
+
+        for i in range(3):
+            self.logger.debug("record %d", i)
+        sampling._templates[("sampling", "record %d")].bucket._tokens = 1
+        self.logger.debug("record %d", 3)
+        self.assertEqual(len(self.lines()), 2)
+        self.assertEqual([line.split("] ", 1)[1] for line in stream.getvalue().splitlines()],
+                         ["record 0", "record 1", "record 2", "record 3"])
+        self.assertEqual((records[3].msg, records[3].args), ("record %d", (3,)))
+        self.assertFalse(hasattr(records[3], "suppressed"))
+
+    def test_counts_threads(self):
+        sampling = SamplingFilter(sample_rate=0.5)
+        record = logging.LogRecord("sampling", logging.DEBUG, __file__, 1, "record", (), None)
+        with patch("random.random", return_value=0.9):
+            threads = [threading.Thread(target=lambda: [sampling.filter(record) for _ in range(10000)])
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sampling.sampled, 40000)
+
+    def test_logger_rate(self):
+        sampling = SamplingFilter(logger_rate=0.001, burst=3)
+        self.handler.addFilter(sampling)
+        for i in range(5):
+            self.logger.warning("record %d", i)
+        self.logger.critical("critical")
+        self.assertEqual(self.lines(), ["record 0", "record 1", "record 2", "critical"])
+
+    def test_level(self):
+        mysql_logger = logging.getLogger("sampling.mysql")
+        self.addCleanup(mysql_logger.setLevel, logging.NOTSET)
+        sampling = SamplingFilter(level="warning", loggers=("sampling.mysql",))
+        self.handler.addFilter(sampling)
+        self.assertFalse(mysql_logger.isEnabledFor(logging.DEBUG))
+
+        self.logger.debug("hidden")
+        sampling.toggle()
+        self.assertTrue(mysql_logger.isEnabledFor(logging.DEBUG))
+        self.logger.debug("shown")
+        sampling.toggle()
+        self.logger.debug("hidden")
+        self.assertEqual(self.lines(), ["shown"])
+        with self.assertRaises(RuntimeError):
+            sampling.set_level("verbose")
+
+    @unittest.skipUnless(hasattr(signal, "SIGUSR1"), "no SIGUSR1")
+    def test_signal(self):
+        previous = signal.getsignal(signal.SIGUSR1)
+        self.addCleanup(signal.signal, signal.SIGUSR1, previous)
+        sampling = SamplingFilter(level=logging.WARNING)
+        sampling.install_signal()
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.assertEqual(sampling.level, logging.DEBUG)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.assertEqual(sampling.level, logging.WARNING)
+
+
+class TestDigestAlarm(unittest.TestCase):
+    def setUp(self):
+        self.handler = DigestAlarmSMTPHandler(
+            host="smtp.example.com", port=587, username="user", password="password",
+            fromaddr="alert@example.com", toaddrs=["admin@example.com"], subject="alarm",
+            window=3600, mails_per_hour=1, burst=1,
+        )
+        self.logger = logging.getLogger("digest")
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def _error_burst(self, count):
+        for i in range(count):
+            try:
+                raise ConnectionError("db-{} is down".format(i))
+            except ConnectionError:
+                self.logger.critical("query %s failed", "orders", exc_info=True)
+
+    @patch("smtplib.SMTP")
+    def test_digest(self, mock_smtp):
+        self._error_burst(500)
+        self.logger.critical("disk is full")
+        mock_smtp.assert_not_called()
+
+        self.handler.send_pending()
+        smtp = mock_smtp.return_value
+        smtp.starttls.assert_called_once()
+        smtp.login.assert_called_once_with("user", "password")
+        msg = smtp.send_message.call_args[0][0]
+        self.assertEqual(msg["Subject"], "alarm (501 records)")
+        text, html = [part.get_payload(decode=True).decode("utf-8") for part in msg.get_payload()]
+        self.assertIn("500 times", text)
+        self.assertIn("ConnectionError: db-0 is down", text)
+        self.assertIn("[digest] query orders failed", html)
+        self.assertIn("1 times", html)
+
+        # the token bucket is empty, the records wait for the next window.
+        self.logger.critical("disk is full")
+        self.handler.send_pending()
+        self.assertEqual(smtp.send_message.call_count, 1)
+
+        # close sends the pending records anyway.
+        self.handler.close()
+        self.assertEqual(smtp.send_message.call_count, 2)
+        self.assertEqual(smtp.send_message.call_args[0][0]["Subject"], "alarm (1 records)")
+
+    @patch("smtplib.SMTP")
+    def test_max_groups(self, mock_smtp):
+        self.handler.max_groups = 2
+        for i in range(5):
+            self.logger.critical("error " + str(i))
+        self.handler.close()
+        msg = mock_smtp.return_value.send_message.call_args[0][0]
+        self.assertEqual(msg["Subject"], "alarm (5 records)")
+        self.assertIn("3 times of other records", msg.get_payload()[0].get_payload(decode=True).decode("utf-8"))
+
+    def test_fingerprint(self):
+        record = logging.makeLogRecord({"name": "db", "msg": "query %s failed", "args": ("a",)})
+        self.assertEqual(DigestAlarmSMTPHandler.fingerprint(record), ("db", "query %s failed", ""))
+        try:
+            1 / 0
+        except ZeroDivisionError as e:
+            record = logging.makeLogRecord({"name": "db", "msg": e, "exc_info": sys.exc_info()})
+        self.assertEqual(DigestAlarmSMTPHandler.fingerprint(record), ("db", "ZeroDivisionError", "ZeroDivisionError"))
+        self.handler.close()
+
+
+class TestCachedTimeFormatter(unittest.TestCase):
+    def test_same_as_formatter(self):
+        for datefmt in (DEFAULT_DATE_FORMAT, None):
+            expected = logging.Formatter(DEFAULT_LOG_FORMAT, datefmt)
+            formatter = CachedTimeFormatter(DEFAULT_LOG_FORMAT, datefmt)
+            for created in (1700000000.25, 1700000000.75, 1700000001.5, 1600000000.0, 1700000000.5):
+                record = logging.makeLogRecord({"msg": "message", "levelname": "INFO", "levelno": logging.INFO})
+                record.created, record.msecs = created, (created - int(created)) * 1000
+                self.assertEqual(formatter.format(record), expected.format(record))
+
+    def test_msec_format(self):
+        formatter = CachedTimeFormatter(msec_format="%s.%03d")
+        record = logging.makeLogRecord({"msg": "message", "levelname": "INFO", "created": 1700000000.25,
+                                        "msecs": 250.0})
+        self.assertRegex(formatter.format(record), r"^\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}\.250 \[INFO\] message$")
+        # another datefmt is not cached.
+        self.assertEqual(formatter.formatTime(record, "%Y"), logging.Formatter().formatTime(record, "%Y"))
+
+    def test_handlers(self):
+        self.assertIsInstance(DebugHandler().formatter, CachedTimeFormatter)
+
+
+class TestJsonFormatter(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.handler = DebugHandler(self.stream)
+        self.handler.setFormatter(JsonFormatter())
+        self.logger = logging.getLogger("json")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def _lines(self):
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_fields(self):
+        self.logger.info("user %s logged in", "tom")
+        with log_context(request_id="r-1", pool="db"):
+            self.logger.warning("slow query", extra={"elapsed": 1.5})
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            self.logger.exception("failed")
+
+        first, second, third = self._lines()
+        self.assertEqual(list(first), ["time", "level", "logger", "message"])
+        self.assertRegex(first["time"], r"^\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}\.\d{3}$")
+        self.assertEqual((first["level"], first["logger"], first["message"]), ("INFO", "json", "user tom logged in"))
+        # the context fields are sorted by name, after the fixed fields.
+        self.assertEqual(list(second), ["time", "level", "logger", "message", "elapsed", "pool", "request_id"])
+        self.assertEqual((second["elapsed"], second["pool"], second["request_id"]), (1.5, "db", "r-1"))
+        self.assertEqual(list(third), ["time", "level", "logger", "message", "exception"])
+        self.assertIn("ZeroDivisionError", third["exception"])
+
+    def test_backends(self):
+        record = logging.makeLogRecord({"name": "json", "msg": "quote \" and 中文", "levelname": "INFO",
+                                        "created": 1700000000.5, "msecs": 500.0})
+        token = bind_log_context(count=3, empty=None, tags=["a"], when=datetime.datetime(2024, 1, 1))
+        try:
+            lines = [JsonFormatter(backend=backend).format(record) for backend in ("json", "auto")]
+        finally:
+            reset_log_context(token)
+        self.assertEqual(lines[0], lines[1])
+        data = json.loads(lines[0])
+        self.assertEqual(data["message"], "quote \" and 中文")
+        self.assertEqual((data["count"], data["empty"], data["tags"]), (3, None, ["a"]))
+        self.assertEqual(data["when"], "2024-01-01 00:00:00")
+        self.assertTrue(data["time"].endswith(".500"))
+
+        with self.assertRaises(RuntimeError):
+            JsonFormatter(backend="yaml")
+
+    def test_queued_context(self):
+        """the queued handlers write the context of the logging thread. """
+        filename = os.path.join(tempfile.mkdtemp(), "json.log")
+        handler = QueuedReleaseRotatingFileHandler(filename)
+        handler.setFormatter(JsonFormatter())
+        self.logger.addHandler(handler)
+        with log_context(request_id="r-2"):
+            self.logger.warning("queued")
+        self.logger.removeHandler(handler)
+        handler.close()
+        with open(filename, encoding="UTF-8") as f:
+            data = json.loads(f.read())
+        os.remove(filename)
+        self.assertEqual((data["message"], data["request_id"]), ("queued", "r-2"))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Benchmark the formatters and handlers of the pyanalysis.logger module.
+
+Covers records per second of:
+    - logging.Formatter with DEFAULT_LOG_FORMAT, the formatter the handlers used before
+    - CachedTimeFormatter, the formatter of DebugHandler and the release handlers
+    - JsonFormatter with the json and orjson(if installed) backends
+    - a full logger.warning() call through DebugHandler, ReleaseRotatingFileHandler and
+      QueuedReleaseRotatingFileHandler
+
+Usage:
+    python test/logger_benchmark.py
+    python test/logger_benchmark.py --records 500000 --output logger.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import tempfile
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyanalysis.logger import (  # noqa: E402
+    DEFAULT_LOG_FORMAT,
+    DEFAULT_DATE_FORMAT,
+    CachedTimeFormatter,
+    JsonFormatter,
+    DebugHandler,
+    ReleaseRotatingFileHandler,
+    QueuedReleaseRotatingFileHandler,
+)
+
+
+def make_records(count, per_second):
+    """count records, per_second of them share every second like a busy service. """
+    start = time.time()
+    records = []
+    for i in range(count):
+        record = logging.LogRecord("bench", logging.WARNING, __file__, 1, "user %s failed %d times", ("bob", i), None)
+        record.created = start + i / per_second
+        record.msecs = (record.created - int(record.created)) * 1000
+        records.append(record)
+    return records
+
+
+def records_per_sec(func, records):
+    start = time.perf_counter()
+    for record in records:
+        func(record)
+    return round(len(records) / (time.perf_counter() - start))
+
+
+def bench_formatters(records):
+    formatters = {
+        "logging.Formatter": logging.Formatter(DEFAULT_LOG_FORMAT, DEFAULT_DATE_FORMAT),
+        "CachedTimeFormatter": CachedTimeFormatter(),
+        "JsonFormatter(json)": JsonFormatter(backend="json"),
+    }
+    try:
+        formatters["JsonFormatter(orjson)"] = JsonFormatter(backend="orjson")
+    except ImportError:
+        pass
+    return {name: {"records_per_sec": records_per_sec(formatter.format, records)}
+            for name, formatter in formatters.items()}
+
+
+def bench_handlers(count):
+    directory = tempfile.mkdtemp()
+    handlers = {
+        "DebugHandler": DebugHandler(io.StringIO()),
+        "ReleaseRotatingFileHandler": ReleaseRotatingFileHandler(os.path.join(directory, "release.log")),
+        "QueuedReleaseRotatingFileHandler": QueuedReleaseRotatingFileHandler(
+            os.path.join(directory, "queued.log"), maxsize=count + 1),
+    }
+    result = {}
+    for name, handler in handlers.items():
+        logger = logging.getLogger("bench." + name)
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        start = time.perf_counter()
+        for i in range(count):
+            logger.warning("user %s failed %d times", "bob", i)
+        elapsed = time.perf_counter() - start
+        logger.removeHandler(handler)
+        handler.close()
+        # the caller side only, the queued handler writes in the background.
+        result[name] = {"records_per_sec": round(count / elapsed)}
+    for filename in os.listdir(directory):
+        os.remove(os.path.join(directory, filename))
+    os.rmdir(directory)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the pyanalysis.logger module")
+    parser.add_argument("--records", type=int, default=200000, help="records of every benchmark")
+    parser.add_argument("--per-second", type=int, default=1000, help="records sharing every second")
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    args = parser.parse_args()
+
+    result = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "records": args.records,
+            "per_second": args.per_second,
+        },
+        "results": {
+            "formatters": bench_formatters(make_records(args.records, args.per_second)),
+            "handlers": bench_handlers(args.records),
+        },
+    }
+    for group, items in result["results"].items():
+        for name, value in items.items():
+            print("{:<10} {:<36} {:>12,} records/s".format(group, name, value["records_per_sec"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(result, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,544 @@
+"""
+Mail 模块本地单元测试
+
+使用进程内的模拟服务器（test/fake_smtp.py），无需真实邮件服务器与网络即可验证发送流程。
+
+测试覆盖：
+- SMTPPool: 会话复用、每会话邮件数上限、NOOP 健康检查、空闲过期、421 与断开后的重连
+- send_bulk: 模板渲染、并发会话、4xx 临时错误的重试、永久错误、按输入顺序返回结果
+- AsyncMail: asyncio 上的发送、会话复用、并发上限、点填充、421 后的重连
+- FileAttach: 分块序列化与原消息一致、跨块的点填充、大附件发送时的内存峰值，ExcelAttach 与 ImageAttach 同样分块发送
+- CompressedAttach: gzip 与 zip 压缩附件、由数据行生成的 CSV、超过行数上限的表格以压缩 CSV 附件发送
+- MailSpool: 入队与发送、幂等键、服务器不可用时的退避重试、永久错误与多次失败后的死信、多进程认领、新认领的旧邮件不被回收、回收与清理时文件被其他进程删除、后台线程
+"""
+
+import io
+import os
+import csv
+import gzip
+import time
+import email
+import asyncio
+import tempfile
+import tracemalloc
+import smtplib
+import zipfile
+import threading
+import unittest
+
+from unittest.mock import patch
+
+from pyanalysis.mail import (
+    Mail, SMTPPool, HtmlContent, BulkMessage, FileAttach, ExcelAttach, ImageAttach, CompressedAttach, _iter_message,
+    _DotStuffer, _build_message,
+)
+from pyanalysis.mail_templates import TableTemplate
+from pyanalysis.async_mail import AsyncMail
+from pyanalysis.mail_spool import MailSpool, MailSpoolWorker
+from email.mime.text import MIMEText
+from test.fake_smtp import FakeSMTPServer
+
+
+class MailTestCase(unittest.TestCase):
+    max_messages = 1000
+
+    def setUp(self):
+        self.server = FakeSMTPServer(max_messages=self.max_messages).start()
+        self.addCleanup(self.server.stop)
+
+    def mail(self, **kwargs):
+        mail = Mail("sender@example.com", "password", mail_port=self.server.port, host=self.server.host,
+                    protocol="plain", **kwargs)
+        self.addCleanup(mail.close)
+        return mail
+
+
+class TestSMTPPool(MailTestCase):
+    def test_without_pool(self):
+        mail = self.mail()
+        mail.attach(HtmlContent("<h1>hello</h1>"))
+        for i in range(3):
+            mail.send("report", ["a@example.com"])
+        self.assertEqual(self.server.connections, 3)
+        self.assertEqual(len(self.server.messages), 3)
+
+    def test_reuse(self):
+        mail = self.mail(pool_size=2)
+        for i in range(20):
+            mail.send("report {}".format(i), ["a@example.com"], ["b@example.com"])
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.commands["AUTH"], 1)
+        self.assertEqual([rcpts for _, rcpts, _ in self.server.messages], [["a@example.com", "b@example.com"]] * 20)
+
+    def test_max_messages(self):
+        mail = self.mail(pool_size=2, max_messages_per_session=5)
+        for i in range(20):
+            mail.send("report", ["a@example.com"])
+        self.assertEqual(self.server.connections, 4)
+        self.assertEqual(self.server.commands["QUIT"], 4)
+
+    def test_noop(self):
+        mail = self.mail(pool_size=1)
+        mail._pool.noop_after = 0
+        mail.send("report", ["a@example.com"])
+        mail.send("report", ["a@example.com"])
+        self.assertEqual(self.server.commands["NOOP"], 1)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_max_idle(self):
+        mail = self.mail(pool_size=1)
+        mail._pool.max_idle = 0
+        mail.send("report", ["a@example.com"])
+        mail.send("report", ["a@example.com"])
+        self.assertEqual(self.server.connections, 2)
+
+    def test_transient_failure(self):
+        """the session survives a 4xx reply other than 421. """
+        mail = self.mail(pool_size=1)
+        self.server.fail(451)
+        with self.assertRaises(smtplib.SMTPSenderRefused):
+            mail.send("report", ["a@example.com"])
+        mail.send("report", ["a@example.com"])
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.messages), 1)
+
+    def test_concurrency(self):
+        mail = self.mail(pool_size=3)
+        threads = [
+            threading.Thread(target=lambda: [mail.send("report", ["a@example.com"]) for _ in range(10)])
+            for _ in range(6)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.server.messages), 60)
+        self.assertLessEqual(self.server.connections, 3)
+
+
+class TestSendBulk(MailTestCase):
+    def html(self, data):
+        message = email.message_from_bytes(data)
+        return "".join(part.get_payload(decode=True).decode("utf-8") for part in message.walk()
+                       if part.get_content_type() == "text/html")
+
+    def test_templates(self):
+        mail = self.mail()
+        messages = [
+            BulkMessage("report", ["user{}@example.com".format(i)],
+                        parts=[TableTemplate("report of user{}".format(i), ["name"], [["user{}".format(i)]])])
+            for i in range(20)
+        ]
+        results = mail.send_bulk(messages, concurrency=4)
+        self.assertEqual([result.index for result in results], list(range(20)))
+        self.assertTrue(all(result.ok and result.attempts == 1 for result in results))
+        self.assertLessEqual(self.server.connections, 4)
+        self.assertEqual(self.server.commands["QUIT"], self.server.connections)
+
+        received = {rcpts[0]: self.html(data) for _, rcpts, data in self.server.messages}
+        self.assertEqual(len(received), 20)
+        self.assertIn("report of user7", received["user7@example.com"])
+
+    def test_retry(self):
+        mail = self.mail()
+        self.server.fail(451, 421)
+        results = mail.send_bulk([("report", ["a@example.com"], ["b@example.com"])], concurrency=1, backoff=0)
+        self.assertTrue(results[0].ok)
+        self.assertEqual(results[0].attempts, 2)
+        self.assertEqual(self.server.messages[0][1], ["a@example.com", "b@example.com"])
+
+    def test_failures(self):
+        mail = self.mail(pool_size=2)
+        self.server.reject("bad@example.com", 550)
+        self.server.reject("busy@example.com", 450)
+        results = mail.send_bulk([
+            ("report", ["a@example.com"]),
+            ("report", ["bad@example.com"]),
+            ("report", ["busy@example.com"]),
+            ("report", ["a@example.com", "bad@example.com"]),
+        ], concurrency=2, retries=2, backoff=0)
+        self.assertEqual([result.ok for result in results], [True, False, False, True])
+        self.assertEqual([result.attempts for result in results], [1, 1, 3, 1])
+        self.assertIsInstance(results[1].error, smtplib.SMTPRecipientsRefused)
+        self.assertEqual(results[1].refused["bad@example.com"][0], 550)
+        self.assertEqual(list(results[3].refused), ["bad@example.com"])
+
+    def test_receivers_unchanged(self):
+        mail = self.mail()
+        receivers = ["a@example.com"]
+        mail.send("report", receivers, ["b@example.com"])
+        self.assertEqual(receivers, ["a@example.com"])
+
+
+class TestAsyncMail(MailTestCase):
+    def async_mail(self, **kwargs):
+        return AsyncMail("sender@example.com", "password", mail_port=self.server.port, host=self.server.host,
+                         protocol="plain", **kwargs)
+
+    def test_send(self):
+        async def send():
+            async with self.async_mail() as mail:
+                mail.attach(MIMEText("hello\n.hidden\n..two\n", "plain", "us-ascii"))
+                for i in range(5):
+                    await mail.send("report {}".format(i), ["a@example.com"], ["b@example.com"],
+                                    parts=[TableTemplate("report", ["name"], [["bob"]])])
+
+        asyncio.run(send())
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.commands["QUIT"], 1)
+        self.assertEqual(len(self.server.messages), 5)
+        sender, rcpts, data = self.server.messages[0]
+        self.assertEqual((sender, rcpts), ("sender@example.com", ["a@example.com", "b@example.com"]))
+        self.assertIn(b"\r\nhello\r\n.hidden\r\n..two\r\n", data)
+        message = email.message_from_bytes(data)
+        self.assertEqual(message["Subject"], "report 0")
+        self.assertEqual(len(message.get_payload()), 2)
+
+    def test_concurrency(self):
+        async def send():
+            async with self.async_mail(pool_size=3) as mail:
+                await asyncio.gather(*(mail.send("report", ["a@example.com"]) for _ in range(20)))
+
+        asyncio.run(send())
+        self.assertEqual(len(self.server.messages), 20)
+        self.assertEqual(self.server.connections, 3)
+
+    def test_refused(self):
+        self.server.reject("bad@example.com", 550)
+
+        async def send():
+            async with self.async_mail(pool_size=1) as mail:
+                with self.assertRaises(smtplib.SMTPRecipientsRefused):
+                    await mail.send("report", ["bad@example.com"])
+                return await mail.send("report", ["a@example.com", "bad@example.com"])
+
+        refused = asyncio.run(send())
+        self.assertEqual(refused["bad@example.com"][0], 550)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_without_login(self):
+        """a relay without AUTH still gets EHLO before MAIL. """
+        async def send():
+            async with AsyncMail("", "", mail_port=self.server.port, host=self.server.host,
+                                 protocol="plain") as mail:
+                await mail.send("report", ["a@example.com"])
+
+        asyncio.run(send())
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertEqual(self.server.commands["EHLO"], 1)
+        self.assertNotIn("AUTH", self.server.commands)
+
+    def test_invalid_protocol(self):
+        with self.assertRaises(RuntimeError):
+            AsyncMail("a", "b", protocol="smtps")
+
+
+class TestFileAttach(MailTestCase):
+    def make_file(self, size):
+        fd, path = tempfile.mkstemp(suffix=".xlsx")
+        with os.fdopen(fd, "wb") as f:
+            for _ in range(size // (1024 * 1024)):
+                f.write(os.urandom(1024 * 1024))
+            f.write(os.urandom(size % (1024 * 1024)))
+        self.addCleanup(os.remove, path)
+        return path
+
+    def attachment(self, data):
+        message = email.message_from_bytes(data)
+        for part in message.walk():
+            if part.get_filename() == "report.xlsx":
+                return part.get_content_type(), part.get_payload(decode=True)
+
+    def test_serialize(self):
+        path = self.make_file(200 * 1024 + 7)
+        msg, _ = _build_message("a@example.com", [HtmlContent("<p>hello</p>"), FileAttach(path, "report.xlsx")],
+                                "report", ["b@example.com"])
+        streamed = b"".join(_iter_message(msg))
+        with open(path, "rb") as f:
+            content = f.read()
+        self.assertEqual(self.attachment(streamed), ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                                                     content))
+        # the whole message at once reads the file too.
+        self.assertEqual(self.attachment(msg.as_bytes())[1], content)
+        self.assertNotIn(b"\n", streamed.replace(b"\r\n", b""))
+
+    def test_excel_image(self):
+        """ExcelAttach and ImageAttach keep their content types and are streamed like FileAttach. """
+        path = self.make_file(100 * 1024 + 1)
+        with open(path, "rb") as f:
+            content = f.read()
+        for attach, content_type in ((ExcelAttach, "application/octet-stream"), (ImageAttach, "image/octet-stream")):
+            part = attach(path, "report.xlsx")
+            self.assertIsInstance(part, FileAttach)
+            msg, _ = _build_message("a@example.com", [part], "report", ["b@example.com"])
+            self.assertEqual(self.attachment(b"".join(_iter_message(msg))), (content_type, content))
+
+    def test_dot_stuffing(self):
+        chunks = [b".a\r", b"\n.b\r\n", b".c", b"\r\n..d\r\n", b"e"]
+        stuffer = _DotStuffer()
+        stuffed = b"".join(stuffer.stuff(chunk) for chunk in chunks) + stuffer.end()
+        self.assertEqual(stuffed, b"..a\r\n..b\r\n..c\r\n...d\r\ne\r\n.\r\n")
+
+    def test_memory(self):
+        """the peak memory of serializing a 20MB attachment stays far below its size. """
+        path = self.make_file(20 * 1024 * 1024)
+        msg, _ = _build_message("a@example.com", [FileAttach(path, "report.xlsx")], "report", ["b@example.com"])
+        stuffer = _DotStuffer()
+        tracemalloc.start()
+        try:
+            size = sum(len(stuffer.stuff(chunk)) for chunk in _iter_message(msg))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(size, 20 * 1024 * 1024 * 4 // 3)
+        self.assertLess(peak, 2 * 1024 * 1024)
+
+    def test_send(self):
+        path = self.make_file(3 * 1024 * 1024 + 1)
+        with open(path, "rb") as f:
+            content = f.read()
+        for pool_size in (0, 1):
+            mail = self.mail(pool_size=pool_size)
+            mail.attach(HtmlContent("<p>hello</p>\n.dot"))
+            mail.attach(FileAttach(path, "report.xlsx"))
+            mail.send("report", ["a@example.com"])
+        self.assertEqual([self.attachment(data)[1] for _, _, data in self.server.messages], [content, content])
+
+    def test_async_send(self):
+        path = self.make_file(1024 * 1024 + 3)
+        with open(path, "rb") as f:
+            content = f.read()
+
+        async def send():
+            async with AsyncMail("sender@example.com", "password", mail_port=self.server.port,
+                                 host=self.server.host, protocol="plain") as mail:
+                await mail.send("report", ["a@example.com"], parts=[FileAttach(path, "report.xlsx")])
+
+        asyncio.run(send())
+        self.assertEqual(self.attachment(self.server.messages[0][2])[1], content)
+
+
+class TestCompressedAttach(MailTestCase):
+    def attachments(self, data):
+        message = email.message_from_bytes(data)
+        return {part.get_filename(): part.get_payload(decode=True) for part in message.walk() if part.get_filename()}
+
+    def test_file(self):
+        fd, path = tempfile.mkstemp(suffix=".log")
+        content = b"".join(b"line %d\n" % i for i in range(100000))
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        for compression, suffix in (("gzip", ".gz"), ("zip", ".zip")):
+            attach = CompressedAttach(path, "app.log", compression)
+            msg, _ = _build_message("a@example.com", [attach], "logs", ["b@example.com"])
+            data = self.attachments(b"".join(_iter_message(msg)))["app.log" + suffix]
+            self.assertLess(len(data), len(content) // 3)
+            if compression == "gzip":
+                self.assertEqual(gzip.decompress(data), content)
+            else:
+                self.assertEqual(zipfile.ZipFile(io.BytesIO(data)).read("app.log"), content)
+            # the whole message at once compresses the file too.
+            self.assertEqual(self.attachments(msg.as_bytes())["app.log" + suffix], data)
+
+    def test_from_rows(self):
+        rows = [[i, "名字{}".format(i), "a,b"] for i in range(20000)]
+        attach = CompressedAttach.from_rows(["id", "name", "note"], rows, "users.csv")
+        text = gzip.decompress(b"".join(attach.iter_compressed())).decode("utf-8")
+        self.assertTrue(text.startswith("\ufeff"))
+        lines = list(csv.reader(io.StringIO(text[1:])))
+        self.assertEqual(lines[0], ["id", "name", "note"])
+        self.assertEqual(lines[1:], [[str(i), name, note] for i, name, note in rows])
+        # the rows are read again for a retry.
+        self.assertEqual(gzip.decompress(b"".join(attach.iter_compressed())).decode("utf-8"), text)
+
+    def test_invalid_compression(self):
+        self.assertRaises(RuntimeError, CompressedAttach, None, "a.csv", "bz2")
+
+    def test_send_table(self):
+        rows = [["user{}".format(i), str(i)] for i in range(1000)]
+        mail = self.mail(max_inline_rows=10)
+        mail.attach(TableTemplate(title="users", headers=["name", "score"], rows=rows))
+        mail.send("users", ["a@example.com"])
+        data = self.server.messages[0][2]
+        html = [part.get_payload(decode=True) for part in email.message_from_bytes(data).walk()
+                if part.get_content_type() == "text/html"][0]
+        self.assertIn(b"user9<", html)
+        self.assertNotIn(b"user10<", html)
+        text = gzip.decompress(self.attachments(data)["users.csv.gz"]).decode("utf-8-sig")
+        self.assertEqual(list(csv.reader(io.StringIO(text)))[1:], rows)
+
+
+class TestMailSpool(MailTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.spool = MailSpool(self.dir.name, max_attempts=3, backoff=0)
+
+    def spool_mail(self, port=None):
+        mail = Mail("sender@example.com", "password", mail_port=port or self.server.port, host=self.server.host,
+                    protocol="plain", spool=self.spool)
+        self.addCleanup(mail.close)
+        return mail
+
+    def test_enqueue(self):
+        mail = self.spool_mail()
+        mail.attach(HtmlContent("<p>hello</p>"))
+        key = mail.enqueue("report", ["a@example.com"], ["b@example.com"])
+        self.assertEqual(self.spool.counts(), {"queued": 1, "sending": 0, "sent": 0, "dead": 0})
+        self.assertEqual(self.server.messages, [])
+
+        self.assertEqual(MailSpoolWorker(mail).run_once(), 1)
+        self.assertEqual(self.spool.counts(), {"queued": 0, "sending": 0, "sent": 1, "dead": 0})
+        sender, rcpts, data = self.server.messages[0]
+        self.assertEqual((sender, rcpts), ("sender@example.com", ["a@example.com", "b@example.com"]))
+        self.assertEqual(email.message_from_bytes(data)["Subject"], "report")
+        # the key of a sent message is not queued again.
+        self.assertEqual(mail.enqueue("report", ["a@example.com"], key=key), key)
+        self.assertEqual(self.spool.counts()["queued"], 0)
+
+    def test_idempotency(self):
+        mail = self.spool_mail()
+        for _ in range(3):
+            mail.enqueue("report", ["a@example.com"], key="daily-report-2024-01-01")
+        MailSpoolWorker(mail).run_once()
+        self.assertEqual(len(self.server.messages), 1)
+
+    def test_server_down(self):
+        """the messages wait in the spool while the server is down, and are dead after max_attempts. """
+        self.server.stop()
+        mail = self.spool_mail()
+        mail.enqueue("report", ["a@example.com"])
+        worker = MailSpoolWorker(mail)
+        self.assertEqual(worker.run_once(), 0)
+        self.assertEqual(self.spool.counts()["queued"], 1)
+        worker.run_once()
+        with self.assertLogs("pyanalysis.mail_spool", "ERROR"):
+            worker.run_once()
+        self.assertEqual(self.spool.counts(), {"queued": 0, "sending": 0, "sent": 0, "dead": 1})
+
+    def test_backoff(self):
+        self.spool.backoff = 60
+        self.server.fail(451)
+        mail = self.spool_mail()
+        mail.enqueue("report", ["a@example.com"])
+        worker = MailSpoolWorker(mail)
+        self.assertEqual(worker.run_once(), 0)
+        # not due yet.
+        self.assertEqual(worker.run_once(), 0)
+        with patch("time.time", return_value=time.time() + 61):
+            self.assertEqual(worker.run_once(), 1)
+        self.assertEqual(len(self.server.messages), 1)
+
+    def test_dead(self):
+        self.server.reject("bad@example.com", 550)
+        mail = self.spool_mail()
+        mail.enqueue("report", ["bad@example.com"])
+        with self.assertLogs("pyanalysis.mail_spool", "ERROR"):
+            MailSpoolWorker(mail).run_once()
+        self.assertEqual(self.spool.counts()["dead"], 1)
+
+    def test_claim(self):
+        """a message is claimed by one worker only, the claims of a dead worker are recovered. """
+        mail = self.spool_mail()
+        mail.enqueue("report", ["a@example.com"])
+        other = MailSpool(self.dir.name)
+        self.assertEqual(len(self.spool._claim(10)), 1)
+        self.assertEqual(other._claim(10), [])
+        other.recover(older_than=-1)
+        self.assertEqual(MailSpoolWorker(mail, other).run_once(), 1)
+
+    def test_claim_old(self):
+        """a worker starting does not recover the fresh claim of a message queued long ago. """
+        mail = self.spool_mail()
+        mail.enqueue("report", ["a@example.com"])
+        queue_dir = os.path.join(self.dir.name, "queue")
+        for name in os.listdir(queue_dir):
+            os.utime(os.path.join(queue_dir, name), (time.time() - 3600, time.time() - 3600))
+        claimed = self.spool._claim(10)
+        self.assertEqual(len(claimed), 1)
+        with MailSpoolWorker(mail, MailSpool(self.dir.name), interval=0.01):
+            time.sleep(0.1)
+        self.assertEqual(self.server.messages, [])
+        self.assertEqual(self.spool.counts()["sending"], 1)
+
+        pool = SMTPPool(mail._get_smtp_server, 1)
+        self.addCleanup(pool.close)
+        self.assertTrue(self.spool._deliver(pool, *claimed[0]))
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertEqual(self.spool.counts(), {"queued": 0, "sending": 0, "sent": 1, "dead": 0})
+
+    def test_vanishing_files(self):
+        """recover() and prune() skip the files another process removes while they go through the directory. """
+        mail = self.spool_mail()
+        mail.enqueue("report 1", ["a@example.com"])
+        MailSpoolWorker(mail).run_once()
+        mail.enqueue("report 2", ["a@example.com"])
+        self.assertEqual(len(self.spool._claim(10)), 1)
+        getmtime = os.path.getmtime
+
+        def remove_first(path):
+            os.remove(path)
+            return getmtime(path)
+
+        with patch("os.path.getmtime", side_effect=remove_first):
+            self.spool.recover(older_than=-1)
+            self.spool.keep_sent = -1
+            self.spool.prune()
+        self.assertEqual(self.spool.counts(), {"queued": 0, "sending": 0, "sent": 0, "dead": 0})
+
+    def test_worker_recover_error(self):
+        """the worker logs a failed recover() and goes on draining the spool. """
+        mail = self.spool_mail()
+        mail.enqueue("report", ["a@example.com"])
+        with patch.object(self.spool, "recover", side_effect=OSError("boom")):
+            with self.assertLogs("pyanalysis.mail_spool", "ERROR"):
+                with MailSpoolWorker(mail, interval=0.01):
+                    deadline = time.time() + 5
+                    while not self.server.messages and time.time() < deadline:
+                        time.sleep(0.01)
+        self.assertEqual(len(self.server.messages), 1)
+
+    def test_worker(self):
+        mail = self.spool_mail()
+        path = os.path.join(self.dir.name, "report.csv")
+        with open(path, "w") as f:
+            f.write("a,b\n1,2\n")
+        with MailSpoolWorker(mail, concurrency=2, interval=0.01):
+            for i in range(10):
+                mail.enqueue("report {}".format(i), ["a@example.com"], parts=[FileAttach(path, "report.csv")])
+            deadline = time.time() + 5
+            while len(self.server.messages) < 10 and time.time() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(len(self.server.messages), 10)
+        self.assertEqual(self.spool.counts()["sent"], 10)
+        self.assertIn(b"YSxiCjEsMgo=", self.server.messages[0][2])
+
+
+class TestSMTPPoolServerLimit(MailTestCase):
+    # the server closes the session with 421 after 3 messages.
+    max_messages = 3
+
+    def test_reconnect(self):
+        mail = self.mail(pool_size=1)
+        for i in range(10):
+            mail.send("report", ["a@example.com"])
+        self.assertEqual(len(self.server.messages), 10)
+        self.assertEqual(self.server.connections, 4)
+
+    def test_async_reconnect(self):
+        async def send():
+            mail = AsyncMail("sender@example.com", "password", mail_port=self.server.port, host=self.server.host,
+                             protocol="plain", pool_size=1)
+            for i in range(10):
+                await mail.send("report", ["a@example.com"])
+            await mail.close()
+
+        asyncio.run(send())
+        self.assertEqual(len(self.server.messages), 10)
+        self.assertEqual(self.server.connections, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
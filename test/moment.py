@@ -1,7 +1,27 @@
+import arrow
+import pickle
 import unittest
 
-from datetime import datetime
-from pyanalysis.moment import moment
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from array import array
+from datetime import datetime, timezone
+from pyanalysis.moment import (
+    moment,
+    convert_timestamps,
+    timestamps_to_datetimes,
+    datetimes_to_timestamps,
+    format_timestamps,
+    parse_timestamps,
+    bucket_timestamps,
+    time_windows,
+    ZoneOffsets,
+    get_zone_offsets,
+    Instant,
+)
 
 
 class TestMoment(unittest.TestCase):
@@ -46,3 +66,216 @@ class TestMoment(unittest.TestCase):
     def test_get_days(self):
         m = moment.now().to("Asia/Shanghai")
         print(m.shift(days=2).weekday())
+
+    def test_get_epoch_units(self):
+        expected = "2019-09-15T22:11:23.123000+00:00"
+        self.assertEqual(moment.get(1568585483123).isoformat(), expected)
+        self.assertEqual(moment.get(1568585483123000).isoformat(), expected)
+        self.assertEqual(moment.get(1568585483.123).isoformat(), expected)
+        self.assertEqual(moment.get(1568585483).isoformat(), "2019-09-15T22:11:23+00:00")
+        # exact for int, no float rounding
+        self.assertEqual(moment.get(253402300799999999).isoformat(), "9999-12-31T23:59:59.999999+00:00")
+        m = moment.get(1568585483, tzinfo="Asia/Shanghai")
+        self.assertEqual(m.isoformat(), "2019-09-16T06:11:23+08:00")
+        self.assertIsInstance(m, type(moment.now()))
+
+    def test_get_fast_path_same_as_arrow(self):
+        factory = arrow.ArrowFactory(type(moment.now()))
+        cases = [
+            ("2019-09-10 00:00:00",),
+            ("2019-09-10T08:00:00.5+08:00",),
+            ("2019-09-10",),
+            ("2019-09-10T24:00:00",),
+            ("2019-09-10 00:00:00", "YYYY-MM-DD HH:mm:ss"),
+            ("2019/9/10 8:00:00.123 +0800", "YYYY/M/D H:mm:ss.SSS Z"),
+            ("2019-09-10 08:00 am", "YYYY-MM-DD hh:mm a"),
+        ]
+        for args in cases:
+            for kwargs in ({}, {"tzinfo": "Asia/Shanghai"}):
+                expected = factory.get(*args, **kwargs)
+                m = moment.get(*args, **kwargs)
+                self.assertEqual(m, expected)
+                self.assertEqual(m.utcoffset(), expected.utcoffset())
+        with self.assertRaises(ValueError):
+            moment.get("2019-13-10 00:00:00", "YYYY-MM-DD HH:mm:ss")
+
+    def test_integer_timestamps(self):
+        m = moment.get("2019-09-15T22:11:23.999999+00:00")
+        self.assertEqual(m.second_timestamp, 1568585483)
+        self.assertEqual(m.millisecond_timestamp, 1568585483999)
+        self.assertEqual(m.microsecond_timestamp, 1568585483999999)
+        m = moment.get("9999-12-31T23:59:59.999999+00:00")
+        self.assertEqual(m.microsecond_timestamp, 253402300799999999)
+        m = moment.get("1969-12-31T23:59:58.500000+00:00")
+        self.assertEqual((m.second_timestamp, m.millisecond_timestamp), (-2, -1500))
+        self.assertEqual(m.shift(seconds=2).millisecond_timestamp, 500)
+
+    def test_from_millis_micros(self):
+        m = moment.from_millis(1568585483123, tzinfo="Asia/Shanghai")
+        self.assertEqual(m.isoformat(), "2019-09-16T06:11:23.123000+08:00")
+        self.assertEqual(m.millisecond_timestamp, 1568585483123)
+        m = moment.from_micros(1568585483123456)
+        self.assertEqual(m.isoformat(), "2019-09-15T22:11:23.123456+00:00")
+        self.assertEqual(m.to("Asia/Shanghai").microsecond_timestamp, 1568585483123456)
+
+
+class TestBatchTimestamps(unittest.TestCase):
+    def test_convert_timestamps(self):
+        self.assertEqual(convert_timestamps([1568585483123, -1], "ms", "s"), [1568585483, -1])
+        self.assertEqual(convert_timestamps([1568585483], "s", "us"), [1568585483000000])
+        self.assertEqual(convert_timestamps([1.001, 2.5], "s", "ms"), [1001, 2500])
+        result = convert_timestamps(array("q", [1568585483123]), "ms", "us")
+        self.assertEqual(result, array("q", [1568585483123000]))
+        with self.assertRaises(RuntimeError):
+            convert_timestamps([1], "ns", "s")
+
+    def test_datetimes(self):
+        values = [1568585483123456, 0]
+        result = timestamps_to_datetimes(values, unit="us", tz="Asia/Shanghai")
+        self.assertEqual(result[0].strftime("%Y-%m-%d %H:%M:%S.%f"), "2019-09-16 06:11:23.123456")
+        self.assertEqual(datetimes_to_timestamps(result, unit="us"), values)
+        naive = [dt.replace(tzinfo=None) for dt in result]
+        self.assertEqual(datetimes_to_timestamps(naive, unit="us", tz="Asia/Shanghai"), values)
+        self.assertEqual(datetimes_to_timestamps([datetime(1970, 1, 1, tzinfo=timezone.utc)], unit="ms"), [0])
+
+    def test_format_parse(self):
+        values = [1568585483, 1568585483 + 86400 * 400, -1]
+        for tz in (None, "Asia/Shanghai", "America/New_York", "+05:45"):
+            strings = format_timestamps(values, tz=tz)
+            expected = [moment.get(value).to(tz or "UTC").format("YYYY-MM-DD HH:mm:ss") for value in values]
+            self.assertEqual(strings, expected)
+            self.assertEqual(parse_timestamps(strings, tz=tz), values)
+
+        self.assertEqual(format_timestamps([1568585483123], "%H:%M:%S.%f", unit="ms"), ["22:11:23.123000"])
+        self.assertEqual(format_timestamps([1568585483], "%Y-%m-%d", tz="Asia/Shanghai"), ["2019-09-16"])
+        self.assertEqual(parse_timestamps(["2019-09-15T22:11:23"], unit="ms"), [1568585483000])
+        self.assertEqual(parse_timestamps(["2019-09-16 06:11:23 +0800"], "%Y-%m-%d %H:%M:%S %z"), [1568585483])
+        for value in ("2019-13-01 00:00:00", "2019-09-16 24:00:00", "2019-09-16 06:11", "2019/09/16 06:11:23"):
+            with self.assertRaises(ValueError):
+                parse_timestamps([value])
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        values = numpy.array([1568585483123, -1], dtype="int64")
+        self.assertEqual(convert_timestamps(values, "ms", "s").tolist(), [1568585483, -1])
+        result = timestamps_to_datetimes(values, unit="ms", tz="Asia/Shanghai")
+        self.assertEqual(str(result[0]), "2019-09-16T06:11:23.123000")
+        utc = timestamps_to_datetimes(values, unit="ms")
+        self.assertEqual(datetimes_to_timestamps(utc, unit="ms").tolist(), values.tolist())
+        self.assertEqual(parse_timestamps(numpy.array(["1970-01-01 00:00:01"]), unit="ms").tolist(), [1000])
+
+
+class TestTimeBuckets(unittest.TestCase):
+    def test_bucket_timestamps(self):
+        # 2019-09-16 06:11:23 +08:00
+        values = [1568585483]
+        cases = [
+            ("minute", 1, "2019-09-16 06:11:00"),
+            ("hour", 6, "2019-09-16 06:00:00"),
+            ("day", 1, "2019-09-16 00:00:00"),
+            ("week", 1, "2019-09-16 00:00:00"),
+            ("month", 1, "2019-09-01 00:00:00"),
+            ("month", 3, "2019-07-01 00:00:00"),
+        ]
+        for unit, step, expected in cases:
+            result = bucket_timestamps(values, unit, "Asia/Shanghai", step=step)
+            self.assertEqual(format_timestamps(result, tz="Asia/Shanghai"), [expected])
+
+        result = bucket_timestamps(array("q", [1568585483123]), "day", ts_unit="ms")
+        self.assertEqual(result, array("q", [1568505600000]))
+        with self.assertRaises(RuntimeError):
+            bucket_timestamps(values, "year")
+
+    def test_bucket_daylight_saving(self):
+        tz = "America/New_York"
+        # 2024-11-03 01:30 -04:00 and 01:30 -05:00, the repeated hour
+        first, second = 1730611800, 1730615400
+        days = bucket_timestamps([first, second], "day", tz)
+        self.assertEqual(days, [1730606400, 1730606400])
+        self.assertEqual(moment.get(days[0], tzinfo=tz).format("YYYY-MM-DD HH:mm:ss ZZ"), "2024-11-03 00:00:00 -04:00")
+        self.assertEqual(bucket_timestamps([first, second], "hour", tz), [first - 1800, second - 1800])
+        for name in ("America/New_York", "Australia/Lord_Howe", "Europe/London"):
+            values = list(range(1704067200, 1735689600, 86400 * 3 + 7919))
+            for unit in ("day", "week", "month"):
+                expected = [moment.get(value).to(name).floor(unit).int_timestamp for value in values]
+                self.assertEqual(bucket_timestamps(values, unit, name), expected)
+
+    def test_time_windows(self):
+        windows = list(time_windows("2024-11-02 12:00:00", "2024-11-04 00:00:00", "day", "America/New_York",
+                                    fmt="%Y-%m-%d %H:%M:%S%z"))
+        self.assertEqual(windows, [
+            ("2024-11-02 00:00:00-0400", "2024-11-03 00:00:00-0400"),
+            ("2024-11-03 00:00:00-0400", "2024-11-04 00:00:00-0500"),
+        ])
+        windows = list(time_windows(1704067200, 1711929600, "month", "Asia/Shanghai"))
+        self.assertEqual(len(windows), 4)
+        self.assertEqual(windows[0][0].format("YYYY-MM-DD HH:mm ZZ"), "2024-01-01 00:00 +08:00")
+        self.assertEqual([end for _, end in windows[:-1]], [start for start, _ in windows[1:]])
+        hours = list(time_windows("2024-11-03 00:00:00", "2024-11-03 02:00:00", "hour", "America/New_York"))
+        self.assertEqual([end.int_timestamp - start.int_timestamp for start, end in hours], [3600, 3600, 3600])
+
+
+class TestZoneOffsets(unittest.TestCase):
+    def test_transitions(self):
+        zone = get_zone_offsets("America/New_York")
+        self.assertIs(zone, get_zone_offsets("America/New_York"))
+        # 2024-03-10 02:00 -05:00 and 2024-11-03 02:00 -04:00
+        self.assertEqual(zone.transitions(1704067200, 1735689600), [(1710054000, -14400), (1730613600, -18000)])
+        self.assertEqual(zone.utc_offsets([1710053999, 1710054000, 1730613599, 1730613600]),
+                         [-18000, -14400, -14400, -18000])
+        # 02:30 does not exist on 2024-03-10 and 01:30 happens twice on 2024-11-03, both take fold=0.
+        local = [1710037800, 1730597400]
+        self.assertEqual(zone.local_offsets(local), [-18000, -14400])
+        self.assertEqual(zone.to_utc(local), [1710055800, 1730611800])
+        self.assertEqual(zone.to_local([1730611800, 1730615400]), [1730597400, 1730597400])
+
+    def test_fixed_zone(self):
+        zone = ZoneOffsets("+08:00")
+        self.assertEqual(zone.fixed_offset, 28800)
+        self.assertEqual(zone.transitions(0, 1735689600), [])
+        self.assertEqual(zone.to_local([0, 1]), [28800, 28801])
+        self.assertEqual(get_zone_offsets().utc_offset(0), 0)
+
+    def test_moment_to(self):
+        m = moment.from_millis(1730611800123)
+        for tz in ("America/New_York", "Asia/Shanghai", "+05:45", timezone.utc):
+            converted = m.to(tz)
+            expected = arrow.Arrow.fromdatetime(m.datetime).to(tz)
+            self.assertEqual(converted.isoformat(), expected.isoformat())
+            self.assertEqual(converted.fold, expected.fold)
+            self.assertEqual(converted.millisecond_timestamp, 1730611800123)
+
+
+class TestInstant(unittest.TestCase):
+    def test_timestamps(self):
+        instant = Instant.from_millis(1568585483123, "Asia/Shanghai")
+        self.assertEqual(instant.second_timestamp, 1568585483)
+        self.assertEqual(instant.millisecond_timestamp, 1568585483123)
+        self.assertEqual(instant.microsecond_timestamp, 1568585483123000)
+        self.assertEqual(Instant.from_seconds(-1).millisecond_timestamp, -1000)
+        m = moment.get("2019-09-16T06:11:23.123+08:00")
+        self.assertEqual(Instant.of(m), instant)
+        self.assertEqual(Instant.of(m.datetime).tzinfo, m.tzinfo)
+        with self.assertRaises(RuntimeError):
+            Instant.of(datetime(2019, 9, 16))
+
+    def test_compare_hash(self):
+        a = Instant.from_seconds(1568585483, "Asia/Shanghai")
+        b = a.to("America/New_York")
+        c = Instant.from_micros(1568585483000001)
+        self.assertEqual(a, b)
+        self.assertEqual(len({a, b, c}), 2)
+        self.assertTrue(a < c and c > b and a <= b and a >= b and a != c)
+        self.assertEqual(sorted([c, a]), [a, c])
+        self.assertEqual(pickle.loads(pickle.dumps(b)), b)
+        self.assertFalse(hasattr(a, "__dict__"))
+
+    def test_to_moment(self):
+        instant = Instant.from_millis(1568585483123, "Asia/Shanghai")
+        self.assertEqual(str(instant), "2019-09-16T06:11:23.123000+08:00")
+        self.assertEqual(instant.format("YYYY-MM-DD HH:mm:ss"), "2019-09-16 06:11:23")
+        self.assertEqual(instant.floor("day").format("YYYY-MM-DD HH:mm:ss ZZ"), "2019-09-16 00:00:00 +08:00")
+        self.assertEqual(instant.year, 2019)
+        self.assertEqual(instant.to_moment().millisecond_timestamp, 1568585483123)
+        with self.assertRaises(AttributeError):
+            instant.no_such_attribute
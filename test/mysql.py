@@ -10,24 +10,44 @@ MySQL 模块单元测试
 - Trans: 事务的开始、提交、回滚控制
 - 连接池注册表: add_pool/get_pool 全局函数
 - no_warning 装饰器
+- CircuitBreaker: 熔断器的状态切换、连接池的快速失败以及恢复后连接池大小不变
+- 连接归还时的会话状态清理：按需回滚、COM_RESET_CONNECTION、自定义 SQL
+- PlanGuard: SQL 指纹、EXPLAIN 抽样与执行计划问题检测
+
+TestSessionResetProtocol 使用进程内的模拟服务器（test/fake_mysql.py），验证真实 pymysql 协议下的事务状态判断。
 """
 
 import unittest
 from unittest.mock import Mock, patch, MagicMock
+import json
+import logging
 import datetime
 import decimal
 import queue
+import time
 import warnings
 
+import pymysql
+
 import pyanalysis.mysql as mysql_module
+from test.fake_mysql import FakeMySQLServer
+from pymysql.constants import SERVER_STATUS
+
 from pyanalysis.mysql import (
+    _Connection,
     Pool,
     Conn,
     Trans,
+    CircuitBreaker,
+    CircuitBreakerOpenError,
+    PlanGuard,
     GetConnectionFromPoolError,
     add_pool,
     get_pool,
+    sql_fingerprint,
 )
+from pyanalysis.log_context import get_log_context, log_context
+from pyanalysis.logger import JsonFormatter
 
 # 通过模块访问内部的 __pool 注册表（用于测试清理）
 _pool_registry = mysql_module.__pool
@@ -311,6 +331,24 @@ class TestConn(unittest.TestCase):
         self.assertEqual(len(results), 2)
         mock_cursor.fetchmany.assert_called_with(size=1)
 
+    def test_query_columns(self):
+        """测试列式查询：应分批读取元组并返回按列存储的 ResultSet"""
+        mock_cursor = MagicMock()
+        mock_cursor.description = (("id",), ("price",))
+        mock_cursor.fetchmany.side_effect = [
+            [(1, decimal.Decimal("1.5")), (2, decimal.Decimal("2.5"))],
+            [(3, decimal.Decimal("3.5"))],
+        ]
+        self.mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        conn = Conn(self.pool_name)
+        result = conn.query_columns("SELECT id, price FROM products", size=2)
+
+        self.assertEqual(result.columns, ["id", "price"])
+        self.assertEqual(list(result["id"]), [1, 2, 3])
+        self.assertEqual(list(result["price"]), [1.5, 2.5, 3.5])
+        mock_cursor.fetchmany.assert_called_with(2)
+
     def test_execute_success(self):
         """测试执行语句成功：应返回受影响行数并自动提交事务"""
         mock_cursor = MagicMock()
@@ -498,5 +536,620 @@ class TestNoWarningDecorator(unittest.TestCase):
         mock_warnings.catch_warnings.assert_called_once()
 
 
+class TestCircuitBreaker(unittest.TestCase):
+    """
+    熔断器 CircuitBreaker 的单元测试
+
+    测试熔断器的状态切换：
+    - closed: 连续失败达到阈值后熔断
+    - open: 请求快速失败，超过恢复时间后进入 half_open
+    - half_open: 只放行有限的探测请求，成功则恢复，失败则再次熔断
+    """
+
+    @patch("pyanalysis.mysql.time")
+    def test_open_after_threshold(self, mock_time):
+        """测试连续失败达到阈值后熔断：熔断后请求应被拒绝"""
+        mock_time.monotonic.return_value = 100.0
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=10)
+
+        self.assertFalse(breaker.record_failure())
+        self.assertFalse(breaker.record_failure())
+        self.assertTrue(breaker.allow_request())
+        self.assertTrue(breaker.record_failure())
+
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+    @patch("pyanalysis.mysql.time")
+    def test_success_resets_failures(self, mock_time):
+        """测试成功会清空连续失败计数：失败不连续时不应熔断"""
+        mock_time.monotonic.return_value = 100.0
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    @patch("pyanalysis.mysql.time")
+    def test_half_open_probe(self, mock_time):
+        """测试 half_open 状态：超时后只放行有限探测请求，成功后恢复"""
+        mock_time.monotonic.return_value = 100.0
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, half_open_max_calls=2)
+        breaker.record_failure()
+
+        mock_time.monotonic.return_value = 111.0
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow_request())
+
+    @patch("pyanalysis.mysql.time")
+    def test_half_open_failure_reopen(self, mock_time):
+        """测试 half_open 状态探测失败：应再次熔断并重新计时"""
+        mock_time.monotonic.return_value = 100.0
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10)
+        breaker.record_failure()
+
+        mock_time.monotonic.return_value = 111.0
+        self.assertTrue(breaker.allow_request())
+        self.assertTrue(breaker.record_failure())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        mock_time.monotonic.return_value = 115.0
+        self.assertFalse(breaker.allow_request())
+
+
+class TestPoolCircuitBreaker(unittest.TestCase):
+    """
+    连接池熔断的单元测试
+
+    测试连接池与熔断器的配合：
+    - 查询出现连接类错误时计入失败，熔断后获取连接快速失败
+    - 业务类错误（如语法错误）不计入失败
+    - 熔断后后台探测连接，数据库恢复后熔断器关闭
+    - 数据库宕机后恢复，原连接池中的连接重连后继续可用
+    """
+
+    def setUp(self):
+        """测试前准备：设置测试用的连接池名称"""
+        self.pool_name = "test_breaker_pool"
+
+    def tearDown(self):
+        """测试后清理：从全局注册表中移除测试连接池"""
+        if self.pool_name in _pool_registry:
+            del _pool_registry[self.pool_name]
+
+    def _lost_connection_cursor(self, mock_conn):
+        mock_cursor = MagicMock()
+        mock_cursor.execute.side_effect = pymysql.err.OperationalError(2013, "Lost connection to MySQL server")
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+    @patch("pyanalysis.mysql._Connection")
+    def test_fail_fast_when_open(self, mock_conn_class):
+        """测试熔断后快速失败：连续连接错误后获取连接应立即抛出 CircuitBreakerOpenError"""
+        mock_conn = MagicMock()
+        mock_conn_class.return_value = mock_conn
+        self._lost_connection_cursor(mock_conn)
+
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=60)
+        pool = Pool(size=3, name=self.pool_name, host="localhost", breaker=breaker)
+        add_pool(pool)
+
+        for _ in range(2):
+            conn = Conn(self.pool_name)
+            with self.assertRaises(pymysql.err.OperationalError):
+                conn.query("SELECT 1")
+            conn.close()
+
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        start = time.monotonic()
+        with self.assertRaises(CircuitBreakerOpenError):
+            Conn(self.pool_name)
+        self.assertLess(time.monotonic() - start, 0.1)
+        # 熔断异常是获取连接异常的子类，原有的异常处理依然有效
+        self.assertTrue(issubclass(CircuitBreakerOpenError, GetConnectionFromPoolError))
+
+    @patch("pyanalysis.mysql._Connection")
+    def test_query_error_not_counted(self, mock_conn_class):
+        """测试业务类错误不计入失败：语法错误不应导致熔断"""
+        mock_conn = MagicMock()
+        mock_conn_class.return_value = mock_conn
+        mock_cursor = MagicMock()
+        mock_cursor.execute.side_effect = pymysql.err.ProgrammingError(1064, "syntax error")
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+        pool = Pool(size=3, name=self.pool_name, host="localhost", breaker=breaker)
+        add_pool(pool)
+
+        conn = Conn(self.pool_name)
+        with self.assertRaises(pymysql.err.ProgrammingError):
+            conn.query("SELEC 1")
+        conn.close()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    @patch("pyanalysis.mysql._Connection")
+    def test_probe_recovery(self, mock_conn_class):
+        """测试后台探测恢复：熔断后探测连接成功，熔断器应关闭且连接放回池中"""
+        def make_conn(*args, **kwargs):
+            # 与真实连接一样，属于连接池的连接关闭时放回连接池
+            mock_conn = MagicMock()
+            mock_conn._pool = None
+            mock_conn.close.side_effect = lambda: mock_conn._pool and mock_conn._pool.put_connection(mock_conn)
+            self._lost_connection_cursor(mock_conn)
+            return mock_conn
+
+        mock_conn_class.side_effect = make_conn
+
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+        pool = Pool(size=3, name=self.pool_name, host="localhost", breaker=breaker)
+        add_pool(pool)
+
+        conn = Conn(self.pool_name)
+        with self.assertRaises(pymysql.err.OperationalError):
+            conn.query("SELECT 1")
+        conn.close()
+
+        for _ in range(100):
+            if breaker.state == CircuitBreaker.CLOSED:
+                break
+            time.sleep(0.01)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        pool._probe_thread.join(1)
+        # 初始化的 3 个连接加上 1 个探测连接，没有丢失的连接，探测连接被关闭
+        self.assertEqual(mock_conn_class.call_count, 4)
+        self.assertEqual(pool.size(), 3)
+
+    def test_probe_keeps_size(self):
+        """测试多次熔断恢复后连接池大小不变：探测连接只补充熔断期间丢失的连接"""
+        with FakeMySQLServer(rows=10) as server:
+            breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+            pool = Pool(size=3, name=self.pool_name, host=server.host, port=server.port, user="root", password="",
+                        breaker=breaker)
+            for lost in (0, 1, 2):
+                # 熔断期间丢弃的连接，由探测线程在恢复后补充
+                for _ in range(lost):
+                    conn = pool.get_connection()
+                    conn._pool = None
+                    conn.close()
+                    pool._lose_connection()
+                pool._on_failure(pymysql.err.OperationalError(2013, "Lost connection to MySQL server"))
+                self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+                pool._probe_thread.join(5)
+                self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+                self.assertEqual(pool.size(), 3)
+            while pool.size():
+                conn = pool.get_connection()
+                conn._pool = None
+                conn.close()
+
+    def test_recover_after_outage(self):
+        """测试数据库宕机恢复：熔断打开，服务器恢复后无需新建连接池，查询应重新成功且连接池大小不变"""
+        server = FakeMySQLServer(rows=10).start()
+        port = server.port
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+        pool = Pool(size=3, name=self.pool_name, host=server.host, port=port, user="root", password="",
+                    breaker=breaker)
+        add_pool(pool)
+        server.stop()
+
+        conn = Conn(self.pool_name)
+        with self.assertRaises(pymysql.err.MySQLError):
+            conn.query("SELECT * FROM t LIMIT 1")
+        conn.close()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitBreakerOpenError):
+            Conn(self.pool_name)
+
+        with FakeMySQLServer(rows=10, port=port):
+            pool._probe_thread.join(5)
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+            # 池中的每个连接都被取用一次以上
+            for _ in range(6):
+                conn = Conn(self.pool_name)
+                self.assertEqual(len(conn.query("SELECT * FROM t LIMIT 1")), 1)
+                conn.close()
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+            self.assertEqual(pool.size(), 3)
+            while pool.size():
+                conn = pool.get_connection()
+                conn._pool = None
+                conn.close()
+
+
+class TestSessionReset(unittest.TestCase):
+    """
+    连接归还时会话状态清理的单元测试
+
+    测试 put_connection 的清理策略：
+    - rollback: 只有事务未结束时才回滚，省去一次网络往返
+    - connection: 使用 COM_RESET_CONNECTION 清理整个会话
+    - sql: 回滚后执行配置的 SQL 语句
+    """
+
+    def setUp(self):
+        """测试前准备：设置测试用的连接池名称"""
+        self.pool_name = "test_reset_pool"
+
+    def _mock_conn(self, in_transaction):
+        conn = MagicMock()
+        conn._pool = None
+        conn.in_transaction.return_value = in_transaction
+        conn.autocommit_mode = False
+        conn.get_autocommit.return_value = False
+        return conn
+
+    def test_in_transaction(self):
+        """测试事务状态判断：根据服务端状态位判断，出错后视为有未结束的事务"""
+        conn = _Connection.__new__(_Connection)
+        conn._result = None
+        conn.server_status = SERVER_STATUS.SERVER_STATUS_AUTOCOMMIT
+        self.assertFalse(conn.in_transaction())
+
+        conn.server_status |= SERVER_STATUS.SERVER_STATUS_IN_TRANS
+        self.assertTrue(conn.in_transaction())
+
+        conn.server_status = 0
+        conn._dirty = True
+        self.assertTrue(conn.in_transaction())
+
+    def test_query_marks_transaction(self):
+        """测试非自动提交模式下查询：结果集的 EOF 包不更新服务端状态，查询后应视为有未结束的事务"""
+        conn = _Connection.__new__(_Connection)
+        conn._result = None
+        conn.server_status = SERVER_STATUS.SERVER_STATUS_AUTOCOMMIT
+        with patch.object(pymysql.connections.Connection, "query", return_value=1), \
+                patch.object(pymysql.connections.Connection, "get_autocommit", return_value=True):
+            conn.query("SELECT 1")
+        self.assertFalse(conn.in_transaction())
+
+        conn.server_status = 0
+        with patch.object(pymysql.connections.Connection, "query", return_value=1), \
+                patch.object(pymysql.connections.Connection, "get_autocommit", return_value=False):
+            conn.query("SELECT 1")
+        self.assertTrue(conn.in_transaction())
+
+    @patch("pyanalysis.mysql._Connection")
+    def test_skip_rollback_without_transaction(self, mock_conn_class):
+        """测试没有未结束的事务时归还连接：不应发送 rollback"""
+        pool = Pool(size=3, name=self.pool_name, host="localhost")
+        conn = self._mock_conn(in_transaction=False)
+        pool.put_connection(conn)
+        conn.rollback.assert_not_called()
+        conn.autocommit.assert_not_called()
+
+    @patch("pyanalysis.mysql._Connection")
+    def test_rollback_open_transaction(self, mock_conn_class):
+        """测试有未结束的事务时归还连接：应回滚，并恢复被修改的 autocommit"""
+        pool = Pool(size=3, name=self.pool_name, host="localhost")
+        conn = self._mock_conn(in_transaction=True)
+        conn.get_autocommit.return_value = True
+        pool.put_connection(conn)
+        conn.rollback.assert_called_once()
+        conn.autocommit.assert_called_once_with(False)
+
+    @patch("pyanalysis.mysql._Connection")
+    def test_reset_connection_mode(self, mock_conn_class):
+        """测试 connection 清理模式：应发送 COM_RESET_CONNECTION 而不是 rollback"""
+        pool = Pool(size=3, name=self.pool_name, host="localhost", reset_mode="connection")
+        conn = self._mock_conn(in_transaction=True)
+        pool.put_connection(conn)
+        conn.reset_session.assert_called_once()
+        conn.rollback.assert_not_called()
+
+    @patch("pyanalysis.mysql._Connection")
+    def test_reset_connection_fallback(self, mock_conn_class):
+        """测试服务端不支持 COM_RESET_CONNECTION：应退回到回滚"""
+        pool = Pool(size=3, name=self.pool_name, host="localhost", reset_mode="connection")
+        conn = self._mock_conn(in_transaction=True)
+        conn.reset_session.side_effect = pymysql.err.InternalError(1047, "Unknown command")
+        pool.put_connection(conn)
+        conn.rollback.assert_called_once()
+        self.assertEqual(pool.size(), 4)
+
+    @patch("pyanalysis.mysql._Connection")
+    def test_reset_sql_mode(self, mock_conn_class):
+        """测试 sql 清理模式：应依次执行配置的 SQL 语句"""
+        sqls = ["SET @user_id = NULL", "DROP TEMPORARY TABLE IF EXISTS tmp_report"]
+        pool = Pool(size=3, name=self.pool_name, host="localhost", reset_mode="sql", reset_sqls=sqls)
+        conn = self._mock_conn(in_transaction=False)
+        mock_cursor = MagicMock()
+        conn.cursor.return_value.__enter__.return_value = mock_cursor
+        pool.put_connection(conn)
+
+        self.assertEqual([c[0][0] for c in mock_cursor.execute.call_args_list], sqls)
+
+    @patch("pyanalysis.mysql._Connection")
+    def test_invalid_reset_mode(self, mock_conn_class):
+        """测试非法的清理模式：应抛出 RuntimeError"""
+        with self.assertRaises(RuntimeError):
+            Pool(size=3, name=self.pool_name, host="localhost", reset_mode="unknown")
+        with self.assertRaises(RuntimeError):
+            Pool(size=3, name=self.pool_name, host="localhost", reset_mode="sql")
+
+
+class TestLogContext(unittest.TestCase):
+    """
+    查询期间的日志上下文
+
+    Conn 的查询方法执行期间（连接池开启 log_context 时），日志上下文中应带有连接池名与 SQL 指纹，结束后恢复原来的上下文
+    """
+
+    def setUp(self):
+        self.pool_name = "test_log_context_db"
+        self.mock_pool = MagicMock()
+        self.mock_pool.name = self.pool_name
+        self.mock_pool.plan_guard = None
+        self.mock_pool.log_context = True
+        _pool_registry[self.pool_name] = self.mock_pool
+        self.cursor = self.mock_pool.get_connection.return_value.cursor.return_value.__enter__.return_value
+        self.cursor.fetchall.return_value = []
+
+    def tearDown(self):
+        del _pool_registry[self.pool_name]
+
+    def test_query_context(self):
+        """测试查询期间的上下文：应包含连接池名与 SQL 指纹，并保留外层的字段"""
+        contexts = []
+        self.cursor.execute.side_effect = lambda *args: contexts.append(get_log_context())
+
+        with log_context(request_id="r-1"):
+            Conn(self.pool_name).query("SELECT * FROM t WHERE id = 1")
+            self.assertEqual(get_log_context(), {"request_id": "r-1"})
+        self.assertEqual(get_log_context(), {})
+        self.assertEqual(len(contexts), 1)
+        # SQL 指纹在格式化日志时才计算
+        context = dict(contexts[0], sql_fingerprint=str(contexts[0]["sql_fingerprint"]))
+        self.assertEqual(context, {
+            "request_id": "r-1",
+            "pool": self.pool_name,
+            "sql_fingerprint": "select * from t where id = ?",
+        })
+
+    def test_context_off(self):
+        """测试连接池未开启日志上下文：查询期间不绑定上下文"""
+        contexts = []
+        self.cursor.execute.side_effect = lambda *args: contexts.append(get_log_context())
+        self.mock_pool.log_context = False
+        Conn(self.pool_name).query("SELECT * FROM t WHERE id = 1")
+        self.assertEqual(contexts, [{}])
+
+    def test_json_formatter(self):
+        """测试查询期间的日志：JsonFormatter 输出连接池名与 SQL 指纹"""
+        lines = []
+        formatter = JsonFormatter(backend="json")
+        self.cursor.execute.side_effect = lambda *args: lines.append(
+            formatter.format(logging.LogRecord("app", logging.WARNING, __file__, 1, "slow query", (), None)))
+
+        Conn(self.pool_name).query("SELECT * FROM t WHERE name = 'tom'")
+        self.assertEqual(json.loads(lines[0])["sql_fingerprint"], "select * from t where name = ?")
+        self.assertEqual(json.loads(lines[0])["pool"], self.pool_name)
+
+    def test_error_context(self):
+        """测试查询出错：上下文同样应恢复"""
+        self.cursor.execute.side_effect = RuntimeError("boom")
+        with self.assertRaises(RuntimeError):
+            Conn(self.pool_name).execute("UPDATE t SET a = 1")
+        self.assertEqual(get_log_context(), {})
+
+
+class TestSessionResetProtocol(unittest.TestCase):
+    """
+    基于模拟服务器的会话状态清理测试
+
+    pymysql 只从 OK 包读取服务端状态，结果集的 EOF 包中的状态会被忽略，
+    测试在真实协议下归还连接时是否正确发送 ROLLBACK：
+    - 非自动提交模式下查询后归还：需要回滚，结束查询开启的事务（快照）
+    - 提交后归还、未执行语句归还、自动提交模式：不发送 ROLLBACK
+    - connection 清理模式：COM_RESET_CONNECTION 后恢复字符集与 autocommit，恢复失败时关闭连接
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeMySQLServer(rows=10).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def tearDown(self):
+        for name in ("test_protocol_autocommit_off", "test_protocol_autocommit_on", "test_protocol_reset"):
+            if name in _pool_registry:
+                del _pool_registry[name]
+
+    def _pool(self, name, autocommit, **kwargs):
+        pool = Pool(
+            size=3,
+            name=name,
+            host=self.server.host,
+            port=self.server.port,
+            user="root",
+            password="",
+            autocommit=autocommit,
+            **kwargs
+        )
+        add_pool(pool)
+        self.server.clear()
+        return pool
+
+    def _run(self, pool_name, func):
+        conn = Conn(pool_name)
+        func(conn)
+        conn.close()
+
+    def test_autocommit_off(self):
+        """测试非自动提交模式：查询后归还应回滚，提交后归还或未执行语句归还不应回滚"""
+        self._pool("test_protocol_autocommit_off", autocommit=False)
+        self._run("test_protocol_autocommit_off", lambda conn: conn.query("SELECT * FROM t LIMIT 2"))
+        self._run("test_protocol_autocommit_off", lambda conn: list(conn.query_range("SELECT * FROM t", size=3)))
+        self._run("test_protocol_autocommit_off", lambda conn: conn.execute("UPDATE t SET a = 1"))
+        self._run("test_protocol_autocommit_off", lambda conn: None)
+
+        self.assertEqual(self.server.queries, [
+            "SELECT * FROM t LIMIT 2", "ROLLBACK",
+            "SELECT * FROM t", "ROLLBACK",
+            "UPDATE t SET a = 1", "COMMIT",
+        ])
+
+    def test_autocommit_on(self):
+        """测试自动提交模式：查询后归还不应回滚"""
+        self._pool("test_protocol_autocommit_on", autocommit=True)
+        self._run("test_protocol_autocommit_on", lambda conn: conn.query_one("SELECT * FROM t LIMIT 1"))
+        self.assertEqual(self.server.queries, ["SELECT * FROM t LIMIT 1"])
+
+    def test_reset_connection(self):
+        """测试 connection 清理模式：COM_RESET_CONNECTION 清空会话后，应恢复字符集与 autocommit"""
+        self._pool("test_protocol_reset", autocommit=False, charset="utf8mb4", reset_mode="connection")
+        conn = Conn("test_protocol_reset")
+        native = conn.get_native_conn()
+        conn.query("SELECT * FROM t LIMIT 1")
+        conn.close()
+
+        self.assertEqual(self.server.commands[0x1F], 1)
+        self.assertEqual(self.server.queries[0], "SELECT * FROM t LIMIT 1")
+        self.assertTrue(self.server.queries[1].startswith("SET NAMES utf8mb4"))
+        self.assertEqual(self.server.queries[2].replace(" ", "").upper(), "SETAUTOCOMMIT=0")
+        self.assertTrue(native.open)
+        self.assertFalse(native.get_autocommit())
+        self.assertFalse(native.in_transaction())
+
+    def test_reset_connection_old_pymysql(self):
+        """测试 PyMySQL 1.0：没有 set_character_set 时应使用 set_charset 恢复字符集"""
+        self._pool("test_protocol_reset", autocommit=False, charset="utf8mb4", reset_mode="connection")
+        conn = Conn("test_protocol_reset")
+        native = conn.get_native_conn()
+        with patch.object(_Connection, "set_character_set", None), \
+                patch.object(_Connection, "set_charset", autospec=True) as set_charset:
+            conn.close()
+        set_charset.assert_called_once_with(native, "utf8mb4")
+        self.assertTrue(native.open)
+        self.assertFalse(native.get_autocommit())
+
+    def test_reset_connection_error(self):
+        """测试恢复会话设置失败：不应把清理了一半的连接放回池中复用，连接关闭，再次取用时重连"""
+        pool = self._pool("test_protocol_reset", autocommit=False, reset_mode="connection")
+        conn = Conn("test_protocol_reset")
+        native = conn.get_native_conn()
+        with patch.object(_Connection, "set_character_set", side_effect=AttributeError("collation")), \
+                self.assertLogs("pyanalysis.mysql", "WARNING"):
+            conn.close()
+        self.assertFalse(native.open)
+        self.assertEqual(pool.size(), 3)
+
+        native.ping()
+        self.assertTrue(native.open)
+        self.assertFalse(native.get_autocommit())
+
+
+class TestPlanGuard(unittest.TestCase):
+    """
+    执行计划检查 PlanGuard 的单元测试
+
+    测试 PlanGuard 的核心功能：
+    - SQL 指纹：字面量、占位符、IN 列表归一化
+    - 抽样：按指纹稳定抽样
+    - 计划分析：全表扫描、filesort、临时表
+    - Conn 查询后在旁路连接上执行 EXPLAIN 并缓存结果
+    - hook 或 EXPLAIN 出错只记录日志，不影响查询
+    """
+
+    def setUp(self):
+        """测试前准备：创建 mock 连接池并注册到全局注册表"""
+        self.pool_name = "test_plan_db"
+        self.mock_pool = MagicMock()
+        self.mock_conn = MagicMock()
+        self.mock_pool.get_connection.return_value = self.mock_conn
+        _pool_registry[self.pool_name] = self.mock_pool
+
+    def tearDown(self):
+        """测试后清理：从全局注册表中移除测试连接池"""
+        if self.pool_name in _pool_registry:
+            del _pool_registry[self.pool_name]
+
+    def test_sql_fingerprint(self):
+        """测试 SQL 指纹：仅字面量不同的语句应得到相同的指纹"""
+        self.assertEqual(
+            sql_fingerprint("SELECT * FROM users WHERE id = 1 AND name = 'tom'"),
+            sql_fingerprint("select *  from users\nwhere id = 25 and name = 'jerry'"),
+        )
+        self.assertEqual(
+            sql_fingerprint("SELECT * FROM users WHERE id IN (?, ?, ?)"),
+            "select * from users where id in (?+)",
+        )
+
+    def test_sampled(self):
+        """测试抽样：抽样率为 0 时从不抽样，为 1 时总是抽样"""
+        self.assertFalse(PlanGuard(sample_rate=0).sampled("select ? from t"))
+        self.assertTrue(PlanGuard(sample_rate=1).sampled("select ? from t"))
+
+    def test_analyze(self):
+        """测试计划分析：超过行数阈值的全表扫描、filesort、临时表应被标记"""
+        guard = PlanGuard(row_threshold=1000)
+        plan = [
+            {"table": "orders", "type": "ALL", "rows": 50000, "Extra": "Using temporary; Using filesort"},
+            {"table": "users", "type": "ALL", "rows": 10, "Extra": None},
+            {"table": "items", "type": "ref", "rows": 3000, "Extra": "Using index"},
+        ]
+        issues = guard.analyze(plan)
+        self.assertEqual(len(issues), 3)
+        self.assertIn("full table scan on orders (50000 rows)", issues)
+
+    def test_conn_query_explain_once(self):
+        """测试 Conn 查询触发 EXPLAIN：同一指纹只在旁路连接上 EXPLAIN 一次并调用 hook"""
+        hook = Mock()
+        guard = PlanGuard(sample_rate=1, row_threshold=100, hook=hook)
+        plan = [{"table": "users", "type": "ALL", "rows": 5000, "Extra": ""}]
+
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.side_effect = [[{"id": 1}], plan, [{"id": 2}]]
+        self.mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        conn = Conn(self.pool_name, plan_guard=guard)
+        conn.query("SELECT * FROM users WHERE name = ?", ("a",))
+        conn.query("SELECT * FROM users WHERE name = ?", ("b",))
+
+        explains = [c for c in mock_cursor.execute.call_args_list if c[0][0].startswith("EXPLAIN")]
+        self.assertEqual(len(explains), 1)
+        self.assertEqual(explains[0][0], ("EXPLAIN SELECT * FROM users WHERE name = %s", ("a",)))
+        hook.assert_called_once()
+        self.assertEqual(guard.get_plan("SELECT * FROM users WHERE name = ?")[0], plan)
+
+    def test_skip_without_idle_connection(self):
+        """测试没有空闲连接：不等待连接，直接跳过 EXPLAIN，下次再试"""
+        guard = PlanGuard(sample_rate=1)
+        conn = Conn(self.pool_name, plan_guard=guard)
+        self.mock_pool.get_connection.side_effect = GetConnectionFromPoolError("empty")
+
+        guard.observe(self.mock_pool, "SELECT * FROM users", ())
+        self.assertIsNone(guard.get_plan("SELECT * FROM users"))
+        self.mock_pool.get_connection.assert_called_with(timeout=0, retry_num=0)
+        conn.close()
+
+    def test_hook_error(self):
+        """测试 hook 或 EXPLAIN 出错：只记录日志，不影响已成功的查询"""
+        guard = PlanGuard(sample_rate=1, row_threshold=100, hook=Mock(side_effect=RuntimeError("alert failed")))
+        plan = [{"table": "users", "type": "ALL", "rows": 5000, "Extra": ""}]
+
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.side_effect = [[{"id": 1}], plan]
+        self.mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+        conn = Conn(self.pool_name, plan_guard=guard)
+        with self.assertLogs("pyanalysis.mysql", level="ERROR") as logs:
+            self.assertEqual(conn.query("SELECT * FROM users WHERE name = ?", ("a",)), [{"id": 1}])
+        self.assertIn("alert failed", "\n".join(logs.output))
+
+        mock_cursor.execute.side_effect = [None, pymysql.err.OperationalError(1146, "no such table")]
+        mock_cursor.fetchall.side_effect = [[{"id": 2}]]
+        with self.assertLogs("pyanalysis.mysql", level="ERROR"):
+            self.assertEqual(conn.query("SELECT * FROM orders"), [{"id": 2}])
+        conn.close()
+
+
 if __name__ == "__main__":
     unittest.main()
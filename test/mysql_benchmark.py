@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""Benchmark the pyanalysis.mysql module.
+
+Covers:
+    - Pool checkout/checkin throughput at 1-64 threads
+    - Conn.query / Conn.query_one latency
+    - Conn.query_range rows/sec at several batch sizes
+    - Conn.insert throughput
+    - Conn._encode_input cost per row
+
+It runs against a local MySQL when one is reachable with the MYSQL_* environment
+variables (the same as test/mysql_integration.py), otherwise against the in-process
+fake server of test/fake_mysql.py. Use --fake to force the fake server.
+
+Usage:
+    python test/mysql_benchmark.py --output before.json
+    python test/mysql_benchmark.py --output after.json --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import decimal
+import threading
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymysql  # noqa: E402
+
+from pyanalysis.mysql import Pool, Conn, add_pool  # noqa: E402
+from test.fake_mysql import FakeMySQLServer  # noqa: E402
+
+POOL_NAME = "benchmark"
+TABLE = "bench_rows"
+THREADS = (1, 2, 4, 8, 16, 32, 64)
+RANGE_SIZES = (10, 100, 1000, 10000)
+
+
+def get_mysql_config():
+    return {
+        "host": os.environ.get("MYSQL_HOST", "localhost"),
+        "port": int(os.environ.get("MYSQL_PORT", "3306")),
+        "user": os.environ.get("MYSQL_USER", "root"),
+        "password": os.environ.get("MYSQL_PASSWORD", ""),
+        "database": os.environ.get("MYSQL_DATABASE", "test_pyanalysis"),
+        "charset": "utf8mb4",
+    }
+
+
+def setup_mysql(config, rows):
+    """create the benchmark table with rows rows, return False if MySQL is not reachable. """
+    try:
+        conn = pymysql.connect(**config)
+    except Exception:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS {} ("
+                "id BIGINT AUTO_INCREMENT PRIMARY KEY, name VARCHAR(64), "
+                "price DECIMAL(10, 2), created_at DATETIME)".format(TABLE)
+            )
+            cursor.execute("TRUNCATE TABLE {}".format(TABLE))
+            start = datetime.datetime(2024, 1, 1)
+            batch = []
+            for i in range(rows):
+                batch.append(("name-{}".format(i + 1), "{}.{:02d}".format(i % 1000, i % 100),
+                              start + datetime.timedelta(seconds=i)))
+                if len(batch) == 5000 or i == rows - 1:
+                    cursor.executemany(
+                        "INSERT INTO {} (name, price, created_at) VALUES (%s, %s, %s)".format(TABLE), batch)
+                    batch = []
+        conn.commit()
+    finally:
+        conn.close()
+    return True
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def latency_stats(samples):
+    """latency statistics in microseconds. """
+    return {
+        "us_mean": round(sum(samples) / len(samples) * 1e6, 1),
+        "us_p50": round(percentile(samples, 0.50) * 1e6, 1),
+        "us_p95": round(percentile(samples, 0.95) * 1e6, 1),
+        "us_p99": round(percentile(samples, 0.99) * 1e6, 1),
+    }
+
+
+def bench_pool_checkout(pool, iterations):
+    result = {}
+    for threads in THREADS:
+        per_thread = max(1, iterations // threads)
+        barrier = threading.Barrier(threads + 1)
+
+        def worker():
+            barrier.wait()
+            for _ in range(per_thread):
+                pool.put_connection(pool.get_connection(timeout=5))
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for t in workers:
+            t.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+        result["threads_{}".format(threads)] = {"ops_per_sec": round(per_thread * threads / elapsed)}
+    return result
+
+
+def bench_query_latency(iterations):
+    result = {}
+    for name, method, sql in (
+            ("query_one", "query_one", "SELECT id, name, price, created_at FROM {} LIMIT 1"),
+            ("query_10_rows", "query", "SELECT id, name, price, created_at FROM {} LIMIT 10"),
+            ("query_100_rows", "query", "SELECT id, name, price, created_at FROM {} LIMIT 100"),
+    ):
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            conn = Conn(POOL_NAME)
+            getattr(conn, method)(sql.format(TABLE))
+            conn.close()
+            samples.append(time.perf_counter() - start)
+        result[name] = latency_stats(samples)
+    return result
+
+
+def bench_query_range(rows):
+    result = {}
+    sql = "SELECT id, name, price, created_at FROM {} LIMIT {}".format(TABLE, rows)
+    for size in RANGE_SIZES:
+        conn = Conn(POOL_NAME)
+        start = time.perf_counter()
+        count = sum(1 for _ in conn.query_range(sql, size=size))
+        elapsed = time.perf_counter() - start
+        conn.close()
+        result["size_{}".format(size)] = {"rows_per_sec": round(count / elapsed)}
+    return result
+
+
+def bench_insert(iterations):
+    sql = "INSERT INTO {} (name, price, created_at) VALUES (?, ?, ?)".format(TABLE)
+    args = ("bench", decimal.Decimal("1.23"), "2024-01-01 00:00:00")
+    samples = []
+    conn = Conn(POOL_NAME)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        begin = time.perf_counter()
+        conn.insert(sql, args)
+        samples.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    result = {"ops_per_sec": round(iterations / elapsed)}
+    result.update(latency_stats(samples))
+    return result
+
+
+def bench_encode_input(rows):
+    template = {
+        "id": 1,
+        "name": "name-1",
+        "price": decimal.Decimal("12.34"),
+        "created_at": datetime.datetime(2024, 1, 1, 12, 30, 45),
+    }
+    data = [dict(template) for _ in range(rows)]
+    encode = Conn._encode_input
+    start = time.perf_counter()
+    for row in data:
+        encode(row)
+    elapsed = time.perf_counter() - start
+    return {"ns_per_row": round(elapsed / rows * 1e9, 1)}
+
+
+def run(args):
+    config = get_mysql_config()
+    server = None
+    if args.fake or not setup_mysql(config, args.rows):
+        server = FakeMySQLServer(rows=args.rows, record=False).start()
+        config.update(host=server.host, port=server.port, user="root", password="")
+    backend = "fake" if server else "mysql"
+    print("benchmark against {} server {}:{}".format(backend, config["host"], config["port"]), file=sys.stderr)
+
+    try:
+        pool = Pool(size=args.pool_size, name=POOL_NAME, **config)
+        add_pool(pool)
+        results = {
+            "pool_checkout": bench_pool_checkout(pool, args.iterations * 10),
+            "query_latency": bench_query_latency(args.iterations),
+            "query_range": bench_query_range(args.rows),
+            "insert": bench_insert(args.iterations),
+            "encode_input": bench_encode_input(args.rows),
+        }
+    finally:
+        if server:
+            server.stop()
+
+    return {
+        "meta": {
+            "backend": backend,
+            "time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "pymysql": pymysql.VERSION_STRING,
+            "platform": platform.platform(),
+            "pool_size": args.pool_size,
+            "iterations": args.iterations,
+            "rows": args.rows,
+        },
+        "results": results,
+    }
+
+
+def flatten(results, prefix=""):
+    items = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            items.update(flatten(value, prefix + key + "."))
+        else:
+            items[prefix + key] = value
+    return items
+
+
+def compare(old, new, threshold):
+    """print the change of every metric, the regressions beyond threshold are marked. """
+    old_items = flatten(old["results"])
+    new_items = flatten(new["results"])
+    width = max(len(key) for key in new_items)
+    for key, value in new_items.items():
+        if key not in old_items or not old_items[key]:
+            print("{:<{}}  {:>12}".format(key, width, value))
+            continue
+        change = (value - old_items[key]) / old_items[key]
+        # throughput is better higher, latency and cost are better lower.
+        worse = change < -threshold if key.endswith("_per_sec") else change > threshold
+        print("{:<{}}  {:>12} -> {:>12}  {:+7.1%}{}".format(
+            key, width, old_items[key], value, change, "  REGRESSION" if worse else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the pyanalysis.mysql module")
+    parser.add_argument("--fake", action="store_true", help="always use the in-process fake server")
+    parser.add_argument("--iterations", type=int, default=2000, help="iterations of the latency benchmarks")
+    parser.add_argument("--rows", type=int, default=100000, help="rows of the query_range benchmark")
+    parser.add_argument("--pool-size", type=int, default=10, help="size of the pool")
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    parser.add_argument("--compare", help="a JSON file of earlier results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="change marked as regression")
+    args = parser.parse_args()
+
+    result = run(args)
+    text = json.dumps(result, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
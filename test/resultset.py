@@ -0,0 +1,104 @@
+import unittest
+import datetime
+import decimal
+
+from array import array
+
+from pyanalysis.resultset import ResultSet
+from pyanalysis.mail_templates import TableTemplate
+
+
+class TestResultSet(unittest.TestCase):
+    def setUp(self):
+        self.rs = ResultSet.from_rows(
+            ["city", "product", "amount", "price"],
+            [
+                ("NYC", "A", 10, decimal.Decimal("1.50")),
+                ("LA", "B", 5, decimal.Decimal("2.00")),
+                ("NYC", "B", 7, decimal.Decimal("2.00")),
+                ("SF", "A", 1, None),
+                ("LA", "A", 3, decimal.Decimal("1.50")),
+            ],
+        )
+
+    def test_columns_storage(self):
+        self.assertEqual(self.rs.columns, ["city", "product", "amount", "price"])
+        self.assertEqual(len(self.rs), 5)
+        self.assertIsInstance(self.rs["amount"], array)
+        self.assertEqual(self.rs["amount"].typecode, "q")
+        # Decimal is converted to float like Conn.query, None keeps the column a list
+        self.assertEqual(self.rs["price"], [1.5, 2.0, 2.0, None, 1.5])
+
+    def test_encode_datetime(self):
+        rs = ResultSet.from_rows(["created_at"], [(datetime.datetime(2023, 1, 1, 12, 30, 45),)])
+        self.assertEqual(rs["created_at"], ["2023-01-01 12:30:45"])
+
+    def test_from_dicts(self):
+        rs = ResultSet.from_dicts([{"id": 1, "name": "a"}, {"id": 2, "name": "b"}])
+        self.assertEqual(rs.to_dicts(), [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}])
+        self.assertEqual(len(ResultSet.from_dicts([])), 0)
+
+    def test_filter_sort_top(self):
+        nyc = self.rs.filter("city", lambda city: city == "NYC")
+        self.assertEqual(list(nyc["amount"]), [10, 7])
+
+        ordered = self.rs.sort("amount")
+        self.assertEqual(list(ordered["amount"]), [1, 3, 5, 7, 10])
+        self.assertIsInstance(ordered["amount"], array)
+
+        top = self.rs.top("amount", 2)
+        self.assertEqual(list(top["city"]), ["NYC", "NYC"])
+        self.assertEqual(list(self.rs.top("amount", 1, smallest=True)["city"]), ["SF"])
+
+    def test_sort_top_null(self):
+        # price has a None(SQL NULL), it sorts last in both orders
+        self.assertEqual(self.rs.sort("price")["price"], [1.5, 1.5, 2.0, 2.0, None])
+        self.assertEqual(list(self.rs.sort("price")["amount"]), [10, 3, 5, 7, 1])
+        self.assertEqual(self.rs.sort("price", reverse=True)["price"], [2.0, 2.0, 1.5, 1.5, None])
+
+        self.assertEqual(list(self.rs.top("price", 2)["price"]), [2.0, 2.0])
+        self.assertEqual(list(self.rs.top("price", 2, smallest=True)["price"]), [1.5, 1.5])
+        self.assertEqual(self.rs.top("price", 10, smallest=True)["price"], [1.5, 1.5, 2.0, 2.0, None])
+
+        rs = ResultSet.from_rows(["name"], [(None,), ("b",), (None,), ("a",)])
+        self.assertEqual(rs.sort("name")["name"], ["a", "b", None, None])
+        self.assertEqual(rs.top("name", 3)["name"], ["b", "a", None])
+
+    def test_group_by(self):
+        counts = self.rs.group_by("city").count()
+        self.assertEqual(list(counts.rows()), [("NYC", 2), ("LA", 2), ("SF", 1)])
+
+        sums = self.rs.group_by("city").sum("amount")
+        self.assertEqual(list(sums.rows()), [("NYC", 17), ("LA", 8), ("SF", 1)])
+
+        means = self.rs.group_by("product").mean("price")
+        self.assertEqual(list(means.rows()), [("A", 1.5), ("B", 2.0)])
+
+        multi = self.rs.group_by("city", "product").sum("amount")
+        self.assertEqual(multi.columns, ["city", "product", "amount"])
+        self.assertEqual(len(multi), 5)
+
+    def test_to_table(self):
+        template = self.rs.select("city", "price").to_table("Report", show_row_numbers=True)
+        self.assertIsInstance(template, TableTemplate)
+        self.assertEqual(self.rs.to_table_rows(["city", "price"])[3], ["SF", ""])
+        self.assertIn("Report", template.render())
+
+    def test_to_pandas(self):
+        try:
+            import pandas  # noqa: F401
+        except ImportError:
+            with self.assertRaises(ImportError):
+                self.rs.to_pandas()
+            return
+        df = self.rs.to_pandas()
+        self.assertEqual(list(df.columns), self.rs.columns)
+        self.assertEqual(int(df["amount"].sum()), 26)
+
+    def test_invalid_columns(self):
+        with self.assertRaises(RuntimeError):
+            ResultSet(["a", "b"], [[1]])
+        with self.assertRaises(RuntimeError):
+            ResultSet(["a", "b"], [[1], [1, 2]])
+        with self.assertRaises(KeyError):
+            self.rs.column("unknown")
@@ -196,6 +196,66 @@ class TestTableTemplate(unittest.TestCase):
         # Highlight color should be present
         self.assertIn("#fffbe6", html)
 
+    def test_max_inline_rows(self):
+        """Test to_parts leaves the rows beyond max_inline_rows out with a note."""
+        template = TableTemplate(
+            title="Report",
+            headers=["Name"],
+            rows=[["Alice"], ["Bob"], ["Charlie"]],
+            max_inline_rows=2,
+            locale="en",
+        )
+        html = template.to_parts()[0].get_payload(decode=True).decode("utf-8")
+
+        self.assertIn("Bob", html)
+        self.assertNotIn("Charlie", html)
+        self.assertIn("Showing the first 2 of 3 rows", html)
+        self.assertIn("Report.csv.gz", html)
+
+    def test_max_inline_bytes(self):
+        """Test max_inline_bytes counts the UTF-8 size of the cells."""
+        template = TableTemplate(
+            title="报表",
+            headers=["Name"],
+            rows=[["张三"], ["李四"], ["王五"]],
+            max_inline_bytes=12,
+            compression="zip",
+        )
+        html = template.to_parts()[0].get_payload(decode=True).decode("utf-8")
+
+        self.assertIn("李四", html)
+        self.assertNotIn("王五", html)
+        self.assertIn("仅显示前 2 行，共 3 行，完整数据见附件 报表.csv.zip", html)
+
+    def test_to_parts(self):
+        """Test to_parts attaches the rows only when some are left out."""
+        template = TableTemplate(title="Report", headers=["Name"], rows=[["Alice"], ["Bob"]])
+        parts = template.to_parts()
+        self.assertEqual(len(parts), 1)
+        self.assertIsInstance(parts[0], HtmlContent)
+
+        parts = template.to_parts(max_inline_rows=1)
+        self.assertEqual(len(parts), 2)
+        self.assertEqual(parts[1].get_filename(), "Report.csv.gz")
+        self.assertNotIn("Bob", parts[0].get_payload(decode=True).decode("utf-8"))
+        # the limits of the template win over the defaults of the mail.
+        template = TableTemplate(title="Report", headers=["Name"], rows=[["Alice"], ["Bob"]], max_inline_rows=5)
+        self.assertEqual(len(template.to_parts(max_inline_rows=1)), 1)
+
+    def test_render_all_rows(self):
+        """Test render and to_html show all the rows, they attach nothing."""
+        template = TableTemplate(title="Report", headers=["Name"], rows=[["Alice"], ["Bob"]], max_inline_rows=1,
+                                 locale="en")
+        for html in (template.render(), template.to_html().get_payload(decode=True).decode("utf-8")):
+            self.assertIn("Bob", html)
+            self.assertNotIn("Showing the first", html)
+        self.assertEqual(len(template.to_parts()), 2)
+
+    def test_invalid_compression(self):
+        """Test an unknown compression fails when the template is created."""
+        with self.assertRaises(RuntimeError):
+            TableTemplate(title="Report", headers=["Name"], rows=[], compression="bz2")
+
 
 class TestAlertTemplate(unittest.TestCase):
     """Test cases for AlertTemplate."""